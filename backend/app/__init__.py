@@ -7,6 +7,10 @@ def create_app():
     CORS(app)
     init_db(app)
 
+    if app.config["METRICS_ENABLED"]:
+        from app.services.metrics import init_metrics
+        init_metrics(app)
+
     from app.routes.ar_routes import ar_bp
     from app.routes.ocr_routes import ocr_bp
     from app.routes.user_routes import user_bp
@@ -17,4 +21,21 @@ def create_app():
     app.register_blueprint(user_bp, url_prefix="/user")
     app.register_blueprint(general_bp, url_prefix="/general")
 
-    return app
\ No newline at end of file
+    # under gunicorn with preload_app these are started per worker in post_fork,
+    # since threads do not survive the fork
+    if app.config["START_BACKGROUND_THREADS"]:
+        start_background_threads(app)
+
+    return app
+
+def start_background_threads(app):
+    from app.services.rescoring import start_rescore_scheduler
+    start_rescore_scheduler(app)
+
+    if app.config["VOTE_WRITE_BEHIND"]:
+        from app.services.vote_buffer import vote_buffer
+        vote_buffer.start(app)
+
+    # WARM_UP preloads the SDKs the services otherwise import on first use
+    from app.services.warmup import start_warm_up
+    start_warm_up()
\ No newline at end of file
@@ -1,10 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
 from sqlalchemy import text
 from config.config import Config
 from flask import Flask
 
 db = SQLAlchemy()
+migrate = Migrate()
 
 def init_db(app):
     app.config.from_object(Config)
     db.init_app(app)
+    migrate.init_app(app, db)
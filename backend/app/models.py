@@ -7,6 +7,11 @@ class Restaurant(db.Model):
     restaurant_id = db.Column(db.String, primary_key=True)
     name = db.Column(db.String, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # last scanned menu: bumped on every ingestion, dishes of older versions
+    # are kept (they may carry AR models) but no longer listed
+    menu_version = db.Column(db.Integer, default=0)
+    menu_digest = db.Column(db.String)
+    menu_updated_at = db.Column(db.DateTime)
 
     dishes = db.relationship('DishItem', backref='restaurant', lazy=True)
 
@@ -23,9 +28,31 @@ class DishItem(db.Model):
     restaurant_id = db.Column(db.String, db.ForeignKey("restaurants.restaurant_id"), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # set on dishes that came from a scanned menu: normalized name, category,
+    # position on the menu, the restaurant menu_version it was last seen in
+    # and the full validated MenuItem
+    menu_key = db.Column(db.String)
+    menu_category = db.Column(db.String)
+    menu_position = db.Column(db.Integer)
+    menu_version = db.Column(db.Integer)
+    menu_item = db.Column(db.JSON)
 
     ar_models = db.relationship("ARModel", backref="dish", lazy=True, foreign_keys="[ARModel.dish_id]")
 
+    __table_args__ = (
+        # restaurant -> dishes lookups for the model listings
+        db.Index("ix_dish_items_restaurant_id_dish_id", "restaurant_id", "dish_id"),
+        # conflict target of the menu upsert; dishes added by hand have no key
+        db.Index(
+            "uq_dish_items_restaurant_menu_key",
+            "restaurant_id",
+            "menu_key",
+            unique=True,
+            postgresql_where=db.text("menu_key IS NOT NULL"),
+            sqlite_where=db.text("menu_key IS NOT NULL"),
+        ),
+    )
+
 class ARModel(db.Model):
     __tablename__ = "ar_models"
     
@@ -39,6 +66,12 @@ class ARModel(db.Model):
 
     reports = db.relationship("ModelReport", backref="model", lazy=True)
 
+    # per-dish lookup for the ranked listing: the restaurant's dishes are
+    # joined to their models through the dish_id prefix (an index-only scan)
+    # and the page is then picked by a top-N sort. It cannot hand out rows in
+    # restaurant-wide rating order, since those span many dish_ids
+    __table_args__ = (db.Index("ix_ar_models_dish_id_rating", "dish_id", "model_rating", "model_id"),)
+
 class ModelReport(db.Model):
     __tablename__ = "model_reports"
     
@@ -88,3 +121,22 @@ class Key(db.Model):
 
     name = db.Column(db.String, primary_key=True)
     value = db.Column(db.String, nullable=False)
+
+class MenuJob(db.Model):
+    __tablename__ = "menu_jobs"
+
+    # state of a background menu extraction, shared by all gunicorn workers;
+    # heartbeat_at is refreshed by the process running the job so a job lost
+    # with its worker can be told apart from a slow one
+    job_id = db.Column(db.String, primary_key=True)
+    status = db.Column(db.String, nullable=False, default="queued")
+    partial = db.Column(db.JSON)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    status_code = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    heartbeat_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    # expired jobs are deleted by their last update
+    __table_args__ = (db.Index("ix_menu_jobs_heartbeat_at", "heartbeat_at"),)
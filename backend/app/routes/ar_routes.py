@@ -1,9 +1,21 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, make_response, request, stream_with_context
 from app.models import Restaurant, DishItem, ARModel, ModelRating
 from app.database import db
+from app.services.dish_index import dish_index, match_menu
+from app.services.image_search import dish_image_cache, dish_names_from_menu, resolve_images
+from app.services.recommendations import menu_store
+from app.services.ranking import hot
+from app.services.rescoring import rescore_all_models, rescore_status
+from app.services.sse import SSE_HEADERS, sse_event
+from app.services.vote_buffer import vote_buffer
+from app.services.votes import VOTE_MESSAGES, VoteTargetNotFound, apply_vote, buffer_vote, current_vote, vote_states
+from config.config import Config
 from datetime import datetime
+from sqlalchemy import and_, func, not_, or_
+import base64
+import hashlib
+import json
 from math import log
-from duckduckgo_search import DDGS
 
 ar_bp = Blueprint("ar", __name__)
 
@@ -11,69 +23,340 @@ ar_bp = Blueprint("ar", __name__)
 def ar_home():
     return jsonify({"message": "AR API Home"})
 
-def fetch_duckduckgo_image(query):
-    with DDGS() as ddgs:
-        results = ddgs.images(query, max_results=1)
-        if results:
-            return results[0]['image']
-    return None
-
 @ar_bp.route("/get_image", methods=["GET"])
 def get_image():
     dish_name = request.args.get("dish_name")
     if not dish_name:
         return jsonify({"error": "Dish name is required"}), 400
 
-    image_url = fetch_duckduckgo_image(dish_name)
+    try:
+        image_url = dish_image_cache.lookup(dish_name)
+    except Exception as e:
+        print(f"Image search error: {e}")
+        return jsonify({"error": "Image search failed"}), 502
+
     if image_url:
         return jsonify({"dish_name": dish_name, "image_url": image_url})
     else:
         return jsonify({"error": "Image not found"}), 404
 
+# the "menu" of a request body, or the menu stored under its "menu_digest",
+# as (menu, None); (None, error response) when it is missing or is not a
+# {category: [items]} object
+def menu_from_body(data):
+    if "menu" in data:
+        menu = data["menu"]
+    else:
+        digest = data.get("menu_digest")
+        if not isinstance(digest, str):
+            return None, (jsonify({"error": "menu_digest must be a string"}), 400)
+        menu = menu_store.get(digest)
+        if menu is None:
+            return None, (jsonify({"error": "Menu not found, send the menu itself"}), 404)
+
+    if not isinstance(menu, dict) or not all(isinstance(items, list) for items in menu.values()):
+        return None, (jsonify({"error": "menu must map each category to a list of items"}), 400)
+    return menu, None
+
+# images for a whole menu at once: "dish_names", or the "menu" / "menu_digest"
+# from extract_menu. Results are pushed over SSE as each lookup finishes;
+# ?stream=0 waits for all of them and returns one JSON object instead.
+@ar_bp.route("/images", methods=["POST"])
+def get_images():
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+
+    if "dish_names" in data:
+        dish_names = data["dish_names"]
+        if not isinstance(dish_names, list) or not all(isinstance(name, str) for name in dish_names):
+            return jsonify({"error": "dish_names must be a list of strings"}), 400
+    elif "menu" in data or "menu_digest" in data:
+        menu, error = menu_from_body(data)
+        if error:
+            return error
+        dish_names = dish_names_from_menu(menu)
+    else:
+        return jsonify({"error": "dish_names, menu or menu_digest is required"}), 400
+
+    if len(dish_names) > Config.DISH_IMAGE_BATCH_MAX:
+        return jsonify({"error": f"At most {Config.DISH_IMAGE_BATCH_MAX} dishes per request"}), 400
+
+    if request.args.get("stream", "1") == "0":
+        images = {}
+        statuses = {}
+        for dish_name, image_url, status in resolve_images(dish_names):
+            images[dish_name] = image_url
+            statuses.setdefault(status, []).append(dish_name)
+        return jsonify({
+            "images": images,
+            "not_found": statuses.get("not_found", []),
+            "timed_out": statuses.get("timeout", []),
+            "failed": statuses.get("error", []),
+        })
+
+    def generate():
+        counts = {}
+        for dish_name, image_url, status in resolve_images(dish_names):
+            counts[status] = counts.get(status, 0) + 1
+            yield sse_event("image", {"dish_name": dish_name, "image_url": image_url, "status": status})
+        yield sse_event("done", {"success": True, "counts": counts})
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+# dish image cache hit ratio and upstream search metrics
+@ar_bp.route("/image-cache-stats", methods=["GET"])
+def image_cache_stats():
+    return jsonify(dish_image_cache.stats())
+
+# cheap fingerprint of everything the model listing shows: the restaurant row,
+# the latest dish edit and model upload, and the vote counters
+def restaurant_models_version(restaurant_id):
+    return (
+        db.session.query(
+            Restaurant.restaurant_id,
+            Restaurant.name,
+            Restaurant.created_at,
+            func.max(DishItem.updated_at),
+            func.max(ARModel.uploaded_at),
+            func.count(ARModel.model_id),
+            func.sum(ARModel.up_votes),
+            func.sum(ARModel.down_votes),
+            func.sum(ARModel.model_rating),
+        )
+        .outerjoin(DishItem, DishItem.restaurant_id == Restaurant.restaurant_id)
+        .outerjoin(ARModel, ARModel.dish_id == DishItem.dish_id)
+        .filter(Restaurant.restaurant_id == restaurant_id)
+        .group_by(Restaurant.restaurant_id, Restaurant.name, Restaurant.created_at)
+        .first()
+    )
+
 # get all models for a restaurant
 @ar_bp.route("/restaurant/<string:restaurant_id>/models", methods=["GET"])
 def ar_models(restaurant_id):
     try:
-        restaurant = Restaurant.query.get(restaurant_id)
+        version = restaurant_models_version(restaurant_id)
 
-        if restaurant is None:
+        if version is None:
             return jsonify({"message": "Restaurant was not found"}), 404
 
-        all_models = []
-        for dish in restaurant.dishes:
-            for model in dish.ar_models:
-                all_models.append(
-                    {
-                        "dish_id": model.dish_id,
-                        "dish_name": dish.dish_name,
-                        "description": dish.description,
-                        "ingredients": dish.ingredients,
-                        "price": dish.price,
-                        "nutritional_info": dish.nutritional_info,
-                        "allergens": dish.allergens,
-                        "model_id": model.model_id,
-                        "model_rating": model.model_rating,
-                        "up_votes": model.up_votes,
-                        "down_votes": model.down_votes,
-                        "uploaded_at": model.uploaded_at.isoformat()
-                        if model.uploaded_at
-                        else None,
-                    }
-                )
+        # ?user_id= embeds that user's vote on every model
+        user_id = request.args.get("user_id", type=int)
+        fingerprint = tuple(version)
+        if user_id is not None:
+            fingerprint += (user_id, sorted(vote_buffer.pending_votes_for_user(user_id).items()))
+
+        etag = hashlib.sha1(repr(fingerprint).encode("utf-8")).hexdigest()
+        if request.if_none_match.contains(etag):
+            not_modified = make_response("", 304)
+            not_modified.set_etag(etag)
+            return not_modified
+
+        # one joined query projecting only the listed columns
+        query = (
+            db.session.query(
+                DishItem.dish_id,
+                DishItem.dish_name,
+                DishItem.description,
+                DishItem.ingredients,
+                DishItem.price,
+                DishItem.nutritional_info,
+                DishItem.allergens,
+                ARModel.model_id,
+                ARModel.model_rating,
+                ARModel.up_votes,
+                ARModel.down_votes,
+                ARModel.uploaded_at,
+            )
+            .join(ARModel, ARModel.dish_id == DishItem.dish_id)
+            .filter(DishItem.restaurant_id == restaurant_id)
+            .order_by(DishItem.dish_id, ARModel.uploaded_at)
+        )
+        if user_id is not None:
+            query = query.outerjoin(
+                ModelRating, and_(ModelRating.model_id == ARModel.model_id, ModelRating.user_id == user_id)
+            ).add_columns(ModelRating.review)
+        rows = query.all()
 
-        return jsonify(
+        all_models = [
             {
-                "restaurant_id": restaurant.restaurant_id,
-                "name": restaurant.name,
-                "created_at": restaurant.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+                "dish_id": row.dish_id,
+                "dish_name": row.dish_name,
+                "description": row.description,
+                "ingredients": row.ingredients,
+                "price": row.price,
+                "nutritional_info": row.nutritional_info,
+                "allergens": row.allergens,
+                "model_id": row.model_id,
+                "model_rating": row.model_rating,
+                "up_votes": row.up_votes,
+                "down_votes": row.down_votes,
+                "uploaded_at": row.uploaded_at.isoformat()
+                if row.uploaded_at
+                else None,
+            }
+            for row in rows
+        ]
+        if user_id is not None:
+            pending = vote_buffer.pending_votes_for_user(user_id)
+            for model, row in zip(all_models, rows):
+                model["user_vote"] = pending.get(row.model_id, row.review)
+
+        response = jsonify(
+            {
+                "restaurant_id": version.restaurant_id,
+                "name": version.name,
+                "created_at": version.created_at.strftime("%Y-%m-%d %H:%M:%S"),
                 "models": all_models,
             }
         )
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
 
     except Exception as e:
         return jsonify({"message": "Error fetching restaurant or models", "error": str(e)}), 500
 
 
+def encode_cursor(model_rating, model_id):
+    return base64.urlsafe_b64encode(json.dumps([model_rating, model_id]).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    model_rating, model_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    return model_rating, model_id
+
+# ranked, keyset-paginated model listing for a restaurant
+@ar_bp.route("/restaurant/<string:restaurant_id>/models/ranked", methods=["GET"])
+def ranked_models(restaurant_id):
+    try:
+        limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+        best_per_dish = request.args.get("best_per_dish", "0") == "1"
+        excluded_allergens = [
+            term.strip().lower()
+            for term in request.args.get("exclude_allergens", "").split(",")
+            if term.strip()
+        ]
+
+        try:
+            cursor = request.args.get("cursor")
+            after = decode_cursor(cursor) if cursor else None
+        except (ValueError, TypeError):
+            return jsonify({"message": "Invalid cursor"}), 400
+
+        if db.session.get(Restaurant, restaurant_id) is None:
+            return jsonify({"message": "Restaurant was not found"}), 404
+
+        query = (
+            db.session.query(
+                DishItem.dish_id,
+                DishItem.dish_name,
+                DishItem.description,
+                DishItem.price,
+                DishItem.allergens,
+                ARModel.model_id,
+                ARModel.model_rating,
+                ARModel.up_votes,
+                ARModel.down_votes,
+                ARModel.uploaded_at,
+            )
+            .join(ARModel, ARModel.dish_id == DishItem.dish_id)
+            .filter(DishItem.restaurant_id == restaurant_id)
+        )
+        for term in excluded_allergens:
+            query = query.filter(or_(
+                DishItem.allergens.is_(None),
+                not_(func.lower(DishItem.allergens).contains(term, autoescape=True)),
+            ))
+
+        if best_per_dish:
+            dish_rank = func.row_number().over(
+                partition_by=ARModel.dish_id,
+                order_by=(ARModel.model_rating.desc(), ARModel.model_id.desc()),
+            ).label("dish_rank")
+            ranked = query.add_columns(dish_rank).subquery()
+            query = db.session.query(*[column for column in ranked.c if column.name != "dish_rank"]).filter(ranked.c.dish_rank == 1)
+            rating_column, id_column = ranked.c.model_rating, ranked.c.model_id
+        else:
+            rating_column, id_column = ARModel.model_rating, ARModel.model_id
+
+        # (model_rating, model_id) both descending, so the cursor is a single row
+        # comparison; the restaurant's models come from an index-only nested loop
+        # over ix_ar_models_dish_id_rating and the page from a top-N heapsort
+        if after:
+            query = query.filter(or_(
+                rating_column < after[0],
+                and_(rating_column == after[0], id_column < after[1]),
+            ))
+        rows = query.order_by(rating_column.desc(), id_column.desc()).limit(limit + 1).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].model_rating, rows[-1].model_id)
+
+        return jsonify({
+            "restaurant_id": restaurant_id,
+            "models": [
+                {
+                    "dish_id": row.dish_id,
+                    "dish_name": row.dish_name,
+                    "description": row.description,
+                    "price": row.price,
+                    "allergens": row.allergens,
+                    "model_id": row.model_id,
+                    "model_rating": row.model_rating,
+                    "up_votes": row.up_votes,
+                    "down_votes": row.down_votes,
+                    "uploaded_at": row.uploaded_at.isoformat() if row.uploaded_at else None,
+                }
+                for row in rows
+            ],
+            "next_cursor": next_cursor,
+        })
+
+    except Exception as e:
+        return jsonify({"message": "Error fetching restaurant or models", "error": str(e)}), 500
+
+
+# best matching dish with an AR model, and its top-rated model, for every
+# item of an extracted menu ("menu" or "menu_digest" from extract_menu)
+@ar_bp.route("/restaurant/<string:restaurant_id>/menu-matches", methods=["POST"])
+def menu_matches(restaurant_id):
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    if "menu" not in data and "menu_digest" not in data:
+        return jsonify({"error": "menu or menu_digest is required"}), 400
+
+    try:
+        menu, error = menu_from_body(data)
+        if error:
+            return error
+
+        if len(dish_names_from_menu(menu)) > Config.DISH_MATCH_MAX_ITEMS:
+            return jsonify({"error": f"At most {Config.DISH_MATCH_MAX_ITEMS} dishes per request"}), 400
+
+        if db.session.get(Restaurant, restaurant_id) is None:
+            return jsonify({"message": "Restaurant was not found"}), 404
+
+        matches, lookup_seconds = match_menu(restaurant_id, menu)
+        return jsonify({
+            "restaurant_id": restaurant_id,
+            "matches": matches,
+            "matched": sum(1 for match in matches if match["model"]),
+            "lookup_ms": round(lookup_seconds * 1000, 2),
+        })
+
+    except Exception as e:
+        return jsonify({"message": "Error matching menu", "error": str(e)}), 500
+
+
+# dish name index sizes
+@ar_bp.route("/dish-index-stats", methods=["GET"])
+def dish_index_stats():
+    return jsonify(dish_index.stats())
+
+
 # update restaurant name
 @ar_bp.route("/restaurant/<string:restaurant_id>", methods=["PUT"])
 def update_restaurant(restaurant_id):
@@ -161,6 +444,7 @@ def add_dish_with_model():
         )
         db.session.add(new_model)
         db.session.commit()
+        dish_index.add_dish(restaurant_id, new_dish.dish_id, dish_name)
 
         return jsonify({
             "message": "Dish and model added",
@@ -195,6 +479,7 @@ def add_model_to_dish(dish_id):
         )
         db.session.add(new_model)
         db.session.commit()
+        dish_index.add_dish(dish.restaurant_id, dish.dish_id, dish.dish_name)
 
         return jsonify({"message": "Model added", "model_id": new_model.model_id}), 201
     except Exception as e:
@@ -221,121 +506,63 @@ def delete_model(model_id):
         return jsonify({"error": str(e)}), 500
 
 
-def hot(ups, downs, date):
-    # Calculate net score
-    net_score = ups - downs
-    
-    # Calculate time score (decreasing with age)
-    days_old = (datetime.now() - date).days + 1
-    time_score = 1000 / days_old  # Higher for newer items
-    
-    # Weighted average (90% votes, 10% time)
-    VOTE_WEIGHT = 0.9
-    TIME_WEIGHT = 0.1
-    
-    return (net_score * VOTE_WEIGHT * 100) + (time_score * TIME_WEIGHT)
+# progress of the background model rescoring job
+@ar_bp.route("/rescore/status", methods=["GET"])
+def rescore_job_status():
+    return jsonify(rescore_status)
 
+# flask --app run ar rescore
+@ar_bp.cli.command("rescore")
+def rescore_command():
+    if rescore_all_models():
+        print(f"Rescored models: {rescore_status}")
+    else:
+        print("Another process is already rescoring models")
 
-# upvote a model
-@ar_bp.route("/model/<string:model_id>/upvote/<int:user_id>", methods=["POST"])
-def upvote_model(model_id, user_id):
-    try:
-        # user_id is now passed directly from the URL
-        current_user_id = user_id
 
-        model = ARModel.query.get(model_id)
-        if not model:
-            return jsonify({"message": "Model not found"}), 404
+def vote_response(model_id, user_id, review):
+    try:
+        if Config.VOTE_WRITE_BEHIND:
+            result = buffer_vote(model_id, user_id, review)
+        else:
+            result = apply_vote(model_id, user_id, review)
+        message = VOTE_MESSAGES[review][result["outcome"]]
 
-        existing_rating = ModelRating.query.filter_by(model_id=model_id, user_id=current_user_id).first()
-
-        if existing_rating:
-            if existing_rating.review == "up":
-                return jsonify({"message": "You have already upvoted this model"}), 200
-            else: # Existing rating was 'down', change to 'up'
-                existing_rating.review = "up"
-                model.down_votes -= 1
-                model.up_votes += 1
-                db.session.add(existing_rating) # Add to session to mark for update
-                message = "Vote changed to upvote successfully"
-        else: # No existing rating, create a new one
-            new_rating = ModelRating(
-                model_id=model_id,
-                user_id=current_user_id,
-                review="up"
-            )
-            db.session.add(new_rating)
-            model.up_votes += 1
-            message = "Model upvoted successfully"
+        if result["outcome"] == "unchanged":
+            return jsonify({"message": message}), 200
 
-        # Recalculate rating and commit
-        model.model_rating = hot(model.up_votes, model.down_votes, model.uploaded_at)
-        db.session.commit()
+        if Config.VOTE_WRITE_BEHIND:
+            # accepted, counters are updated by the next flush
+            return jsonify({"message": message, "model_id": model_id, "pending": True}), 202
 
         return jsonify(
             {
                 "message": message,
-                "model_id": model.model_id,
-                "model_rating": model.model_rating,
-                "up_votes": model.up_votes,
-                "down_votes": model.down_votes,
+                "model_id": result["model_id"],
+                "model_rating": result["model_rating"],
+                "up_votes": result["up_votes"],
+                "down_votes": result["down_votes"],
             }
         ), 200
 
+    except VoteTargetNotFound as e:
+        return jsonify({"message": str(e)}), 404
+
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 
+# upvote a model
+@ar_bp.route("/model/<string:model_id>/upvote/<int:user_id>", methods=["POST"])
+def upvote_model(model_id, user_id):
+    return vote_response(model_id, user_id, "up")
+
+
 # downvote a model
 @ar_bp.route("/model/<string:model_id>/downvote/<int:user_id>", methods=["POST"])
 def downvote_model(model_id, user_id):
-    try:
-        # user_id is now passed directly from the URL
-        current_user_id = user_id
-
-        model = ARModel.query.get(model_id)
-        if not model:
-            return jsonify({"message": "Model not found"}), 404
-
-        existing_rating = ModelRating.query.filter_by(model_id=model_id, user_id=current_user_id).first()
-
-        if existing_rating:
-            if existing_rating.review == "down":
-                return jsonify({"message": "You have already downvoted this model"}), 200
-            else: # Existing rating was 'up', change to 'down'
-                existing_rating.review = "down"
-                model.up_votes -= 1
-                model.down_votes += 1
-                db.session.add(existing_rating) # Add to session to mark for update
-                message = "Vote changed to downvote successfully"
-        else: # No existing rating, create a new one
-            new_rating = ModelRating(
-                model_id=model_id,
-                user_id=current_user_id,
-                review="down"
-            )
-            db.session.add(new_rating)
-            model.down_votes += 1
-            message = "Model downvoted successfully"
-
-        # Recalculate rating and commit
-        model.model_rating = hot(model.up_votes, model.down_votes, model.uploaded_at)
-        db.session.commit()
-
-        return jsonify(
-            {
-                "message": message,
-                "model_id": model.model_id,
-                "model_rating": model.model_rating,
-                "up_votes": model.up_votes,
-                "down_votes": model.down_votes,
-            }
-        ), 200
-
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"error": str(e)}), 500
+    return vote_response(model_id, user_id, "down")
 
 # check if a user has upvoted or downvoted a model
 @ar_bp.route("/model/<string:model_id>/check-vote/<int:user_id>", methods=["GET"])
@@ -345,12 +572,57 @@ def check_vote(model_id, user_id):
         if not model:
             return jsonify({"message": "Model not found"}), 404
         
-        rating = ModelRating.query.filter_by(model_id=model_id, user_id=user_id).first()
-        if not rating:
+        review = current_vote(model_id, user_id)
+        if not review:
             return jsonify({"message": "No vote found"}), 200
         
-        return jsonify({"message": "Vote found", "review": rating.review}), 200
+        return jsonify({"message": "Vote found", "review": review}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
-    
\ No newline at end of file
+
+# vote state of one user on many models at once, by "model_ids" and/or
+# "restaurant_id" in the body; unknown model ids are listed under "not_found"
+@ar_bp.route("/votes/<int:user_id>", methods=["POST"])
+def bulk_check_votes(user_id):
+    try:
+        data = request.get_json(silent=True) or {}
+        model_ids = data.get("model_ids")
+        restaurant_id = data.get("restaurant_id")
+
+        if model_ids is None and restaurant_id is None:
+            return jsonify({"error": "model_ids or restaurant_id is required"}), 400
+        if model_ids is not None:
+            if not isinstance(model_ids, list) or not all(isinstance(model_id, str) for model_id in model_ids):
+                return jsonify({"error": "model_ids must be a list of model ids"}), 400
+            if len(model_ids) > Config.VOTE_STATE_MAX_IDS:
+                return jsonify({"error": f"At most {Config.VOTE_STATE_MAX_IDS} model ids per request"}), 400
+            model_ids = list(dict.fromkeys(model_ids))
+
+        states = vote_states(user_id, model_ids=model_ids, restaurant_id=restaurant_id)
+
+        response = {"user_id": user_id, "votes": states}
+        if model_ids is not None:
+            response["not_found"] = [model_id for model_id in model_ids if model_id not in states]
+        return jsonify(response), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+# vote state of one user on every model of a restaurant
+@ar_bp.route("/restaurant/<string:restaurant_id>/votes/<int:user_id>", methods=["GET"])
+def restaurant_votes(restaurant_id, user_id):
+    try:
+        if db.session.get(Restaurant, restaurant_id) is None:
+            return jsonify({"message": "Restaurant was not found"}), 404
+
+        states = vote_states(user_id, restaurant_id=restaurant_id)
+        return jsonify({"restaurant_id": restaurant_id, "user_id": user_id, "votes": states}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+# write-behind vote buffer metrics
+@ar_bp.route("/votes/buffer-stats", methods=["GET"])
+def vote_buffer_stats():
+    return jsonify(vote_buffer.stats())
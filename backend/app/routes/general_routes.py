@@ -1,7 +1,7 @@
 from flask import Blueprint, jsonify, request
-import requests
-import os
 from app.models import Key
+from app.services.places import PlacesError, places_cache, search_nearby
+from app.services.warmup import warm_up
 
 general_bp = Blueprint("general", __name__)
 
@@ -20,28 +20,27 @@ def get_nearby_restaurants(longitude=None, latitude=None):
     if not longitude or not latitude:
         return jsonify({"error": "Missing longitude or latitude parameters"}), 400
         
-    url = "https://places.googleapis.com/v1/places:searchNearby"
-    headers = {
-        'Content-Type': 'application/json',
-        'X-Goog-Api-Key': os.getenv("GOOGLE_MAPS_API_KEY"),
-        'X-Goog-FieldMask': 'places.id,places.displayName,places.formattedAddress,places.priceLevel,places.rating,places.currentOpeningHours,places.generativeSummary.description,places.generativeSummary.overview'
-    }
-    data = {
-        "includedTypes": ["restaurant"],
-        "maxResultCount": 20,
-        "locationRestriction": {
-            "circle": {
-                "center": {
-                    "latitude": float(latitude),
-                    "longitude": float(longitude)
-                },
-                "radius": 500
-            }
-        }
-    }
-    
-    response = requests.post(url, headers=headers, json=data)
-    return jsonify(response.json())
+    try:
+        body, cached = search_nearby(float(latitude), float(longitude))
+    except ValueError:
+        return jsonify({"error": "Invalid longitude or latitude parameters"}), 400
+    except PlacesError as e:
+        return jsonify({"error": str(e)}), e.status_code
+
+    response = jsonify(body)
+    response.headers["X-Cache"] = "HIT" if cached else "MISS"
+    return response
+
+# hit ratio of the nearby-restaurants tile cache
+@general_bp.route("/places-cache-stats", methods=["GET"])
+def places_cache_stats():
+    return jsonify(places_cache.stats())
+
+# for a startup probe or the client to call once the app is up, so the
+# first real menu scan does not pay for loading the SDKs
+@general_bp.route("/warm-up", methods=["POST"])
+def warm_up_sdks():
+    return jsonify({"loaded_ms": warm_up()})
 
 @general_bp.route("/keys", methods=["GET"])
 def get_aws_credentials():
@@ -1,47 +1,72 @@
-from flask import Blueprint, jsonify, request
-import google.generativeai as genai
-from PIL import Image
-import io
-import json
-import os
-from pydantic import BaseModel, Field, RootModel, ValidationError
-from typing import List, Optional, Dict, Union
+import hashlib
+from flask import Blueprint, Response, jsonify, make_response, request, stream_with_context
+from app.database import db
 from app.models import User
+from app.services.image_preprocess import ImagePreprocessError, preprocess_image
+from app.services.jobs import QueueFullError, menu_jobs
+from app.services.llm import stats as llm_stats
+from app.services.menu_cache import menu_cache
+from app.services.menu_pipeline import (
+    MenuExtractionError,
+    get_recommendations,
+    run_batch_pipeline,
+    run_menu_pipeline,
+    run_stored_menu_pipeline,
+    store_menu,
+    stream_menu_pipeline,
+    user_profile,
+)
+from app.services.recommendations import menu_store, recommendation_cache
+from app.services.restaurant_menus import menu_keys, restaurant_menu, save_restaurant_menu
+from app.services.sse import SSE_HEADERS, sse_event
+from config.config import Config
+from pydantic import ValidationError
 
 ocr_bp = Blueprint("ocr", __name__)
 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-
-# Define Pydantic models for the JSON schema
-class Addon(BaseModel):
-    name: Optional[str] = Field(None, description="Add-on name (Preserve exact spelling)")
-    price: Optional[float] = Field(None, description="Price of the add-on")
-
-class Size(BaseModel):
-    size: Optional[str] = Field(None, description="Exact size label (Small/Medium/Large) OR specific weight/volume if available (e.g., '8 oz', '12 fl oz', '500g')")
-    price: Optional[float] = Field(None, description="Price for the given size")
+@ocr_bp.route("/", methods=["GET"])
+def ocr_home():
+    return jsonify({"message": "OCR API Home"})
 
-class MenuItem(BaseModel):
-    name: Optional[str] = Field(None, description="Dish Name (Preserve exact spelling and formatting as in image)")
-    sizes: List[Size] = Field(default_factory=list, description="List of sizes and prices for the dish")
-    description: Optional[str] = Field(None, description="Full description exactly as written, including ingredients if mentioned")
-    spiciness: Optional[str] = Field(None, description="Mild/Medium/Spicy if listed, otherwise null")
-    allergens: List[str] = Field(default_factory=list, description="List of allergens explicitly listed under 'Allergens', otherwise leave empty")
-    dietary_info: List[str] = Field(default_factory=list, description="List of dietary tags such as 'Vegan', 'Vegetarian', 'Gluten-Free', 'Dairy-Free' if explicitly stated, otherwise leave empty")
-    calories: Optional[str] = Field(None, description="Calories if explicitly listed (e.g., '840-1080' or '530'), otherwise null")
-    popularity: Optional[str] = Field(None, description="Bestseller/Chef's Recommendation/Seasonal Special if mentioned, otherwise null")
-    availability: Optional[str] = Field(None, description="All day/Lunch only/Weekends only if specified, otherwise null")
-    addons: List[Addon] = Field(default_factory=list, description="List of add-ons for the dish")
+@ocr_bp.route("/cache-stats", methods=["GET"])
+def cache_stats():
+    return jsonify({
+        "menu_cache": menu_cache.stats(),
+        "menu_store": menu_store.stats(),
+        "recommendation_cache": recommendation_cache.stats(),
+        "menu_jobs": menu_jobs.stats(),
+    })
 
-class MenuCategory(RootModel):
-    root: List[MenuItem]
+# per-stage LLM settings, current hedge delays and attempt/outcome counters
+@ocr_bp.route("/llm-stats", methods=["GET"])
+def llm_call_stats():
+    return jsonify(llm_stats())
 
-class Menu(BaseModel):
-    menu: Dict[str, List[MenuItem]] = Field(..., description="Dictionary of menu categories with a list of menu items")
+# With a restaurant_id (form field or query arg) an uploaded photo is always
+# scanned and its dishes are merged into the restaurant's stored menu
+# (replace=1 stores the scan as the whole menu). Without a photo the stored
+# menu is returned instead, so a client can ask for it with its
+# recommendations rather than uploading a page it already has.
+def stored_menu_response(restaurant_id, user, with_recommendations):
+    stored = restaurant_menu(restaurant_id)
+    if stored is None:
+        return jsonify({"error": "No menu stored for this restaurant"}), 404
+    return jsonify(run_stored_menu_pipeline(stored, user_profile(user), with_recommendations=with_recommendations))
 
-@ocr_bp.route("/", methods=["GET"])
-def ocr_home():
-    return jsonify({"message": "OCR API Home"})
+# saving is best effort: the extracted menu is returned either way
+def save_scanned_menu(restaurant_id, result):
+    try:
+        result["menu_version"] = save_restaurant_menu(
+            restaurant_id,
+            result["menu"],
+            result["menu_digest"],
+            request.values.get("restaurant_name"),
+            replace=request.values.get("replace") == "1",
+        )
+    except Exception as e:
+        db.session.rollback()
+        print(f"Saving the menu of restaurant {restaurant_id} failed: {e}")
+    return result
 
 @ocr_bp.route("/extract-menu/<int:user_id>", methods=["POST"])
 def extract_menu(user_id):
@@ -49,138 +74,219 @@ def extract_menu(user_id):
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    if "image" not in request.files:
-        return jsonify({"error": "No image uploaded"}), 400
-
-    file = request.files["image"]
+    restaurant_id = request.values.get("restaurant_id")
+    # ?recommendations=0 returns the menu right away; the client then asks
+    # /ocr/recommendations/<user_id> with the returned menu_digest
+    with_recommendations = request.args.get("recommendations", "1") != "0"
 
     try:
-        image_bytes = file.read()
-        image = Image.open(io.BytesIO(image_bytes))
-
-        model = genai.GenerativeModel('gemini-1.5-flash-8b')
-
-        example_json = {
-            "menu": {
-                "APPETIZERS": [
-                    {"name": "Shrimp Cocktail", "sizes": [{"size": "Regular", "price": 12.0}], "description": "Chilled shrimp with cocktail sauce", "spiciness": None, "allergens": [], "dietary_info": [], "calories": None, "popularity": None, "availability": None, "addons": []}
-                ],
-                "MAIN COURSES": [
-                    {"name": "Grilled Salmon", "sizes": [{"size": "Regular", "price": 25.0}], "description": "Grilled salmon with roasted vegetables", "spiciness": None, "allergens": [], "dietary_info": [], "calories": None, "popularity": None, "availability": None, "addons": []},
-                    {"name": "Pasta Carbonara", "sizes": [], "description": "Creamy pasta with pancetta and egg", "spiciness": None, "allergens": ["dairy", "gluten"], "dietary_info": [], "calories": "600", "popularity": "Chef's Recommendation", "availability": "All day", "addons": [{"name": "Add Chicken", "price": 5.0}]}
-                ],
-                "DRINKS": [
-                    {"name": "Coke", "sizes": [{"size": "12 oz", "price": 2.5}]}
-                ]
-            }
-        }
-
-        prompt = (
-            "You are an AI assistant that extracts structured menu details from images of menu."
-            "It is of the highest priority that you preserve exact spelling and formatting from the image."
-            "Extract ALL relevant details from the menu image in strict JSON format, matching the schema exactly.\n"
-            f"Here's an example of the desired JSON structure:\n{json.dumps(example_json, indent=2)}\n\n"
-            "It is CRUCIAL to extract every menu category and all items within each category.\n"
-            "NOTE: The 'dietary_info' field must always be a list. If there's nothing, return an empty list []."
-            "IMPORTANT: The `price` must always be inside the `sizes` list as a dictionary with both `size` and `price` keys."
-            "If the size is not specified, use a default value like `Regular`"
-            "DO NOT place the `price` as a top-level field in the menu item."
-            "IMPORTANT: For prices, extract ONLY the numerical value with exactly two decimal places"
-            "For example, if you see '$10.89 840-1080 Cal.', the price should be 10.89.\n"
-            "Ensure dish names are exactly as written, and sizes include "
-            "weight (oz, g, lb) or volume (fl oz, ml) if specified.\n"
-            "Output MUST be valid JSON. If a field is not present in the image, "
-            "its value should be 'null' if nullable, or an empty list/string when appropriate.\n"
-            "Do NOT hallucinate. Only output JSON. Do NOT explain or include text outside the JSON structure."
-            "Now, extract the menu details from the given image."
-        )
-        
-        response = model.generate_content(
-            [prompt, image],
-            generation_config=genai.types.GenerationConfig(
-                response_mime_type="application/json"
-            ),
-        )
+        if "image" not in request.files and restaurant_id:
+            return stored_menu_response(restaurant_id, user, with_recommendations)
 
-        if response.prompt_feedback and response.prompt_feedback.block_reason:
-            print(f"Blocked reason: {response.prompt_feedback.block_reason}")
-            return jsonify({
-                'success': False,
-                'error': f'Blocked reason: {response.prompt_feedback.block_reason}'
-            }), 400
+        if "image" not in request.files:
+            return jsonify({"error": "No image uploaded"}), 400
 
-        try:
-            json_string = response.text.strip()
-            structured_data = json.loads(json_string)
-            Menu.model_validate(structured_data)
-
-        except json.JSONDecodeError as e:
-            print(f"JSON Decode Error: {e}\nResponse Text: {response.text}")
-            return jsonify({
-                'success': False,
-                'error': f'Failed to decode JSON: {e}'
-            }), 500
-        
-        except ValidationError as e:
-            print(f"Pydantic Validation Error: {e}\nData: {structured_data}")
-            return jsonify({
-                'success': False,
-                'error': f'Data validation failed: {e}'
-            }), 400
-        
-        restrictions = ', '.join(user.food_restrictions) if user.food_restrictions else "None"
-        preferences = ', '.join(user.food_preferences) if user.food_preferences else "None"
-
-        recommendation_prompt = f"""
-        You are a helpful food assistant recommending 2 dishes to a customer based on their user profile.
-
-        User profile:
-        - Age: {user.age}
-        - Allergens and dietary restrictions: {restrictions}
-        - Preferences: {preferences}
-
-        Your strict instructions:
-        1. Top Priority: Recommend ONLY dishes that fully avoid the user's allergens and dietary restrictions. If a dish commonly contains a restricted ingredient (e.g., dairy in gelato), exclude it—even if not explicitly listed.
-        2. Favor dishes that explicitly match the user's cuisine or dietary preferences (e.g., Chinese, Korean, Vegan). DO NOT make assumptions. If no dish matches preferences, pick the safest and most neutral options.
-        3. Do NOT say a dish matches a cuisine preference unless the connection is explicitly clear.
-        4. Do NOT fabricate or hallucinate non-existent reasons for recommendation (e.g., do not say espresso is “Asian cuisine”).
-        5. Rank the dishes by relevance and provide a match score from 1 to 100%.
-        6. Ignore dish categories entirely.
-
-        Return ONLY valid JSON in this format:
-        {{
-        "recommendations": [
-            {{
-            "name": "<Dish Name>",
-            "match_score": "<Match Score from 1 to 100>",
-            "reason": "<Why this dish suits the user based on their profile>"
-            }},
-            ...
-        ]
-        }}
-
-        Menu:
-        {json.dumps(structured_data['menu'], indent=2)}
-        """
-
-        recommendation_response = model.generate_content(
-            [recommendation_prompt],
-            generation_config=genai.types.GenerationConfig(
-                response_mime_type="application/json"
-            ),
+        prepared = preprocess_image(request.files["image"].stream)
+        result = run_menu_pipeline(
+            prepared,
+            user_profile(user),
+            with_recommendations=with_recommendations,
+            restaurant_id=restaurant_id,
+            stored_dishes=(lambda: menu_keys(restaurant_id)) if restaurant_id else None,
         )
+        if restaurant_id:
+            save_scanned_menu(restaurant_id, result)
+        return jsonify(result)
 
-        try:
-            recommendation_json = json.loads(recommendation_response.text.strip())
-        except json.JSONDecodeError as e:
-            print("Recommendation JSON error:", e)
-            recommendation_json = {"recommendations": []}
+    except (MenuExtractionError, ImagePreprocessError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status_code
+
+    except Exception as e:
+        print(f"Error calling Gemini API: {e}")
+        return jsonify({"error": str(e)}), 500
+
+# several photos of one menu: pages are extracted concurrently and merged
+@ocr_bp.route("/extract-menu-batch/<int:user_id>", methods=["POST"])
+def extract_menu_batch(user_id):
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    restaurant_id = request.values.get("restaurant_id")
+    with_recommendations = request.args.get("recommendations", "1") != "0"
+
+    try:
+        files = request.files.getlist("images")
+        if not files and restaurant_id:
+            return stored_menu_response(restaurant_id, user, with_recommendations)
+
+        if not files:
+            return jsonify({"error": "No images uploaded"}), 400
+
+        if len(files) > Config.MENU_BATCH_MAX_PAGES:
+            return jsonify({"error": f"At most {Config.MENU_BATCH_MAX_PAGES} pages per request"}), 400
+
+        streams = [file.stream for file in files]
+        result = run_batch_pipeline(streams, user_profile(user), with_recommendations=with_recommendations)
+        if restaurant_id:
+            save_scanned_menu(restaurant_id, result)
+        return jsonify(result)
+
+    except (MenuExtractionError, ImagePreprocessError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status_code
+
+    except Exception as e:
+        print(f"Error calling Gemini API: {e}")
+        return jsonify({"error": str(e)}), 500
+
+# the menu last scanned at a restaurant, straight from dish_items
+@ocr_bp.route("/restaurant/<string:restaurant_id>/menu", methods=["GET"])
+def get_restaurant_menu(restaurant_id):
+    try:
+        stored = restaurant_menu(restaurant_id)
+        if stored is None:
+            return jsonify({"error": "No menu stored for this restaurant"}), 404
+
+        etag = hashlib.sha1(repr((stored["menu_digest"], stored["menu_version"], stored["fresh"])).encode("utf-8")).hexdigest()
+        if request.if_none_match.contains(etag):
+            not_modified = make_response("", 304)
+            not_modified.set_etag(etag)
+            return not_modified
+
+        # lets /ocr/recommendations and /ar/images take the digest
+        menu_store.set(stored["menu_digest"], stored["menu"])
+        response = jsonify(stored)
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
 
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# recommendations for an already extracted menu, given its digest or the menu itself
+@ocr_bp.route("/recommendations/<int:user_id>", methods=["POST"])
+def menu_recommendations(user_id):
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    data = request.get_json(silent=True) or {}
+    digest = data.get("menu_digest")
+
+    try:
+        if "menu" in data:
+            menu = data["menu"]
+            digest = store_menu(menu)
+        elif digest:
+            menu = menu_store.get(digest)
+            if menu is None:
+                return jsonify({"error": "Menu not found, send the menu itself"}), 404
+        else:
+            return jsonify({"error": "menu_digest or menu is required"}), 400
+
+        recommendations, cached = get_recommendations(menu, user_profile(user), digest)
         return jsonify({
-            "menu": structured_data["menu"],
-            "recommendations": recommendation_json.get("recommendations", [])
+            "menu_digest": digest,
+            "recommendations": recommendations,
+            "cached": cached,
         })
 
+    except ValidationError as e:
+        return jsonify({'success': False, 'error': f'Data validation failed: {e}'}), 400
+
     except Exception as e:
         print(f"Error calling Gemini API: {e}")
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+# same pipeline as extract_menu, but each category is pushed over SSE as soon
+# as the model has finished generating it
+@ocr_bp.route("/extract-menu/<int:user_id>/stream", methods=["POST"])
+def extract_menu_stream(user_id):
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    if "image" not in request.files:
+        return jsonify({"error": "No image uploaded"}), 400
+
+    try:
+        prepared = preprocess_image(request.files["image"].stream)
+    except ImagePreprocessError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status_code
+
+    profile = user_profile(user)
+
+    def generate():
+        try:
+            for event, data in stream_menu_pipeline(prepared, profile):
+                yield sse_event(event, data)
+            yield sse_event("done", {"success": True})
+
+        except MenuExtractionError as e:
+            yield sse_event("error", {"success": False, "error": str(e), "status": e.status_code})
+
+        except Exception as e:
+            print(f"Error calling Gemini API: {e}")
+            yield sse_event("error", {"success": False, "error": str(e), "status": 500})
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+# submit a menu extraction to the background pool and return a job id right away
+@ocr_bp.route("/jobs/<int:user_id>", methods=["POST"])
+def submit_menu_job(user_id):
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    if "image" not in request.files:
+        return jsonify({"error": "No image uploaded"}), 400
+
+    try:
+        # preprocess here so the queued job only holds the small recompressed copy
+        prepared = preprocess_image(request.files["image"].stream)
+        job = menu_jobs.submit(run_menu_pipeline, prepared, user_profile(user))
+    except ImagePreprocessError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status_code
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503
+
+    return jsonify({
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "status_url": f"/ocr/jobs/{job['job_id']}",
+        "result_url": f"/ocr/jobs/{job['job_id']}/result",
+    }), 202
+
+# job status, including the menu as soon as extraction has finished
+@ocr_bp.route("/jobs/<string:job_id>", methods=["GET"])
+def menu_job_status(job_id):
+    job = menu_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify({
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "partial": job["partial"],
+        "error": job["error"],
+    })
+
+@ocr_bp.route("/jobs/<string:job_id>/result", methods=["GET"])
+def menu_job_result(job_id):
+    job = menu_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    if job["status"] == "failed":
+        return jsonify({'success': False, 'error': job["error"]}), job["status_code"]
+
+    if job["status"] != "done":
+        return jsonify({"job_id": job["job_id"], "status": job["status"]}), 202
+
+    return jsonify(job["result"])
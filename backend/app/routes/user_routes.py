@@ -1,8 +1,8 @@
 from flask import Blueprint, jsonify, request
 from app.database import db
 from app.models import User
-import requests
-import os
+from app.services.passwords import verify_password
+from app.services.recommendations import recommendation_cache
 
 user_bp = Blueprint("user", __name__)
 
@@ -25,17 +25,7 @@ def login():
         if not user:
             return jsonify({"message": "User not found"}), 404
 
-        crypto_base_url = os.environ.get("HASH_API_KEY")
-        validate_url = f"{crypto_base_url}validate"
-
-        params = {
-            "plain": plain_password,
-            "hashed": user.hashed_password
-        }
-        response = requests.get(validate_url, params=params)
-        validation_data = response.json()
-
-        if validation_data.get("valid"):
+        if verify_password(plain_password, user.hashed_password):
             return jsonify({
                 "message": "Login successful",
                 "user_id": user.user_id,
@@ -120,6 +110,9 @@ def update_user(user_id):
 
         
         db.session.commit()
+        # cached recommendations were built from the old profile
+        if any(field in data for field in ("age", "food_restrictions", "food_preferences")):
+            recommendation_cache.invalidate_user(user_id)
         return jsonify({"message": "User updated successfully"})
     except Exception as e:
         return jsonify({"message": "Error updating user", "error": str(e)}), 500
\ No newline at end of file
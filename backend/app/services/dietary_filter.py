@@ -0,0 +1,143 @@
+import re
+from functools import lru_cache
+
+MEAT = [
+    "meat", "beef", "steak", "brisket", "veal", "pork", "bacon", "ham", "pancetta", "prosciutto",
+    "sausage", "chorizo", "pepperoni", "salami", "lard", "carnitas", "chicken", "turkey", "duck",
+    "lamb", "goat", "mutton", "burger", "meatball", "jerky", "gelatin",
+]
+FISH = ["fish", "salmon", "tuna", "cod", "anchovy", "sardine", "tilapia", "halibut", "trout", "mackerel", "eel", "sashimi", "fish sauce"]
+SHELLFISH = ["shellfish", "shrimp", "prawn", "crab", "lobster", "crawfish", "crayfish", "scallop", "clam", "mussel", "oyster", "calamari", "squid", "octopus"]
+DAIRY = [
+    "dairy", "milk", "cheese", "butter", "cream", "yogurt", "yoghurt", "gelato", "ice cream", "whey", "casein",
+    "ghee", "paneer", "mozzarella", "parmesan", "ricotta", "feta", "cheddar", "mascarpone", "custard", "latte",
+    "cappuccino", "alfredo", "queso", "bechamel", "lactose", "burrata", "brie", "creamy", "cheesy",
+    "buttery", "buttermilk",
+]
+RED_MEAT = [
+    "red meat", "beef", "steak", "brisket", "veal", "pork", "bacon", "ham", "pancetta", "prosciutto", "sausage",
+    "chorizo", "pepperoni", "salami", "lard", "carnitas", "lamb", "goat", "mutton", "venison", "bison", "burger",
+    "meatball",
+]
+EGG = ["egg", "mayonnaise", "mayo", "aioli", "meringue", "carbonara", "hollandaise", "custard", "frittata", "omelet", "omelette"]
+
+# exclusion restriction -> words that reveal a conflicting ingredient. Only
+# these are filtered locally; anything else (Halal, Kosher, Low Carb, Low
+# Sugar, ...) describes what fits rather than what to avoid and is left to
+# the recommendation prompt
+SYNONYMS = {
+    "dairy": DAIRY,
+    "egg": EGG,
+    "gluten": [
+        "gluten", "wheat", "flour", "bread", "pasta", "noodle", "spaghetti", "barley", "rye", "bun", "crouton",
+        "breaded", "tempura", "seitan", "couscous", "pizza", "pastry", "cake", "cookie", "dumpling", "bagel",
+        "croissant", "tortilla", "beer", "udon", "ramen",
+    ],
+    "peanut": ["peanut", "satay", "groundnut"],
+    "tree nut": [
+        "nut", "almond", "cashew", "walnut", "pecan", "pistachio", "hazelnut", "macadamia", "pine nut", "praline",
+        "marzipan", "pesto", "nutella",
+    ],
+    "shellfish": SHELLFISH,
+    "fish": FISH,
+    "soy": ["soy", "soya", "tofu", "edamame", "miso", "tempeh"],
+    "sesame": ["sesame", "tahini", "hummus"],
+    "pork": ["pork", "bacon", "ham", "pancetta", "prosciutto", "sausage", "chorizo", "pepperoni", "salami", "lard", "carnitas"],
+    "beef": ["beef", "steak", "brisket", "veal", "burger", "meatball"],
+    "red meat": RED_MEAT,
+    "vegetarian": MEAT + FISH + SHELLFISH,
+    "pescatarian": MEAT,
+    "vegan": MEAT + FISH + SHELLFISH + DAIRY + EGG + ["honey"],
+}
+
+# alternative spellings of a restriction
+ALIASES = {
+    "milk": "dairy", "lactose": "dairy", "lactose intolerant": "dairy", "lactose intolerance": "dairy",
+    "eggs": "egg", "wheat": "gluten", "celiac": "gluten", "coeliac": "gluten",
+    "peanuts": "peanut", "nut": "tree nut", "nuts": "tree nut", "tree nuts": "tree nut",
+    "seafood": "shellfish", "crustacean": "shellfish", "crustaceans": "shellfish",
+    "soybean": "soy", "soybeans": "soy", "soya": "soy", "vegetarianism": "vegetarian", "veganism": "vegan",
+}
+
+# dietary tags that clear an item for a restriction (e.g. "Vegan" clears dairy)
+SAFE_TAGS = {
+    "vegan": {"vegan", "vegetarian", "dairy", "egg", "pescatarian"},
+    "vegetarian": {"vegetarian", "pescatarian"},
+}
+
+_FREE_PHRASE = re.compile(r"\b(?:no|without|non)[- ]\w+|\b\w+[- ]free\b", re.IGNORECASE)
+
+
+def normalize_restriction(restriction):
+    term = " ".join(str(restriction).casefold().replace("-", " ").split())
+    term = re.sub(r"\b(allergy|allergies|allergic|intolerance|free|no|avoid)\b", "", term).strip()
+    return ALIASES.get(term, term)
+
+
+# one precompiled pattern per known exclusion restriction
+@lru_cache(maxsize=256)
+def restriction_pattern(restriction):
+    words = SYNONYMS[restriction]
+    alternatives = "|".join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+    return re.compile(rf"\b(?:{alternatives})(?:e?s)?\b", re.IGNORECASE)
+
+
+def _tag_clears(tags, restriction):
+    for tag in tags:
+        tag = " ".join(tag.casefold().replace("-", " ").split())
+        if tag == f"{restriction} free" or restriction in SAFE_TAGS.get(tag, ()):
+            return True
+    return False
+
+
+# True when nothing in the item's allergens, tags, name or description
+# conflicts with any of the restrictions
+def is_safe(item, restrictions):
+    allergens = " ".join(item.get("allergens") or [])
+    tags = item.get("dietary_info") or []
+    # "dairy-free" or "no nuts" in the description must not count as a mention
+    text = _FREE_PHRASE.sub(" ", f"{item.get('name') or ''} {item.get('description') or ''}")
+
+    for restriction in restrictions:
+        pattern = restriction_pattern(restriction)
+        if pattern.search(allergens):
+            return False
+        if _tag_clears(tags, restriction):
+            continue
+        if pattern.search(text):
+            return False
+    return True
+
+
+# items from every category that survive the user's exclusion restrictions;
+# restrictions without a SYNONYMS entry do not filter anything
+def filter_menu(menu, restrictions):
+    normalized = [term for term in {normalize_restriction(r) for r in restrictions or []} if term in SYNONYMS]
+    candidates = []
+    for items in menu.values():
+        for item in items:
+            if is_safe(item, normalized):
+                candidates.append(item)
+    return candidates
+
+
+# rough token estimate used for reporting (about 4 characters per token)
+def estimate_tokens(text):
+    return len(text) // 4
+
+
+# one line per dish instead of the indented JSON dump of the whole menu
+def encode_candidates(candidates):
+    lines = []
+    for item in candidates:
+        fields = [item.get("name") or "Unnamed dish"]
+        if item.get("description"):
+            fields.append(item["description"])
+        if item.get("dietary_info"):
+            fields.append("tags: " + ", ".join(item["dietary_info"]))
+        if item.get("spiciness"):
+            fields.append("spiciness: " + item["spiciness"])
+        if item.get("popularity"):
+            fields.append(item["popularity"])
+        lines.append("- " + " | ".join(fields))
+    return "\n".join(lines)
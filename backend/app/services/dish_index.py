@@ -0,0 +1,224 @@
+import threading
+import time
+from collections import Counter
+from sqlalchemy import func
+from app.database import db
+from app.models import ARModel, DishItem
+from app.services.cache import TTLCache
+from app.services.image_search import normalize_dish_name
+from app.services.metrics import record_stage, span
+from config.config import Config
+
+MEMO_SIZE = 4096
+
+
+# word trigrams, each word padded with a space on both sides, so "Chkn Tikka"
+# and "Chicken Tikka" still share most of them. pg_trgm also adds a
+# two-space "  c" gram per word; it is left out here because it is shared by
+# half the menu and made the posting lists it lands in the slowest to count.
+def trigrams(name):
+    grams = set()
+    for word in normalize_dish_name(name).split():
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+# Trigram postings over the dish names of one restaurant. Only dishes with
+# at least one AR model are indexed, so a scanned dish (which has its own row
+# since menus are stored per restaurant) matches the dish carrying the model.
+class RestaurantDishIndex:
+    def __init__(self, dishes=()):
+        self._names = {}
+        self._grams = {}
+        self._postings = {}
+        # candidates per (name, min_similarity); the same menu is scanned by
+        # many users, so most lookups after the first are answered from here
+        self._memo = {}
+        self._lock = threading.Lock()
+        for dish_id, dish_name in dishes:
+            self.add(dish_id, dish_name)
+
+    def add(self, dish_id, dish_name):
+        grams = trigrams(dish_name)
+        with self._lock:
+            if dish_id in self._grams:
+                return
+            self._names[dish_id] = dish_name
+            self._grams[dish_id] = grams
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(dish_id)
+            self._memo.clear()
+
+    def discard(self, dish_id):
+        with self._lock:
+            self._memo.clear()
+            self._names.pop(dish_id, None)
+            for gram in self._grams.pop(dish_id, ()):
+                self._postings[gram].discard(dish_id)
+
+    # up to `limit` (similarity, dish_id, dish_name), best first, scored with
+    # pg_trgm's similarity: shared trigrams / trigrams in either name
+    def candidates(self, name, min_similarity, limit=3):
+        key = (name, min_similarity, limit)
+        with self._lock:
+            cached = self._memo.get(key)
+        if cached is not None:
+            return cached
+
+        grams = trigrams(name)
+        if not grams:
+            return []
+        shared = Counter()
+        with self._lock:
+            for gram in grams:
+                shared.update(self._postings.get(gram, ()))
+            scored = []
+            for dish_id, count in shared.items():
+                similarity = count / (len(grams) + len(self._grams[dish_id]) - count)
+                if similarity >= min_similarity:
+                    scored.append((similarity, dish_id, self._names[dish_id]))
+        scored.sort(key=lambda match: (-match[0], match[1]))
+        scored = scored[:limit]
+
+        with self._lock:
+            if len(self._memo) >= MEMO_SIZE:
+                self._memo.clear()
+            self._memo[key] = scored
+        return scored
+
+    def __len__(self):
+        return len(self._grams)
+
+
+# loaded restaurant indexes, least recently matched evicted first
+class RestaurantIndexCache(TTLCache):
+    # the loaded index, without touching the LRU order or the hit counters
+    def peek(self, restaurant_id):
+        with self._lock:
+            entry = self._entries.get(restaurant_id)
+        return None if entry is None else entry[1]
+
+    def dishes(self):
+        with self._lock:
+            indexes = [index for _, index in self._entries.values()]
+        return sum(len(index) for index in indexes)
+
+
+# Per-restaurant indexes, each built from one query the first time the
+# restaurant is matched and rebuilt after DISH_INDEX_TTL seconds. At most
+# DISH_INDEX_SIZE restaurants are kept, least recently matched evicted first.
+# Dishes and models added through this process update the loaded index right
+# away; other gunicorn workers pick them up when their copy expires.
+class DishIndex:
+    def __init__(self, ttl=300, maxsize=512):
+        self._restaurants = RestaurantIndexCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def _load(self, restaurant_id):
+        with span("dish_index.load"):
+            rows = (
+                db.session.query(DishItem.dish_id, DishItem.dish_name)
+                .filter(DishItem.restaurant_id == restaurant_id)
+                .filter(DishItem.ar_models.any())
+                .all()
+            )
+        index = RestaurantDishIndex((row.dish_id, row.dish_name) for row in rows)
+        self._restaurants.set(restaurant_id, index)
+        with self._lock:
+            self.loads += 1
+        return index
+
+    def restaurant(self, restaurant_id):
+        index = self._restaurants.get(restaurant_id)
+        if index is None:
+            index = self._load(restaurant_id)
+        return index
+
+    # a dish just got an AR model (new dish with model, or model added to a dish)
+    def add_dish(self, restaurant_id, dish_id, dish_name):
+        index = self._restaurants.peek(restaurant_id)
+        # a restaurant that is not loaded will read the dish from the database
+        if index is not None:
+            index.add(dish_id, dish_name)
+
+    def stats(self):
+        stats = self._restaurants.stats()
+        stats["restaurants"] = stats.pop("size")
+        stats["dishes"] = self._restaurants.dishes()
+        stats["loads"] = self.loads
+        return stats
+
+
+dish_index = DishIndex(ttl=Config.DISH_INDEX_TTL, maxsize=Config.DISH_INDEX_SIZE)
+
+
+# {dish_id: top-rated model row} for the given dishes, one windowed query
+def top_models(dish_ids):
+    if not dish_ids:
+        return {}
+    dish_rank = func.row_number().over(
+        partition_by=ARModel.dish_id,
+        order_by=(ARModel.model_rating.desc(), ARModel.model_id.desc()),
+    ).label("dish_rank")
+    ranked = (
+        db.session.query(
+            ARModel.dish_id,
+            ARModel.model_id,
+            ARModel.model_rating,
+            ARModel.up_votes,
+            ARModel.down_votes,
+            dish_rank,
+        )
+        .filter(ARModel.dish_id.in_(dish_ids))
+        .subquery()
+    )
+    rows = db.session.query(ranked).filter(ranked.c.dish_rank == 1).all()
+    return {row.dish_id: row for row in rows}
+
+
+# Best dish with an AR model, and that dish's top-rated model, for every item
+# of an extracted menu: trigram candidates for all items first, then a single
+# query for the top models of every candidate. Candidates whose dish has
+# lost all its models since it was indexed are dropped from the index.
+def match_menu(restaurant_id, menu):
+    index = dish_index.restaurant(restaurant_id)
+    min_similarity = Config.DISH_MATCH_MIN_SIMILARITY
+
+    started = time.perf_counter()
+    items = []
+    for category, category_items in menu.items():
+        for item in category_items or []:
+            if isinstance(item, dict) and isinstance(item.get("name"), str) and item["name"]:
+                items.append((category, item["name"], index.candidates(item["name"], min_similarity)))
+    lookup_seconds = time.perf_counter() - started
+    record_stage("dish_index.match", lookup_seconds)
+
+    with span("dish_index.top_models"):
+        models = top_models(sorted({dish_id for _, _, candidates in items for _, dish_id, _ in candidates}))
+
+    matches = []
+    for category, name, candidates in items:
+        match = {"category": category, "name": name, "dish": None, "model": None}
+        best = None
+        for similarity, dish_id, dish_name in candidates:
+            model = models.get(dish_id)
+            if model is None:
+                index.discard(dish_id)
+                continue
+            # equally close names (the same dish entered twice) go to the better model
+            if best is None or (similarity, model.model_rating or 0) > (best[0], best[3].model_rating or 0):
+                best = (similarity, dish_id, dish_name, model)
+        if best is not None:
+            similarity, dish_id, dish_name, model = best
+            match["dish"] = {"dish_id": dish_id, "dish_name": dish_name, "similarity": round(similarity, 3)}
+            match["model"] = {
+                "model_id": model.model_id,
+                "model_rating": model.model_rating,
+                "up_votes": model.up_votes,
+                "down_votes": model.down_votes,
+            }
+        matches.append(match)
+
+    return matches, lookup_seconds
@@ -0,0 +1,111 @@
+import io
+import os
+import time
+from app.services.metrics import image_bytes, record_stage
+from config.config import Config
+
+
+# raised for uploads that cannot be turned into a model input
+class ImagePreprocessError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# the downscaled image and its recompressed bytes
+class PreparedImage:
+    def __init__(self, image, data, mime_type):
+        self.image = image
+        self.data = data
+        self.mime_type = mime_type
+
+    # content part accepted by generate_content, so the recompressed bytes are
+    # exactly what gets uploaded
+    def as_part(self):
+        return {"mime_type": self.mime_type, "data": self.data}
+
+
+def _stream_size(stream):
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+def _encode_jpeg(image, max_bytes, quality):
+    # step quality down until the output fits the byte budget
+    data = b""
+    for attempt in range(quality, 29, -10):
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=attempt, optimize=True)
+        data = buffer.getvalue()
+        if len(data) <= max_bytes:
+            break
+    return data
+
+
+# decode -> orient -> downscale -> (grayscale) -> recompress, reading straight
+# from the upload stream (werkzeug spools large uploads to a temp file) so the
+# full-resolution bytes are never held in memory. Stage timings and the bytes
+# saved are recorded in metrics.py
+def preprocess_image(stream, max_edge=None, grayscale=None, max_bytes=None, quality=None):
+    max_edge = max_edge or Config.IMAGE_MAX_EDGE
+    grayscale = Config.IMAGE_GRAYSCALE if grayscale is None else grayscale
+    max_bytes = max_bytes or Config.IMAGE_MAX_BYTES
+    quality = quality or Config.IMAGE_JPEG_QUALITY
+
+    # Pillow is only loaded once the first image arrives
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    if isinstance(stream, (bytes, bytearray)):
+        stream = io.BytesIO(stream)
+
+    input_bytes = _stream_size(stream)
+    if input_bytes > Config.UPLOAD_MAX_BYTES:
+        raise ImagePreprocessError("Image is too large", 413)
+
+    started = time.perf_counter()
+
+    def mark(stage):
+        nonlocal started
+        now = time.perf_counter()
+        record_stage(f"image.{stage}", now - started)
+        started = now
+
+    try:
+        image = Image.open(stream)
+
+        # JPEGs can be decoded at 1/2, 1/4 or 1/8 scale straight from the DCT
+        scale = max_edge / max(image.size)
+        if image.format == "JPEG" and scale < 1:
+            image.draft("L" if grayscale else "RGB", (int(image.width * scale), int(image.height * scale)))
+        image.load()
+        mark("decode")
+    except Image.DecompressionBombError as e:
+        print(f"Image decode error: {e}")
+        raise ImagePreprocessError("Image dimensions are too large", 413)
+    except (UnidentifiedImageError, OSError) as e:
+        print(f"Image decode error: {e}")
+        raise ImagePreprocessError("Invalid image", 400)
+
+    ImageOps.exif_transpose(image, in_place=True)
+    mark("orient")
+
+    if max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    mark("resize")
+
+    if grayscale:
+        image = image.convert("L")
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    mark("convert")
+
+    data = _encode_jpeg(image, max_bytes, quality)
+    mark("encode")
+
+    image_bytes.inc("input", amount=input_bytes)
+    image_bytes.inc("output", amount=len(data))
+    image_bytes.inc("saved", amount=max(input_bytes - len(data), 0))
+    return PreparedImage(image, data, "image/jpeg")
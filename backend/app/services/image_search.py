@@ -0,0 +1,272 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from app.services.metrics import span
+from config.config import Config
+
+_ddgs = threading.local()
+
+
+# one DDGS client (and its HTTP connection pool) per thread instead of a new
+# session for every search
+def ddg_image_search(query):
+    client = getattr(_ddgs, "client", None)
+    if client is None:
+        # duckduckgo_search (with primp and lxml) is imported on first use
+        from duckduckgo_search import DDGS
+
+        client = _ddgs.client = DDGS(timeout=Config.DISH_IMAGE_SEARCH_TIMEOUT)
+    with span("image_search.ddg"):
+        results = client.images(query, max_results=1)
+    return results[0]["image"] if results else None
+
+
+# "  Pad-Thai! " and "pad thai" share one cache entry
+def normalize_dish_name(name):
+    name = re.sub(r"[^\w\s]", " ", str(name).casefold())
+    return " ".join(name.split())
+
+
+# a concurrent lookup that other requests for the same name wait on
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# Persistent dish name -> image URL cache in a local SQLite file. Misses are
+# cached too (for negative_ttl), and concurrent lookups of the same uncached
+# name share a single upstream search.
+class DishImageCache:
+    def __init__(self, path, ttl=2592000, negative_ttl=86400, search=None):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.search = search or ddg_image_search
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.metrics = {
+            "hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "upstream_searches": 0,
+            "upstream_errors": 0,
+            "upstream_ms": 0.0,
+        }
+
+    # sqlite3 connections cannot be shared between threads, so each thread
+    # keeps its own; WAL lets readers run while another thread writes
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS dish_images ("
+                "name TEXT PRIMARY KEY, image_url TEXT, fetched_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def _read(self, key):
+        return self._connection().execute(
+            "SELECT image_url FROM dish_images WHERE name = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+
+    def _write(self, key, image_url):
+        now = time.time()
+        ttl = self.ttl if image_url else self.negative_ttl
+        self._connection().execute(
+            "INSERT OR REPLACE INTO dish_images (name, image_url, fetched_at, expires_at) VALUES (?, ?, ?, ?)",
+            (key, image_url, now, now + ttl),
+        )
+
+    def _count(self, metric, amount=1):
+        with self._lock:
+            self.metrics[metric] += amount
+
+    # (found, image_url) from the cache alone, never searching
+    def cached(self, dish_name):
+        key = normalize_dish_name(dish_name)
+        if not key:
+            return True, None
+
+        row = self._read(key)
+        if row is None:
+            return False, None
+        self._count("hits" if row[0] else "negative_hits")
+        return True, row[0]
+
+    # image URL for the dish, or None when the search found nothing
+    def lookup(self, dish_name):
+        key = normalize_dish_name(dish_name)
+        if not key:
+            return None
+
+        row = self._read(key)
+        if row is not None:
+            self._count("hits" if row[0] else "negative_hits")
+            return row[0]
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.metrics["misses"] += 1
+            else:
+                self.metrics["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        started = time.perf_counter()
+        try:
+            # a previous leader may have stored it between our read and taking the flight
+            row = self._read(key)
+            if row is not None:
+                flight.result = row[0]
+            else:
+                self._count("upstream_searches")
+                flight.result = self.search(key)
+                self._write(key, flight.result)
+                self._count("upstream_ms", (time.perf_counter() - started) * 1000)
+        except Exception as e:
+            # upstream failures are not cached, the next request retries
+            flight.error = e
+            self._count("upstream_errors")
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    def clear(self):
+        self._connection().execute("DELETE FROM dish_images")
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self.metrics)
+            in_flight = len(self._flights)
+        entries, negative = self._connection().execute(
+            "SELECT count(*), count(*) - count(image_url) FROM dish_images WHERE expires_at > ?", (time.time(),)
+        ).fetchone()
+
+        lookups = metrics["hits"] + metrics["negative_hits"] + metrics["misses"] + metrics["coalesced"]
+        served = metrics["hits"] + metrics["negative_hits"] + metrics["coalesced"]
+        searches = metrics["upstream_searches"]
+        return dict(
+            metrics,
+            upstream_ms=round(metrics["upstream_ms"], 2),
+            avg_upstream_ms=round(metrics["upstream_ms"] / searches, 2) if searches else None,
+            hit_ratio=round(served / lookups, 4) if lookups else 0.0,
+            entries=entries,
+            negative_entries=negative,
+            in_flight=in_flight,
+            ttl=self.ttl,
+            negative_ttl=self.negative_ttl,
+        )
+
+
+# dish names in menu order, from the {category: [items]} menu that
+# extract_menu returns
+def dish_names_from_menu(menu):
+    names = []
+    for items in menu.values():
+        for item in items or []:
+            if isinstance(item, dict) and isinstance(item.get("name"), str) and item["name"]:
+                names.append(item["name"])
+    return names
+
+
+# Resolve images for many dishes, yielding (dish_name, image_url, status) in
+# completion order. Cached names are answered first without touching the
+# pool; the rest are searched on image_executor, at most max_in_flight at a
+# time so one large menu cannot take over the pool shared by all requests. A
+# search that has been running for longer than timeout is reported as
+# "timeout" and left to finish (and fill the cache) in the background, still
+# holding its slot. Searches not started yet are cancelled when the caller
+# stops early (e.g. the SSE client disconnected). status is one of found,
+# not_found, timeout or error.
+def resolve_images(dish_names, timeout=None, cache=None, executor=None, max_in_flight=None):
+    timeout = timeout or Config.DISH_IMAGE_LOOKUP_TIMEOUT
+    cache = cache or dish_image_cache
+    executor = executor or image_executor
+    max_in_flight = max_in_flight or Config.DISH_IMAGE_REQUEST_WORKERS
+
+    names = list(dict.fromkeys(name for name in dish_names if normalize_dish_name(name)))
+    misses = deque()
+    for name in names:
+        found, image_url = cache.cached(name)
+        if found:
+            yield name, image_url, "found" if image_url else "not_found"
+        else:
+            misses.append(name)
+
+    started = {}
+
+    def search(name):
+        started[name] = time.monotonic()
+        return cache.lookup(name)
+
+    # pending: searches still to be reported; running: every search of this
+    # request that has not finished, including those reported as timed out
+    pending = {}
+    running = set()
+    try:
+        while misses or pending:
+            running = {future for future in running if not future.done()}
+            while misses and len(running) < max_in_flight:
+                name = misses.popleft()
+                future = executor.submit(contextvars.copy_context().run, search, name)
+                pending[future] = name
+                running.add(future)
+
+            if not pending:
+                # every slot is held by a timed-out search
+                wait(running, timeout=0.05, return_when=FIRST_COMPLETED)
+                continue
+
+            done, _ = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    image_url = future.result()
+                    yield name, image_url, "found" if image_url else "not_found"
+                except Exception as e:
+                    print(f"Image search error for {name!r}: {e}")
+                    yield name, None, "error"
+
+            now = time.monotonic()
+            for future, name in list(pending.items()):
+                if name in started and now - started[name] > timeout:
+                    del pending[future]
+                    yield name, None, "timeout"
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+image_executor = ThreadPoolExecutor(max_workers=Config.DISH_IMAGE_WORKERS, thread_name_prefix="dish-image")
+
+dish_image_cache = DishImageCache(
+    Config.DISH_IMAGE_CACHE_PATH,
+    ttl=Config.DISH_IMAGE_CACHE_TTL,
+    negative_ttl=Config.DISH_IMAGE_NEGATIVE_TTL,
+)
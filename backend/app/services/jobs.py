@@ -0,0 +1,174 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from app.database import db
+from app.models import MenuJob
+from config.config import Config
+
+
+class QueueFullError(Exception):
+    pass
+
+
+# Bounded pool for long-running pipelines; a submit returns immediately with
+# a job id and the job row collects partial results as the stages finish. The
+# work runs in the process that accepted it, but the job state lives in the
+# menu_jobs table, so any gunicorn worker can answer status and result polls.
+# While a job is queued or running its process refreshes heartbeat_at; a job
+# whose heartbeat has stopped (its worker was killed or recycled) is reported
+# as failed instead of staying "running" forever.
+class JobManager:
+    def __init__(self, max_workers=4, max_queue=16, result_ttl=900, heartbeat_interval=10):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="menu-job")
+        self._active = set()
+        self._lock = threading.Lock()
+        self._heartbeat = None
+
+    def submit(self, fn, *args):
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            if len(self._active) >= self.max_workers + self.max_queue:
+                raise QueueFullError("Too many menu jobs in progress, try again shortly")
+            self._active.add(job_id)
+
+        try:
+            now = datetime.utcnow()
+            db.session.add(MenuJob(job_id=job_id, status="queued", partial={}, created_at=now, heartbeat_at=now))
+            # jobs are kept until result_ttl after their last update
+            db.session.query(MenuJob).filter(
+                MenuJob.heartbeat_at < now - timedelta(seconds=self.result_ttl)
+            ).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                self._active.discard(job_id)
+            raise
+
+        app = current_app._get_current_object()
+        self._start_heartbeat(app)
+        self._executor.submit(self._run, app, job_id, fn, args)
+        return {"job_id": job_id, "status": "queued"}
+
+    def get(self, job_id):
+        row = db.session.get(MenuJob, job_id)
+        if row is None:
+            return None
+
+        now = datetime.utcnow()
+        if row.heartbeat_at < now - timedelta(seconds=self.result_ttl):
+            return None
+
+        job = {
+            "job_id": row.job_id,
+            "status": row.status,
+            "partial": row.partial or {},
+            "result": row.result,
+            "error": row.error,
+            "status_code": row.status_code,
+        }
+        lost = row.heartbeat_at < now - timedelta(seconds=3 * self.heartbeat_interval)
+        if row.status in ("queued", "running") and lost:
+            job.update(
+                status="failed",
+                error="The server restarted while this job was running, submit it again",
+                status_code=503,
+            )
+        return job
+
+    def _update(self, job_id, **values):
+        values["heartbeat_at"] = datetime.utcnow()
+        try:
+            db.session.query(MenuJob).filter_by(job_id=job_id).update(values, synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Menu job {job_id} could not be updated: {e}")
+
+    def _run(self, app, job_id, fn, args):
+        with app.app_context():
+            self._update(job_id, status="running")
+            partial = {}
+
+            def report(stage, value):
+                partial[stage] = value
+                self._update(job_id, partial=dict(partial))
+
+            try:
+                result = fn(*args, report=report)
+                self._update(job_id, status="done", result=result, finished_at=datetime.utcnow())
+            except Exception as e:
+                print(f"Menu job {job_id} failed: {e}")
+                self._update(
+                    job_id,
+                    status="failed",
+                    error=str(e),
+                    status_code=getattr(e, "status_code", 500),
+                    finished_at=datetime.utcnow(),
+                )
+            finally:
+                with self._lock:
+                    self._active.discard(job_id)
+
+    def _start_heartbeat(self, app):
+        with self._lock:
+            if self._heartbeat is not None:
+                return
+            self._heartbeat = threading.Thread(target=self._beat, args=(app,), name="menu-job-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    # one UPDATE every heartbeat_interval for all jobs this process still owns
+    def _beat(self, app):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            with self._lock:
+                job_ids = list(self._active)
+            if not job_ids:
+                continue
+            with app.app_context():
+                try:
+                    db.session.query(MenuJob).filter(MenuJob.job_id.in_(job_ids)).update(
+                        {"heartbeat_at": datetime.utcnow()}, synchronize_session=False
+                    )
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Menu job heartbeat failed: {e}")
+
+    # wait up to timeout seconds for the jobs of this process to finish, so a
+    # recycled gunicorn worker does not drop them; True when none are left
+    def drain(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._active:
+                    return True
+            time.sleep(0.2)
+        return False
+
+    # counts for this process only
+    def stats(self):
+        with self._lock:
+            active = len(self._active)
+        return {
+            "active": active,
+            "running": min(active, self.max_workers),
+            "queued": max(0, active - self.max_workers),
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+        }
+
+
+menu_jobs = JobManager(
+    max_workers=Config.MENU_JOB_WORKERS,
+    max_queue=Config.MENU_JOB_QUEUE_DEPTH,
+    result_ttl=Config.MENU_JOB_RESULT_TTL,
+    heartbeat_interval=Config.MENU_JOB_HEARTBEAT_INTERVAL,
+)
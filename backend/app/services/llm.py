@@ -0,0 +1,273 @@
+import contextvars
+import functools
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from app.services.metrics import llm_attempt_seconds, llm_events, span
+from config.config import Config
+
+# HTTP statuses (google.api_core exceptions carry them as .code) worth another try
+TRANSIENT_CODES = (408, 429, 500, 502, 503, 504)
+
+
+# raised when no attempt answered before the stage's deadline
+class LLMTimeout(Exception):
+    pass
+
+
+_genai = None
+_genai_lock = threading.Lock()
+
+
+# The Gemini SDK takes about a second to import (it pulls in protobuf, gRPC
+# and the google.api_core stack), so it is loaded and configured on the first
+# call that needs it instead of when the blueprint is imported.
+def load_genai():
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                with span("gemini.load_sdk"):
+                    import google.generativeai as genai
+
+                    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+                _genai = genai
+    return _genai
+
+
+# Providers answer one prompt with one model, as JSON, within timeout seconds.
+# Responses only need .text and .prompt_feedback, like the Gemini SDK's.
+class GeminiProvider:
+    def _model(self, model):
+        genai = load_genai()
+        return genai.GenerativeModel(model), genai.types.GenerationConfig(response_mime_type="application/json")
+
+    def generate(self, model, contents, timeout):
+        client, config = self._model(model)
+        return client.generate_content(contents, generation_config=config, request_options={"timeout": timeout})
+
+    def stream(self, model, contents, timeout):
+        client, config = self._model(model)
+        return client.generate_content(contents, generation_config=config, stream=True, request_options={"timeout": timeout})
+
+
+providers = {"gemini": GeminiProvider()}
+
+
+# add or replace a provider, e.g. a local fake for benchmarks
+def register_provider(name, provider):
+    providers[name] = provider
+
+
+# "gemini:gemini-1.5-flash-8b" -> (provider, model name)
+def resolve(spec):
+    name, _, model = spec.partition(":")
+    if name not in providers:
+        raise ValueError(f"Unknown LLM provider {name!r}")
+    return providers[name], model
+
+
+def is_transient(error):
+    return isinstance(error, (TimeoutError, ConnectionError)) or getattr(error, "code", None) in TRANSIENT_CODES
+
+
+def is_timeout(error):
+    return isinstance(error, TimeoutError) or getattr(error, "code", None) in (408, 504)
+
+
+# settings of one stage ("extract", "recommend"), read from Config on every
+# call so they can be changed at runtime
+class StagePolicy:
+    def __init__(self, stage):
+        prefix = f"LLM_{stage.upper()}_"
+        self.model = getattr(Config, prefix + "MODEL")
+        self.fallback = getattr(Config, prefix + "FALLBACK")
+        self.deadline = getattr(Config, prefix + "DEADLINE")
+        self.retries = getattr(Config, prefix + "RETRIES")
+        self.hedge = getattr(Config, prefix + "HEDGE")
+        self.hedge_delay = getattr(Config, prefix + "HEDGE_DELAY")
+        self.fallback_at = Config.LLM_FALLBACK_AT
+
+
+# Recent latencies of primary attempts per (stage, model); the hedge for a
+# call fires once it has been running for longer than their p90.
+class LatencyTracker:
+    def __init__(self, window=200):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, seconds):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, key, fraction, min_samples):
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+    def counts(self):
+        with self._lock:
+            return {key: len(samples) for key, samples in self._samples.items()}
+
+
+latencies = LatencyTracker()
+
+
+def hedge_delay(stage, policy):
+    delay = latencies.quantile((stage, policy.model), Config.LLM_HEDGE_QUANTILE, Config.LLM_HEDGE_MIN_SAMPLES)
+    return policy.hedge_delay if delay is None else delay
+
+
+# Every primary attempt leaves one latency sample however it ends: its answer
+# time, also when a hedge already won (the losing call still finishes on the
+# pool), or the time it ran until it timed out. Sampling winners
+# alone would miss exactly the slow attempts a hedge overtakes and pull the
+# p90 down. The other attempts are not sampled: a hedge is cut short as soon
+# as the primary answers, so its samples would skew low. Errors other than
+# timeouts say nothing about latency and are skipped.
+def _sample(key, started, error=None):
+    if error is None or is_timeout(error):
+        latencies.add(key, time.monotonic() - started)
+
+
+def _timed_call(key, fn, *args):
+    started = time.monotonic()
+    try:
+        response = fn(*args)
+    except Exception as e:
+        _sample(key, started, e)
+        raise
+    _sample(key, started)
+    return response
+
+
+def _start(stage, kind, spec, contents, timeout):
+    provider, model = resolve(spec)
+    llm_events.inc(stage, f"attempt_{kind}")
+    key = (stage, spec) if kind == "primary" else None
+    # blocking SDK calls cannot be cancelled; a losing attempt finishes (or
+    # times out) on the pool and its answer is dropped
+    call = functools.partial(_timed_call, key, provider.generate) if key else provider.generate
+    return llm_executor.submit(contextvars.copy_context().run, call, model, contents, timeout)
+
+
+# One LLM call for a pipeline stage. The primary model gets the first
+# attempt; while nothing has answered:
+#   - after the model's recent p90 latency a second, hedged attempt starts,
+#   - a transient error is retried after an exponential backoff with full jitter,
+#   - once LLM_FALLBACK_AT of the deadline has passed (or the primary has
+#     failed for good) the fallback model starts, if the stage has one.
+# The first successful response wins and the other attempts are cancelled.
+# Raises LLMTimeout at the deadline, or the error of the last attempt.
+def generate(stage, contents):
+    policy = StagePolicy(stage)
+    started = time.monotonic()
+    deadline = started + policy.deadline
+    hedge_at = started + hedge_delay(stage, policy) if policy.hedge else None
+    fallback_at = started + policy.deadline * policy.fallback_at if policy.fallback else None
+    retries_left = policy.retries
+    retry_at = None
+    last_error = None
+    attempts = {}
+    llm_events.inc(stage, "call")
+
+    def launch(kind, spec):
+        now = time.monotonic()
+        attempts[_start(stage, kind, spec, contents, max(deadline - now, 0.1))] = (kind, spec, now)
+
+    def finish():
+        for future in attempts:
+            future.cancel()
+
+    launch("primary", policy.model)
+    while True:
+        now = time.monotonic()
+        if now >= deadline:
+            finish()
+            llm_events.inc(stage, "deadline_exceeded")
+            raise LLMTimeout(f"{stage} did not answer within {policy.deadline:g}s")
+
+        if hedge_at is not None and now >= hedge_at:
+            hedge_at = None
+            if attempts:
+                launch("hedge", policy.model)
+        if retry_at is not None and now >= retry_at:
+            retry_at = None
+            launch("retry", policy.model)
+        if fallback_at is not None and now >= fallback_at:
+            fallback_at = None
+            launch("fallback", policy.fallback)
+
+        if not attempts and retry_at is None and fallback_at is None:
+            finish()
+            llm_events.inc(stage, "failed")
+            raise last_error
+
+        wake_at = min(t for t in (deadline, hedge_at, retry_at, fallback_at) if t is not None)
+        if not attempts:
+            time.sleep(max(wake_at - now, 0))
+            continue
+
+        done, _ = wait(list(attempts), timeout=max(wake_at - now, 0), return_when=FIRST_COMPLETED)
+        for future in done:
+            kind, spec, attempt_started = attempts.pop(future)
+            try:
+                response = future.result()
+            except Exception as e:
+                last_error = e
+                if not is_transient(e):
+                    finish()
+                    llm_events.inc(stage, "failed")
+                    raise
+                llm_events.inc(stage, "transient_error")
+                print(f"LLM {stage} {kind} attempt on {spec} failed: {e}")
+                if retries_left and retry_at is None and spec == policy.model:
+                    attempt = policy.retries - retries_left
+                    retries_left -= 1
+                    retry_at = time.monotonic() + random.uniform(0, Config.LLM_RETRY_BACKOFF * 2 ** attempt)
+                elif fallback_at is not None and not attempts and retry_at is None:
+                    fallback_at = time.monotonic()
+                continue
+
+            seconds = time.monotonic() - attempt_started
+            llm_attempt_seconds.observe(seconds, stage, spec)
+            llm_events.inc(stage, f"won_{kind}")
+            finish()
+            return response
+
+
+# Streamed call for the incremental extraction: a response that is being
+# consumed as it arrives cannot be raced, so this is a single attempt on the
+# primary model bounded by the stage's deadline.
+def stream(stage, contents):
+    policy = StagePolicy(stage)
+    provider, model = resolve(policy.model)
+    llm_events.inc(stage, "stream")
+    return provider.stream(model, contents, policy.deadline)
+
+
+def stats():
+    events = {}
+    for (stage, event), count in llm_events.totals().items():
+        events.setdefault(stage, {})[event] = count
+    result = {}
+    for stage in ("extract", "recommend"):
+        policy = StagePolicy(stage)
+        result[stage] = {
+            "model": policy.model,
+            "fallback": policy.fallback or None,
+            "deadline": policy.deadline,
+            "hedge_delay": round(hedge_delay(stage, policy), 3) if policy.hedge else None,
+            "latency_samples": latencies.counts().get((stage, policy.model), 0),
+            "events": events.get(stage, {}),
+        }
+    return result
+
+
+llm_executor = ThreadPoolExecutor(max_workers=Config.LLM_WORKERS, thread_name_prefix="llm")
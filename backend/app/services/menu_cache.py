@@ -0,0 +1,150 @@
+import time
+from app.services.cache import TTLCache
+from config.config import Config
+
+
+# difference hash: compares neighbouring pixels of a small grayscale copy,
+# so recompressing or rescaling the same photo gives the same bits. 16x16
+# (256 bits) rather than the usual 8x8: at 64 bits, pages of text with the
+# same layout hash alike even when their dishes differ.
+def dhash(image, hash_size=16):
+    from PIL import Image
+
+    gray = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = list(gray.getdata())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+# Menu cache keyed on the perceptual hash of the uploaded photo. An exact
+# hash match is always served. Two photos of the same page taken on different
+# phones differ by ~20-60 of the 256 bits, but so do two pages of text with
+# the same layout (benchmarks/menu_cache_benchmark.py), so the distance alone
+# cannot tell a re-shot page from another page. Near matches are therefore
+# decided per restaurant (scope), checked against what the model extracted:
+#   - every photo cached for a restaurant is stored with its content (the
+#     dishes it listed); once two of them differ the restaurant has several
+#     pages and its photos only get exact hits until all of them have left
+#     the cache;
+#   - a restaurant whose min_photos cached extractions all agree can have a
+#     new photo within max_distance served from the cache, but only
+#     near_per_check times in a row: the next one is extracted again, so a
+#     page that was never scanned before is caught;
+#   - before a near match is served, `confirm(content)` can check it against
+#     what other workers have seen (the restaurant's stored menu); a rejected
+#     restaurant is treated as having several pages.
+# A photo without a scope only gets exact hits.
+class PerceptualMenuCache(TTLCache):
+    def __init__(self, maxsize=256, ttl=3600, max_distance=48, min_photos=4, near_per_check=1):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.max_distance = max_distance
+        self.min_photos = min_photos
+        self.near_per_check = near_per_check
+        self._scopes = {}
+        # scope -> {"photos", "content", "mixed", "near"}
+        self._restaurants = {}
+        self.near_hits = 0
+
+    def set(self, key, value, ttl=None, scope=None, content=None):
+        super().set(key, value, ttl)
+        if scope is None:
+            return
+        with self._lock:
+            if key not in self._entries:
+                return
+            self._unscope(key)
+            self._scopes[key] = scope
+            restaurant = self._restaurants.setdefault(
+                scope, {"photos": 0, "content": content, "mixed": False, "near": 0}
+            )
+            restaurant["photos"] += 1
+            restaurant["mixed"] = restaurant["mixed"] or restaurant["content"] != content
+            restaurant["near"] = 0
+
+    def _removed(self, key):
+        self._unscope(key)
+
+    def _unscope(self, key):
+        scope = self._scopes.pop(key, None)
+        if scope is None:
+            return
+        restaurant = self._restaurants[scope]
+        restaurant["photos"] -= 1
+        if not restaurant["photos"]:
+            del self._restaurants[scope]
+
+    # max_distance overrides the cache-wide setting (0 = exact only); confirm
+    # is called outside the lock
+    def lookup(self, image_hash, scope=None, max_distance=None, confirm=None):
+        if max_distance is None:
+            max_distance = self.max_distance
+        value = self.get(image_hash)
+        if value is not None or scope is None or max_distance <= 0:
+            return value
+
+        now = time.monotonic()
+        with self._lock:
+            restaurant = self._restaurants.get(scope)
+            if (
+                restaurant is None
+                or restaurant["mixed"]
+                or restaurant["photos"] < self.min_photos
+                or restaurant["near"] >= self.near_per_check
+            ):
+                return None
+
+            best_key, best_distance = None, max_distance + 1
+            for key, (expires_at, _) in self._entries.items():
+                if expires_at <= now or self._scopes.get(key) != scope:
+                    continue
+                distance = hamming_distance(key, image_hash)
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+            if best_key is None:
+                return None
+            content = restaurant["content"]
+
+        confirmed = confirm is None or confirm(content)
+        with self._lock:
+            restaurant = self._restaurants.get(scope)
+            if not confirmed:
+                if restaurant is not None:
+                    restaurant["mixed"] = True
+                return None
+            if restaurant is None or best_key not in self._entries:
+                return None
+
+            restaurant["near"] += 1
+            self._entries.move_to_end(best_key)
+            # the exact lookup above already counted a miss, turn it into a hit
+            self.misses -= 1
+            self.hits += 1
+            self.near_hits += 1
+            return self._entries[best_key][1]
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats["restaurants"] = len(self._restaurants)
+            stats["multi_page_restaurants"] = sum(1 for restaurant in self._restaurants.values() if restaurant["mixed"])
+        stats["near_hits"] = self.near_hits
+        stats["max_distance"] = self.max_distance
+        return stats
+
+
+menu_cache = PerceptualMenuCache(
+    maxsize=Config.MENU_CACHE_SIZE,
+    ttl=Config.MENU_CACHE_TTL,
+    max_distance=Config.MENU_CACHE_MAX_DISTANCE,
+    min_photos=Config.MENU_CACHE_MIN_PHOTOS,
+    near_per_check=Config.MENU_CACHE_NEAR_PER_CHECK,
+)
@@ -0,0 +1,470 @@
+import contextvars
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel, Field, RootModel, ValidationError
+from typing import List, Optional, Dict
+from app.services.dietary_filter import encode_candidates, estimate_tokens, filter_menu
+from app.services.image_preprocess import preprocess_image
+from app.services.image_search import normalize_dish_name
+from app.services.llm import LLMTimeout, generate, stream
+from app.services.menu_cache import dhash, menu_cache
+from app.services.menu_stream import IncrementalMenuParser
+from app.services.metrics import (
+    record_stage,
+    recommendation_calls_skipped,
+    recommendation_prompt_tokens,
+    span,
+)
+from app.services.recommendations import (
+    menu_digest,
+    menu_store,
+    profile_fingerprint,
+    recommendation_cache,
+)
+from config.config import Config
+
+# pages of a multi-page menu are extracted concurrently on this pool
+page_executor = ThreadPoolExecutor(max_workers=Config.MENU_BATCH_WORKERS, thread_name_prefix="menu-page")
+
+# Define Pydantic models for the JSON schema
+class Addon(BaseModel):
+    name: Optional[str] = Field(None, description="Add-on name (Preserve exact spelling)")
+    price: Optional[float] = Field(None, description="Price of the add-on")
+
+class Size(BaseModel):
+    size: Optional[str] = Field(None, description="Exact size label (Small/Medium/Large) OR specific weight/volume if available (e.g., '8 oz', '12 fl oz', '500g')")
+    price: Optional[float] = Field(None, description="Price for the given size")
+
+class MenuItem(BaseModel):
+    name: Optional[str] = Field(None, description="Dish Name (Preserve exact spelling and formatting as in image)")
+    sizes: List[Size] = Field(default_factory=list, description="List of sizes and prices for the dish")
+    description: Optional[str] = Field(None, description="Full description exactly as written, including ingredients if mentioned")
+    spiciness: Optional[str] = Field(None, description="Mild/Medium/Spicy if listed, otherwise null")
+    allergens: List[str] = Field(default_factory=list, description="List of allergens explicitly listed under 'Allergens', otherwise leave empty")
+    dietary_info: List[str] = Field(default_factory=list, description="List of dietary tags such as 'Vegan', 'Vegetarian', 'Gluten-Free', 'Dairy-Free' if explicitly stated, otherwise leave empty")
+    calories: Optional[str] = Field(None, description="Calories if explicitly listed (e.g., '840-1080' or '530'), otherwise null")
+    popularity: Optional[str] = Field(None, description="Bestseller/Chef's Recommendation/Seasonal Special if mentioned, otherwise null")
+    availability: Optional[str] = Field(None, description="All day/Lunch only/Weekends only if specified, otherwise null")
+    addons: List[Addon] = Field(default_factory=list, description="List of add-ons for the dish")
+
+class MenuCategory(RootModel):
+    root: List[MenuItem]
+
+class Menu(BaseModel):
+    menu: Dict[str, List[MenuItem]] = Field(..., description="Dictionary of menu categories with a list of menu items")
+
+
+# raised by the pipeline stages, carries the HTTP status the route should answer with
+class MenuExtractionError(Exception):
+    def __init__(self, message, status_code=500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+EXAMPLE_JSON = {
+    "menu": {
+        "APPETIZERS": [
+            {"name": "Shrimp Cocktail", "sizes": [{"size": "Regular", "price": 12.0}], "description": "Chilled shrimp with cocktail sauce", "spiciness": None, "allergens": [], "dietary_info": [], "calories": None, "popularity": None, "availability": None, "addons": []}
+        ],
+        "MAIN COURSES": [
+            {"name": "Grilled Salmon", "sizes": [{"size": "Regular", "price": 25.0}], "description": "Grilled salmon with roasted vegetables", "spiciness": None, "allergens": [], "dietary_info": [], "calories": None, "popularity": None, "availability": None, "addons": []},
+            {"name": "Pasta Carbonara", "sizes": [], "description": "Creamy pasta with pancetta and egg", "spiciness": None, "allergens": ["dairy", "gluten"], "dietary_info": [], "calories": "600", "popularity": "Chef's Recommendation", "availability": "All day", "addons": [{"name": "Add Chicken", "price": 5.0}]}
+        ],
+        "DRINKS": [
+            {"name": "Coke", "sizes": [{"size": "12 oz", "price": 2.5}]}
+        ]
+    }
+}
+
+EXTRACTION_PROMPT = (
+    "You are an AI assistant that extracts structured menu details from images of menu."
+    "It is of the highest priority that you preserve exact spelling and formatting from the image."
+    "Extract ALL relevant details from the menu image in strict JSON format, matching the schema exactly.\n"
+    f"Here's an example of the desired JSON structure:\n{json.dumps(EXAMPLE_JSON, indent=2)}\n\n"
+    "It is CRUCIAL to extract every menu category and all items within each category.\n"
+    "NOTE: The 'dietary_info' field must always be a list. If there's nothing, return an empty list []."
+    "IMPORTANT: The `price` must always be inside the `sizes` list as a dictionary with both `size` and `price` keys."
+    "If the size is not specified, use a default value like `Regular`"
+    "DO NOT place the `price` as a top-level field in the menu item."
+    "IMPORTANT: For prices, extract ONLY the numerical value with exactly two decimal places"
+    "For example, if you see '$10.89 840-1080 Cal.', the price should be 10.89.\n"
+    "Ensure dish names are exactly as written, and sizes include "
+    "weight (oz, g, lb) or volume (fl oz, ml) if specified.\n"
+    "Output MUST be valid JSON. If a field is not present in the image, "
+    "its value should be 'null' if nullable, or an empty list/string when appropriate.\n"
+    "Do NOT hallucinate. Only output JSON. Do NOT explain or include text outside the JSON structure."
+    "Now, extract the menu details from the given image."
+)
+
+
+# plain-data snapshot of the fields the recommendation prompt needs, so the
+# later stages never touch the SQLAlchemy session
+def user_profile(user):
+    return {
+        "user_id": user.user_id,
+        "age": user.age,
+        "food_restrictions": list(user.food_restrictions or []),
+        "food_preferences": list(user.food_preferences or []),
+    }
+
+
+# first LLM call: preprocessed image -> validated menu dict
+def extract_menu_data(prepared):
+    try:
+        with span("llm.extract"):
+            response = generate("extract", [EXTRACTION_PROMPT, prepared.as_part()])
+    except LLMTimeout as e:
+        raise MenuExtractionError(str(e), 504)
+    return parse_extraction(response)
+
+
+def parse_extraction(response):
+    if response.prompt_feedback and response.prompt_feedback.block_reason:
+        print(f"Blocked reason: {response.prompt_feedback.block_reason}")
+        raise MenuExtractionError(f"Blocked reason: {response.prompt_feedback.block_reason}", 400)
+
+    structured_data = None
+    try:
+        with span("menu.validate"):
+            json_string = response.text.strip()
+            structured_data = json.loads(json_string)
+            Menu.model_validate(structured_data)
+
+    except json.JSONDecodeError as e:
+        print(f"JSON Decode Error: {e}\nResponse Text: {response.text}")
+        raise MenuExtractionError(f"Failed to decode JSON: {e}", 500)
+
+    except ValidationError as e:
+        print(f"Pydantic Validation Error: {e}\nData: {structured_data}")
+        raise MenuExtractionError(f"Data validation failed: {e}", 400)
+
+    return structured_data
+
+
+def build_recommendation_prompt(menu_text, profile):
+    restrictions = ', '.join(profile["food_restrictions"]) if profile["food_restrictions"] else "None"
+    preferences = ', '.join(profile["food_preferences"]) if profile["food_preferences"] else "None"
+
+    return f"""
+    You are a helpful food assistant recommending 2 dishes to a customer based on their user profile.
+
+    User profile:
+    - Age: {profile["age"]}
+    - Allergens and dietary restrictions: {restrictions}
+    - Preferences: {preferences}
+
+    Your strict instructions:
+    1. Top Priority: Recommend ONLY dishes that fully avoid the user's allergens and dietary restrictions. If a dish commonly contains a restricted ingredient (e.g., dairy in gelato), exclude it—even if not explicitly listed.
+    2. Favor dishes that explicitly match the user's cuisine or dietary preferences (e.g., Chinese, Korean, Vegan). DO NOT make assumptions. If no dish matches preferences, pick the safest and most neutral options.
+    3. Do NOT say a dish matches a cuisine preference unless the connection is explicitly clear.
+    4. Do NOT fabricate or hallucinate non-existent reasons for recommendation (e.g., do not say espresso is “Asian cuisine”).
+    5. Rank the dishes by relevance and provide a match score from 1 to 100%.
+    6. Ignore dish categories entirely.
+
+    Return ONLY valid JSON in this format:
+    {{
+    "recommendations": [
+        {{
+        "name": "<Dish Name>",
+        "match_score": "<Match Score from 1 to 100>",
+        "reason": "<Why this dish suits the user based on their profile>"
+        }},
+        ...
+    ]
+    }}
+
+    Menu:
+    {menu_text}
+    """
+
+
+# second LLM call: menu + user profile -> list of recommendations. Dishes that
+# conflict with the user's exclusion restrictions (allergies, vegan, no pork,
+# ...) are dropped locally first, so the prompt only carries safe candidates
+# and no call is made when none are left; other restrictions such as Halal or
+# Low Carb are passed to the model with the rest of the profile. The estimated
+# tokens of the prompt the whole menu would have needed, and of the one sent,
+# are counted in metrics.py
+def recommend_dishes(menu, profile):
+    started = time.perf_counter()
+    candidates = filter_menu(menu, profile["food_restrictions"])
+    record_stage("recommendations.filter", time.perf_counter() - started)
+
+    full_tokens = estimate_tokens(build_recommendation_prompt(json.dumps(menu, indent=2), profile))
+    recommendation_prompt_tokens.inc("full", amount=full_tokens)
+    if not candidates:
+        recommendation_calls_skipped.inc()
+        recommendation_prompt_tokens.inc("saved", amount=full_tokens)
+        return []
+
+    prompt = build_recommendation_prompt(encode_candidates(candidates), profile)
+    prompt_tokens = estimate_tokens(prompt)
+    recommendation_prompt_tokens.inc("filtered", amount=prompt_tokens)
+    recommendation_prompt_tokens.inc("saved", amount=max(full_tokens - prompt_tokens, 0))
+    try:
+        with span("llm.recommend"):
+            recommendation_response = generate("recommend", [prompt])
+    except LLMTimeout as e:
+        raise MenuExtractionError(str(e), 504)
+
+    try:
+        recommendation_json = json.loads(recommendation_response.text.strip())
+    except json.JSONDecodeError as e:
+        print("Recommendation JSON error:", e)
+        recommendation_json = {"recommendations": []}
+
+    return recommendation_json.get("recommendations", [])
+
+
+# a photo already extracted reuses the validated extraction. Near matches are
+# limited to photos of the same restaurant, which is why each photo is cached
+# with the dishes it listed (see PerceptualMenuCache). stored_dishes returns
+# the dish keys stored for the restaurant; a near match is only served when it
+# lists all of them. max_distance overrides MENU_CACHE_MAX_DISTANCE
+def cached_extract_menu_data(prepared, restaurant_id=None, max_distance=None, stored_dishes=None):
+    def confirm(content):
+        return stored_dishes is None or stored_dishes() <= content
+
+    with span("menu_cache.lookup"):
+        image_hash = dhash(prepared.image)
+        structured_data = menu_cache.lookup(image_hash, scope=restaurant_id, max_distance=max_distance, confirm=confirm)
+    if structured_data is None:
+        structured_data = extract_menu_data(prepared)
+        menu_cache.set(image_hash, structured_data, scope=restaurant_id, content=_dish_names(structured_data["menu"]))
+    return structured_data
+
+
+# register a validated menu under its canonical digest and return the digest
+def store_menu(menu):
+    with span("menu.store"):
+        canonical = Menu.model_validate({"menu": menu}).model_dump(mode="json")["menu"]
+        digest = menu_digest(canonical)
+    menu_store.set(digest, menu)
+    return digest
+
+
+# recommendations for (menu, profile), memoized on (menu digest, profile fingerprint);
+# returns (recommendations, cached)
+def get_recommendations(menu, profile, digest=None):
+    if digest is None:
+        digest = store_menu(menu)
+
+    key = (digest, profile_fingerprint(profile))
+    recommendation_cache.remember(profile.get("user_id"), key)
+
+    recommendations = recommendation_cache.get(key)
+    if recommendations is not None:
+        return recommendations, True
+
+    try:
+        recommendations = recommend_dishes(menu, profile)
+    except Exception:
+        recommendation_cache.forget(profile.get("user_id"), key)
+        raise
+    recommendation_cache.set(key, recommendations)
+    return recommendations, False
+
+
+# full extract -> validate -> recommend pipeline over a preprocessed upload;
+# `report` is called with (stage, value) as partial results become available
+def run_menu_pipeline(
+    prepared, profile, report=None, with_recommendations=True, restaurant_id=None, stored_dishes=None
+):
+    structured_data = cached_extract_menu_data(prepared, restaurant_id, stored_dishes=stored_dishes)
+
+    digest = store_menu(structured_data["menu"])
+    if report:
+        report("menu", structured_data["menu"])
+        report("menu_digest", digest)
+
+    result = {
+        "menu": structured_data["menu"],
+        "menu_digest": digest,
+    }
+    if not with_recommendations:
+        return result
+
+    result["recommendations"], _ = get_recommendations(structured_data["menu"], profile, digest)
+    if report:
+        report("recommendations", result["recommendations"])
+
+    return result
+
+
+# same result shape as run_menu_pipeline for a menu already stored for the
+# restaurant (see restaurant_menus.restaurant_menu): no extraction call
+def run_stored_menu_pipeline(stored, profile, with_recommendations=True):
+    menu_store.set(stored["menu_digest"], stored["menu"])
+    result = {
+        "menu": stored["menu"],
+        "menu_digest": stored["menu_digest"],
+        "source": "restaurant",
+        "menu_version": stored["menu_version"],
+        "menu_updated_at": stored["updated_at"],
+    }
+    if with_recommendations:
+        result["recommendations"], _ = get_recommendations(stored["menu"], profile, stored["menu_digest"])
+    return result
+
+
+# streamed variant of the first LLM call: yields (category, items) as soon as
+# each category array is complete and validated, then checks the full document
+def stream_menu_data(prepared, parsed=None):
+    started = time.perf_counter()
+    response = stream("extract", [EXTRACTION_PROMPT, prepared.as_part()])
+
+    parser = IncrementalMenuParser()
+    try:
+        for chunk in response:
+            for category, items in parser.feed(chunk.text):
+                try:
+                    MenuCategory.model_validate(items)
+                except ValidationError as e:
+                    print(f"Pydantic Validation Error: {e}\nData: {items}")
+                    raise MenuExtractionError(f"Data validation failed: {e}", 400)
+                yield category, items
+    except ValueError:
+        # chunk.text raises when the candidate was blocked and has no parts
+        if response.prompt_feedback and response.prompt_feedback.block_reason:
+            print(f"Blocked reason: {response.prompt_feedback.block_reason}")
+            raise MenuExtractionError(f"Blocked reason: {response.prompt_feedback.block_reason}", 400)
+        raise
+    record_stage("llm.extract_stream", time.perf_counter() - started)
+
+    structured_data = None
+    try:
+        with span("menu.validate"):
+            structured_data = json.loads(parser.buffer.strip())
+            Menu.model_validate(structured_data)
+
+    except json.JSONDecodeError as e:
+        print(f"JSON Decode Error: {e}\nResponse Text: {parser.buffer}")
+        raise MenuExtractionError(f"Failed to decode JSON: {e}", 500)
+
+    except ValidationError as e:
+        print(f"Pydantic Validation Error: {e}\nData: {structured_data}")
+        raise MenuExtractionError(f"Data validation failed: {e}", 400)
+
+    if parsed is not None:
+        parsed.update(structured_data)
+
+
+# streamed pipeline: yields ("category", ...) events while the menu is being
+# generated and a final ("recommendations", ...) event
+def stream_menu_pipeline(prepared, profile):
+    with span("menu_cache.lookup"):
+        image_hash = dhash(prepared.image)
+        structured_data = menu_cache.lookup(image_hash)
+    if structured_data is not None:
+        for category, items in structured_data["menu"].items():
+            yield "category", {"name": category, "items": items}
+    else:
+        structured_data = {}
+        for category, items in stream_menu_data(prepared, parsed=structured_data):
+            yield "category", {"name": category, "items": items}
+        menu_cache.set(image_hash, structured_data)
+
+    digest = store_menu(structured_data["menu"])
+    yield "menu_digest", {"menu_digest": digest}
+
+    recommendations, _ = get_recommendations(structured_data["menu"], profile, digest)
+    yield "recommendations", {"recommendations": recommendations}
+
+
+def _normalize_name(name):
+    return " ".join(str(name).split()).casefold()
+
+
+# the dish keys a scan of this menu stores (see restaurant_menus.menu_keys)
+def _dish_names(menu):
+    return frozenset(normalize_dish_name(item["name"]) for items in menu.values() for item in items if item.get("name"))
+
+
+# combine per-page menus: categories with the same name (ignoring case and
+# spacing) are merged and an item repeated across pages is kept once, with
+# empty fields filled in from the later copy
+def merge_menus(menus):
+    merged = {}
+    categories = {}
+    seen_items = {}
+
+    for menu in menus:
+        for category, items in menu.items():
+            category_key = _normalize_name(category)
+            if category_key not in categories:
+                categories[category_key] = category
+                merged[category] = []
+                seen_items[category_key] = {}
+            target = merged[categories[category_key]]
+
+            for item in items:
+                if not item.get("name"):
+                    if item not in target:
+                        target.append(item)
+                    continue
+
+                item_key = _normalize_name(item["name"])
+                existing = seen_items[category_key].get(item_key)
+                if existing is None:
+                    existing = dict(item)
+                    seen_items[category_key][item_key] = existing
+                    target.append(existing)
+                    continue
+
+                for field, value in item.items():
+                    if value not in (None, "", []) and existing.get(field) in (None, "", []):
+                        existing[field] = value
+
+    return merged
+
+
+# pages of one menu share their layout, so a near match could be another
+# page of the same batch: exact hits only
+def _extract_page(stream):
+    return cached_extract_menu_data(preprocess_image(stream), max_distance=0)
+
+
+def _page_result(future):
+    try:
+        return future.result()
+    except Exception as e:
+        return e
+
+
+# multi-page variant: every page is preprocessed and extracted concurrently,
+# the menus are merged and a single recommendation pass runs over the result
+def run_batch_pipeline(streams, profile, with_recommendations=True):
+    # each page runs in a copy of this request's context so its spans are
+    # attributed to the request
+    futures = [page_executor.submit(contextvars.copy_context().run, _extract_page, stream) for stream in streams]
+    results = [_page_result(future) for future in futures]
+
+    menus = []
+    pages = []
+    first_error = None
+    for page, result in enumerate(results, start=1):
+        if isinstance(result, Exception):
+            print(f"Menu page {page} failed: {result}")
+            first_error = first_error or result
+            pages.append({"page": page, "error": str(result)})
+            continue
+
+        structured_data = result
+        menus.append(structured_data["menu"])
+        pages.append({"page": page, "categories": len(structured_data["menu"])})
+
+    if not menus:
+        raise first_error
+
+    menu = merge_menus(menus)
+    digest = store_menu(menu)
+    result = {
+        "menu": menu,
+        "menu_digest": digest,
+        "pages": pages,
+    }
+    if with_recommendations:
+        result["recommendations"], _ = get_recommendations(menu, profile, digest)
+
+    return result
@@ -0,0 +1,55 @@
+import json
+
+
+# incremental scanner for the {"menu": {"<category>": [ ...items ]}} document
+# the model streams back; every time a category array closes it is returned
+# as (name, items) without waiting for the rest of the document
+class IncrementalMenuParser:
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_key = None
+        self._array_start = None
+
+    def feed(self, text):
+        self.buffer += text
+        completed = []
+        buffer = self.buffer
+
+        for i in range(self._pos, len(buffer)):
+            char = buffer[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    # strings directly inside the menu object are category names
+                    if self._depth == 2:
+                        self._last_key = buffer[self._string_start:i + 1]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char in "{[":
+                self._depth += 1
+                if char == "[" and self._depth == 3:
+                    self._array_start = i
+            elif char in "}]":
+                if char == "]" and self._depth == 3 and self._array_start is not None:
+                    completed.append((
+                        json.loads(self._last_key),
+                        json.loads(buffer[self._array_start:i + 1]),
+                    ))
+                    self._array_start = None
+                self._depth -= 1
+
+        self._pos = len(buffer)
+        return completed
@@ -0,0 +1,286 @@
+import contextvars
+import hmac
+import threading
+import time
+from contextlib import contextmanager
+from flask import Response, g, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config.config import Config
+
+# default buckets (seconds), from a cached vote lookup up to a slow Gemini call
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# Cumulative Prometheus histogram keyed on label values
+class Histogram:
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    # {label values: (count, sum)}, for diffing two snapshots
+    def totals(self):
+        with self._lock:
+            return {key: (count, total) for key, (_, total, count) in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, [list(counts), total, count]) for key, (counts, total, count) in self._series.items())
+        for label_values, (counts, total, count) in series:
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _format_labels(self.labels, label_values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.labels, label_values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {total:.6f}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+# Prometheus counter keyed on label values
+class Counter:
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def totals(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.totals().items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+request_seconds = Histogram(
+    "menuvision_request_duration_seconds",
+    "Time to serve a request, including streamed bodies",
+    labels=("method", "route", "status"),
+)
+stage_seconds = Histogram(
+    "menuvision_stage_duration_seconds",
+    "Time spent in a pipeline stage or outbound call",
+    labels=("stage",),
+)
+query_seconds = Histogram(
+    "menuvision_db_query_duration_seconds",
+    "Time of a single SQL statement",
+    labels=("route",),
+)
+queries_per_request = Histogram(
+    "menuvision_db_queries_per_request",
+    "SQL statements issued while serving one request",
+    labels=("method", "route"),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+llm_attempt_seconds = Histogram(
+    "menuvision_llm_attempt_duration_seconds",
+    "Time of one successful LLM attempt (primary, hedge, retry or fallback)",
+    labels=("stage", "model"),
+)
+llm_events = Counter(
+    "menuvision_llm_events_total",
+    "LLM calls, attempts started by kind, winners, errors and deadline misses",
+    labels=("stage", "event"),
+)
+recommendation_prompt_tokens = Counter(
+    "menuvision_recommendation_prompt_tokens_total",
+    "Estimated recommendation prompt tokens: whole menu (full), filtered candidates sent (filtered), difference (saved)",
+    labels=("prompt",),
+)
+recommendation_calls_skipped = Counter(
+    "menuvision_recommendation_calls_skipped_total",
+    "Recommendation model calls skipped because no dish passed the dietary filter",
+)
+image_bytes = Counter(
+    "menuvision_image_bytes_total",
+    "Upload bytes received (input), sent to the model after preprocessing (output) and saved (saved)",
+    labels=("kind",),
+)
+ALL_METRICS = (
+    request_seconds,
+    stage_seconds,
+    query_seconds,
+    queries_per_request,
+    llm_attempt_seconds,
+    llm_events,
+    recommendation_prompt_tokens,
+    recommendation_calls_skipped,
+    image_bytes,
+)
+
+
+# stages and SQL statements of the request being served
+class RequestTrace:
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.queries = 0
+        self.query_seconds = 0.0
+        self._lock = threading.Lock()
+
+    # pages of a batch run in parallel, so spans can arrive from several threads
+    def add_stage(self, stage, seconds):
+        with self._lock:
+            count, total = self.stages.get(stage, (0, 0.0))
+            self.stages[stage] = (count + 1, total + seconds)
+
+    def add_query(self, seconds):
+        with self._lock:
+            self.queries += 1
+            self.query_seconds += seconds
+
+    def breakdown(self):
+        with self._lock:
+            stages = sorted(self.stages.items(), key=lambda item: -item[1][1])
+            parts = [f"db {self.queries} queries {self.query_seconds * 1000:.1f} ms"]
+        for stage, (count, total) in stages:
+            parts.append(f"{stage} {total * 1000:.1f} ms" + (f" x{count}" if count > 1 else ""))
+        return ", ".join(parts)
+
+
+# Executor threads copy the context of the thread that
+# hands them work, so spans recorded there still land on the right request.
+_current_trace = contextvars.ContextVar("request_trace", default=None)
+
+
+# set by init_metrics; with METRICS_ENABLED=0 stages are not recorded and SQL
+# statements are not timed
+_enabled = False
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def record_stage(stage, seconds):
+    if not _enabled:
+        return
+    stage_seconds.observe(seconds, stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_stage(stage, seconds)
+
+
+# with span("gemini.extract"): ... times the block as one pipeline stage
+@contextmanager
+def span(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # a connection runs one statement at a time
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info.pop("query_started", time.perf_counter())
+    trace = _current_trace.get()
+    # statements from the rescoring scheduler, vote flusher etc. have no request
+    query_seconds.observe(seconds, trace.route if trace is not None else "<background>")
+    if trace is not None:
+        trace.add_query(seconds)
+
+
+def render_metrics():
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+
+
+# SQL timing, request hooks and, when METRICS_TOKEN is set, the Prometheus
+# endpoint at /metrics (scraped with "Authorization: Bearer <token>")
+def init_metrics(app):
+    global _enabled
+    _enabled = True
+    # every Engine, so the listeners are installed once per process
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    @app.before_request
+    def start_trace():
+        g.trace = RequestTrace(_route())
+        _current_trace.set(g.trace)
+
+    @app.after_request
+    def remember_status(response):
+        g.response_status = response.status_code
+        return response
+
+    # runs after a streamed body has been sent, so SSE responses are timed in full
+    @app.teardown_request
+    def finish_trace(exc):
+        trace = g.pop("trace", None)
+        _current_trace.set(None)
+        if trace is None:
+            return
+
+        seconds = time.perf_counter() - trace.started
+        status = 500 if exc is not None else g.get("response_status", 500)
+        request_seconds.observe(seconds, request.method, trace.route, str(status))
+        queries_per_request.observe(trace.queries, request.method, trace.route)
+
+        if Config.SLOW_REQUEST_MS and seconds * 1000 >= Config.SLOW_REQUEST_MS:
+            print(
+                f"Slow request: {request.method} {request.path} -> {status} in {seconds * 1000:.0f} ms "
+                f"({trace.breakdown()})"
+            )
+
+    if not Config.METRICS_TOKEN:
+        return
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        expected = f"Bearer {Config.METRICS_TOKEN}".encode("utf-8")
+        if not hmac.compare_digest(request.headers.get("Authorization", "").encode("utf-8"), expected):
+            return jsonify({"error": "Unauthorized"}), 401
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
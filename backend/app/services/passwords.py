@@ -0,0 +1,63 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+import requests
+from requests.adapters import HTTPAdapter
+from app.services.metrics import span
+from config.config import Config
+
+# prefixes of the bcrypt hashes produced by the crypto API at signup
+BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
+
+
+# bcrypt only looks at the first 72 bytes of the password
+def _bcrypt_check(plain, hashed):
+    return bcrypt.checkpw(plain.encode("utf-8")[:72], hashed.encode("utf-8"))
+
+
+# Verify against the stored hash in-process. Returns None when the hash is
+# not in a format we can check locally.
+def verify_local(plain, hashed):
+    if not hashed or not hashed.startswith(BCRYPT_PREFIXES):
+        return None
+    # bcrypt releases the GIL, but hashing is deliberately slow; the bounded
+    # pool keeps a burst of logins from tying up every request thread's CPU
+    try:
+        with span("password.bcrypt"):
+            return hash_executor.submit(_bcrypt_check, plain, hashed).result(timeout=Config.PASSWORD_HASH_TIMEOUT)
+    except ValueError:
+        # malformed hash
+        return False
+
+
+# the original path: ask the crypto API's validate endpoint
+def verify_remote(plain, hashed):
+    validate_url = f"{os.environ.get('HASH_API_KEY')}validate"
+    params = {"plain": plain, "hashed": hashed}
+    timeout = (Config.HASH_API_CONNECT_TIMEOUT, Config.HASH_API_READ_TIMEOUT)
+    with span("password.hash_api"):
+        response = hash_session.get(validate_url, params=params, timeout=timeout)
+    return bool(response.json().get("valid"))
+
+
+# PASSWORD_VERIFIER=local checks bcrypt hashes in-process and only calls the
+# crypto API for hashes it does not recognise; =remote always calls the API
+def verify_password(plain, hashed, mode=None):
+    mode = mode or Config.PASSWORD_VERIFIER
+    if mode == "local":
+        valid = verify_local(plain, hashed)
+        if valid is not None:
+            return valid
+    return verify_remote(plain, hashed)
+
+
+def _make_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Config.HASH_API_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+hash_executor = ThreadPoolExecutor(max_workers=Config.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+hash_session = _make_session()
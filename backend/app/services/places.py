@@ -0,0 +1,209 @@
+import math
+import os
+import time
+from datetime import datetime, timezone
+import requests
+from requests.adapters import HTTPAdapter
+from app.services.cache import TTLCache
+from app.services.metrics import span
+from config.config import Config
+
+PLACES_FIELD_MASK = (
+    "places.id,places.displayName,places.formattedAddress,places.priceLevel,places.rating,"
+    "places.currentOpeningHours,places.generativeSummary.description,places.generativeSummary.overview"
+)
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+EARTH_RADIUS_M = 6_371_000
+
+
+# standard base32 geohash; precision 7 is a tile of roughly 150 m x 150 m
+def geohash(latitude, longitude, precision=7):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+# the tile of the point and the eight tiles around it
+def geohash_neighbourhood(latitude, longitude, precision=7):
+    lat_bits = (precision * 5) // 2
+    lon_bits = precision * 5 - lat_bits
+    lat_step = 180.0 / (1 << lat_bits)
+    lon_step = 360.0 / (1 << lon_bits)
+
+    tiles = []
+    for dlat in (0, -lat_step, lat_step):
+        for dlon in (0, -lon_step, lon_step):
+            lat = min(max(latitude + dlat, -90.0), 90.0)
+            lon = (longitude + dlon + 180.0) % 360.0 - 180.0
+            tile = geohash(lat, lon, precision)
+            if tile not in tiles:
+                tiles.append(tile)
+    return tiles
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def _parse_time(value):
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+
+
+# seconds the response stays accurate: until the earliest restaurant in it
+# opens or closes, capped at max_ttl and never below min_ttl
+def opening_hours_ttl(body, max_ttl, min_ttl=60):
+    now = datetime.now(timezone.utc)
+    ttl = max_ttl
+    for place in body.get("places") or []:
+        hours = place.get("currentOpeningHours") or {}
+        for field in ("nextOpenTime", "nextCloseTime"):
+            changes_at = _parse_time(hours.get(field))
+            if changes_at is not None:
+                ttl = min(ttl, (changes_at - now).total_seconds())
+    return max(min_ttl, int(ttl))
+
+
+# Nearby-search results keyed on (geohash tile, radius). A stored result is
+# reused for any request whose point lies within max_distance_m of the point
+# it was fetched for, searching the request's tile and its neighbours.
+class PlacesTileCache(TTLCache):
+    def __init__(self, maxsize=4096, ttl=900, precision=7, max_distance_m=75):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.precision = precision
+        self.max_distance_m = max_distance_m
+        self.neighbour_hits = 0
+
+    def lookup(self, latitude, longitude, radius):
+        tiles = geohash_neighbourhood(latitude, longitude, self.precision)
+        now = time.monotonic()
+        with self._lock:
+            # one hit or miss per lookup, however many tiles were probed
+            for tile in tiles:
+                entry = self._entries.get((tile, radius))
+                if entry is None or entry[0] <= now:
+                    continue
+                center, body = entry[1]
+                if distance_m(latitude, longitude, center[0], center[1]) <= self.max_distance_m:
+                    self._entries.move_to_end((tile, radius))
+                    self.hits += 1
+                    if tile != tiles[0]:
+                        self.neighbour_hits += 1
+                    return body
+
+            self.misses += 1
+        return None
+
+    def store(self, latitude, longitude, radius, body, ttl=None):
+        self.set((geohash(latitude, longitude, self.precision), radius), ((latitude, longitude), body), ttl=ttl)
+
+    def stats(self):
+        return dict(
+            super().stats(),
+            neighbour_hits=self.neighbour_hits,
+            precision=self.precision,
+            max_distance_m=self.max_distance_m,
+        )
+
+
+# error from the Places API or the connection to it
+class PlacesError(Exception):
+    def __init__(self, message, status_code=502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# one keep-alive connection pool shared by every request thread
+def make_session(pool_size=None):
+    pool_size = pool_size or Config.PLACES_POOL_SIZE
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def places_request(latitude, longitude, radius):
+    headers = {
+        "Content-Type": "application/json",
+        "X-Goog-Api-Key": os.getenv("GOOGLE_MAPS_API_KEY"),
+        "X-Goog-FieldMask": PLACES_FIELD_MASK,
+    }
+    data = {
+        "includedTypes": ["restaurant"],
+        "maxResultCount": 20,
+        "locationRestriction": {
+            "circle": {
+                "center": {
+                    "latitude": latitude,
+                    "longitude": longitude,
+                },
+                "radius": radius,
+            }
+        },
+    }
+    return headers, data
+
+
+# restaurants around (latitude, longitude); returns (body, cached)
+def search_nearby(latitude, longitude, radius=500, use_cache=True):
+    if use_cache and places_cache.ttl > 0:
+        body = places_cache.lookup(latitude, longitude, radius)
+        if body is not None:
+            return body, True
+
+    headers, data = places_request(latitude, longitude, radius)
+    timeout = (Config.PLACES_CONNECT_TIMEOUT, Config.PLACES_READ_TIMEOUT)
+    try:
+        with span("places.search"):
+            response = places_session.post(Config.PLACES_API_URL, headers=headers, json=data, timeout=timeout)
+    except requests.Timeout:
+        raise PlacesError("Places API timed out", 504)
+    except requests.RequestException as e:
+        print(f"Places API error: {e}")
+        raise PlacesError("Places API is unreachable", 502)
+
+    try:
+        body = response.json()
+    except ValueError:
+        raise PlacesError(f"Places API returned {response.status_code}", 502)
+
+    if response.ok and use_cache and places_cache.ttl > 0:
+        places_cache.store(latitude, longitude, radius, body, ttl=opening_hours_ttl(body, places_cache.ttl))
+    return body, False
+
+
+places_session = make_session()
+
+places_cache = PlacesTileCache(
+    maxsize=Config.PLACES_CACHE_SIZE,
+    ttl=Config.PLACES_CACHE_TTL,
+    precision=Config.PLACES_CACHE_PRECISION,
+    max_distance_m=Config.PLACES_CACHE_MAX_DISTANCE_M,
+)
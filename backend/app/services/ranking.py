@@ -0,0 +1,25 @@
+from datetime import datetime
+
+# Weighted average (90% votes, 10% time)
+VOTE_WEIGHT = 0.9
+TIME_WEIGHT = 0.1
+
+# rating points per net vote and the numerator of the time score
+VOTE_POINTS = VOTE_WEIGHT * 100
+TIME_POINTS = 1000 * TIME_WEIGHT
+
+
+def hot(ups, downs, date):
+    # Calculate net score
+    net_score = ups - downs
+    
+    # Calculate time score (decreasing with age)
+    days_old = (datetime.now() - date).days + 1
+    time_score = 1000 / days_old  # Higher for newer items
+    
+    return (net_score * VOTE_WEIGHT * 100) + (time_score * TIME_WEIGHT)
+
+
+# change in rating caused by a vote; the time part is left to the rescoring job
+def vote_rating_delta(up_delta, down_delta):
+    return round((up_delta - down_delta) * VOTE_POINTS)
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import threading
+from app.services.cache import TTLCache
+from config.config import Config
+
+
+def _digest(value):
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# stable id for a validated menu, independent of key order and whitespace
+def menu_digest(menu):
+    return _digest(menu)
+
+
+def _normalize_terms(terms):
+    return sorted({" ".join(str(term).casefold().split()) for term in terms or [] if str(term).strip()})
+
+
+# users with the same restrictions, preferences and age bucket share recommendations
+def profile_fingerprint(profile):
+    age = profile.get("age")
+    return _digest({
+        "age_bucket": None if age is None else age // Config.RECOMMENDATION_AGE_BUCKET,
+        "food_restrictions": _normalize_terms(profile.get("food_restrictions")),
+        "food_preferences": _normalize_terms(profile.get("food_preferences")),
+    })
+
+
+# recommendation cache keyed on (menu digest, profile fingerprint) that also
+# remembers which users populated each entry so a profile edit can drop them;
+# the user index only holds keys still in the cache, so it is pruned whenever
+# an entry expires or is evicted
+class RecommendationCache(TTLCache):
+    def __init__(self, maxsize=1024, ttl=3600):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self._keys_by_user = {}
+        self._users_by_key = {}
+        self._index_lock = threading.Lock()
+
+    def remember(self, user_id, key):
+        if user_id is None:
+            return
+        with self._index_lock:
+            self._keys_by_user.setdefault(user_id, set()).add(key)
+            self._users_by_key.setdefault(key, set()).add(user_id)
+
+    # drop a key remembered for a user whose entry was never stored
+    def forget(self, user_id, key):
+        with self._index_lock:
+            self._unlink(user_id, key)
+
+    def invalidate_user(self, user_id):
+        with self._index_lock:
+            keys = list(self._keys_by_user.get(user_id, ()))
+        for key in keys:
+            self.pop(key)
+        self.forget_user(user_id)
+        return len(keys)
+
+    def forget_user(self, user_id):
+        with self._index_lock:
+            for key in self._keys_by_user.pop(user_id, set()):
+                self._unlink(user_id, key)
+
+    def _unlink(self, user_id, key):
+        keys = self._keys_by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[user_id]
+        users = self._users_by_key.get(key)
+        if users is not None:
+            users.discard(user_id)
+            if not users:
+                del self._users_by_key[key]
+
+    def _removed(self, key):
+        with self._index_lock:
+            for user_id in self._users_by_key.pop(key, set()):
+                keys = self._keys_by_user.get(user_id)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._keys_by_user[user_id]
+
+    def stats(self):
+        stats = super().stats()
+        with self._index_lock:
+            stats["indexed_users"] = len(self._keys_by_user)
+        return stats
+
+
+# validated menus by digest, so recommendations can be requested by digest alone
+menu_store = TTLCache(maxsize=Config.MENU_STORE_SIZE, ttl=Config.MENU_CACHE_TTL)
+
+recommendation_cache = RecommendationCache(
+    maxsize=Config.RECOMMENDATION_CACHE_SIZE,
+    ttl=Config.RECOMMENDATION_CACHE_TTL,
+)
@@ -0,0 +1,149 @@
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import text
+from app.database import db
+from app.services.ranking import TIME_POINTS, VOTE_POINTS
+from config.config import Config
+
+# arbitrary key for pg_try_advisory_lock so only one process rescores at a time
+RESCORE_LOCK_KEY = 7_310_442
+
+# hot() of the ar_models row `m` at :now, in SQL
+HOT_RATING_SQL = """
+    ROUND(
+        (COALESCE(m.up_votes, 0) - COALESCE(m.down_votes, 0)) * :vote_points
+        + :time_points / (
+            GREATEST(FLOOR(EXTRACT(EPOCH FROM (:now - COALESCE(m.uploaded_at, :now))) / 86400), 0) + 1
+        )
+    )
+"""
+
+# Recompute hot() for one chunk of models (in model_id order) as a single
+# set-based UPDATE. Rows whose rating would not change are skipped so an idle
+# catalogue costs reads only. The rating is computed in SET from the row being
+# updated, not in a CTE: when a vote commits on a row after this statement
+# started, the row is re-read once its lock is released and the new rating
+# includes that vote.
+RESCORE_CHUNK_SQL = text(f"""
+    WITH batch AS (
+        SELECT model_id
+        FROM ar_models
+        WHERE model_id > :after
+        ORDER BY model_id
+        LIMIT :chunk_size
+    ),
+    updated AS (
+        UPDATE ar_models AS m
+        SET model_rating = {HOT_RATING_SQL}
+        FROM batch
+        WHERE m.model_id = batch.model_id
+          AND m.model_rating IS DISTINCT FROM {HOT_RATING_SQL}
+        RETURNING m.model_id
+    )
+    SELECT (SELECT count(*) FROM batch) AS scanned,
+           (SELECT count(*) FROM updated) AS updated,
+           (SELECT max(model_id) FROM batch) AS last_id
+""")
+
+# progress of the current/last run, served on /ar/rescore/status
+rescore_status = {
+    "running": False,
+    "runs": 0,
+    "started_at": None,
+    "finished_at": None,
+    "duration_s": None,
+    "chunks": 0,
+    "rows_scanned": 0,
+    "rows_updated": 0,
+    "rows_per_second": None,
+    "last_error": None,
+}
+
+
+# Rescore every model in chunks of chunk_size, each chunk in its own short
+# transaction. Returns False without doing anything when another process
+# holds the rescoring lock.
+def rescore_all_models(chunk_size=None, engine=None):
+    chunk_size = chunk_size or Config.RESCORE_CHUNK_SIZE
+    engine = engine or db.engine
+
+    with engine.connect() as connection:
+        locked = connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": RESCORE_LOCK_KEY}).scalar()
+        connection.commit()
+        if not locked:
+            return False
+
+        started = time.perf_counter()
+        rescore_status.update(
+            running=True,
+            started_at=datetime.utcnow().isoformat(),
+            chunks=0,
+            rows_scanned=0,
+            rows_updated=0,
+            last_error=None,
+        )
+        try:
+            now = datetime.now()
+            after = ""
+            while True:
+                row = connection.execute(RESCORE_CHUNK_SQL, {
+                    "after": after,
+                    "chunk_size": chunk_size,
+                    "vote_points": VOTE_POINTS,
+                    "time_points": TIME_POINTS,
+                    "now": now,
+                }).one()
+                connection.commit()
+
+                if not row.scanned:
+                    break
+
+                after = row.last_id
+                elapsed = time.perf_counter() - started
+                rescore_status["chunks"] += 1
+                rescore_status["rows_scanned"] += row.scanned
+                rescore_status["rows_updated"] += row.updated
+                rescore_status["rows_per_second"] = round(rescore_status["rows_scanned"] / elapsed) if elapsed else None
+        except Exception as e:
+            connection.rollback()
+            rescore_status["last_error"] = str(e)
+            raise
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": RESCORE_LOCK_KEY})
+            connection.commit()
+            duration = time.perf_counter() - started
+            rescore_status.update(
+                running=False,
+                runs=rescore_status["runs"] + 1,
+                finished_at=datetime.utcnow().isoformat(),
+                duration_s=round(duration, 3),
+            )
+
+    return True
+
+
+# Daemon thread that rescores every RESCORE_INTERVAL_SECONDS. The SQL above is
+# Postgres-only, so the scheduler is not started against other databases.
+def start_rescore_scheduler(app):
+    interval = Config.RESCORE_INTERVAL_SECONDS
+    if interval <= 0:
+        return None
+
+    with app.app_context():
+        if db.engine.dialect.name != "postgresql":
+            print("Model rescoring disabled: requires PostgreSQL")
+            return None
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                with app.app_context():
+                    rescore_all_models()
+            except Exception as e:
+                print(f"Model rescoring failed: {e}")
+
+    thread = threading.Thread(target=loop, name="model-rescoring", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,209 @@
+from datetime import datetime, timedelta
+from sqlalchemy import and_, case, func
+from app.database import db
+from app.models import DishItem, Restaurant
+from app.services.image_search import normalize_dish_name
+from app.services.menu_pipeline import Menu
+from app.services.metrics import span
+from app.services.recommendations import menu_digest
+from config.config import Config
+
+# columns rewritten when a scanned dish is seen again
+UPSERT_COLUMNS = (
+    "dish_name",
+    "description",
+    "price",
+    "nutritional_info",
+    "allergens",
+    "menu_category",
+    "menu_position",
+    "menu_version",
+    "menu_item",
+    "updated_at",
+)
+
+# the upsert goes through Core: ORM bulk inserts split the rows into batches
+# whenever their parameter sets differ
+dish_items = DishItem.__table__
+
+
+def _insert():
+    if db.engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(dish_items)
+
+
+# INSERT ... ON CONFLICT (restaurant_id, menu_key) WHERE menu_key IS NOT NULL
+# DO UPDATE, matching uq_dish_items_restaurant_menu_key. A merged scan keeps
+# the menu_position of dishes already on the current menu.
+def _upsert_statement(keep_position=False):
+    statement = _insert()
+    set_ = {column: statement.excluded[column] for column in UPSERT_COLUMNS}
+    if keep_position:
+        set_["menu_position"] = case(
+            (dish_items.c.menu_version == statement.excluded.menu_version, dish_items.c.menu_position),
+            else_=statement.excluded.menu_position,
+        )
+    return statement.on_conflict_do_update(
+        index_elements=[dish_items.c.restaurant_id, dish_items.c.menu_key],
+        index_where=dish_items.c.menu_key.isnot(None),
+        set_=set_,
+    )
+
+
+# dish_items row for a validated MenuItem; the cheapest size is the listed
+# price (0 when the menu shows none) and the item itself is kept whole
+def _dish_row(restaurant_id, category, position, item, version, now):
+    prices = [size["price"] for size in item["sizes"] if size.get("price") is not None]
+    return {
+        "restaurant_id": restaurant_id,
+        "dish_name": item["name"],
+        "description": item.get("description"),
+        "price": min(prices) if prices else 0,
+        "nutritional_info": item.get("calories"),
+        "allergens": ", ".join(item["allergens"]) or None,
+        "menu_key": normalize_dish_name(item["name"]),
+        "menu_category": category,
+        "menu_position": position,
+        "menu_version": version,
+        "menu_item": item,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+# Store a validated scan in the restaurant's menu: every named item is
+# upserted into dish_items in one batched statement. A scan usually shows one
+# page (or only the drinks or lunch menu), so by default its dishes are merged
+# into the current menu_version and the other pages stay listed; with
+# replace=True the scan is the whole menu and the version is bumped, which
+# retires dishes that are no longer listed. A scan identical to the stored
+# menu (same digest) only refreshes menu_updated_at. The restaurant is
+# created when it is not known yet. Returns the version.
+def save_restaurant_menu(restaurant_id, menu, digest, name=None, replace=False):
+    now = datetime.utcnow()
+    restaurant = db.session.query(Restaurant).filter_by(restaurant_id=restaurant_id).with_for_update().first()
+    if restaurant is None:
+        restaurant = Restaurant(restaurant_id=restaurant_id, name=name or restaurant_id, menu_version=0)
+        db.session.add(restaurant)
+
+    if restaurant.menu_digest == digest and restaurant.menu_version:
+        restaurant.menu_updated_at = now
+        db.session.commit()
+        return restaurant.menu_version
+
+    with span("restaurant_menu.save"):
+        canonical = Menu.model_validate({"menu": menu}).model_dump(mode="json")["menu"]
+        current = restaurant.menu_version or 0
+        merge = bool(current) and not replace
+        version = current if merge else current + 1
+
+        # merged dishes new to the menu go after the ones already listed
+        position = 0
+        if merge:
+            last = (
+                db.session.query(func.max(DishItem.menu_position))
+                .filter(DishItem.restaurant_id == restaurant_id, DishItem.menu_version == version)
+                .scalar()
+            )
+            position = 0 if last is None else last + 1
+
+        rows = {}
+        for category, items in canonical.items():
+            for item in items:
+                if not item.get("name"):
+                    continue
+                row = _dish_row(restaurant_id, category, position + len(rows), item, version, now)
+                # the same dish under two categories is stored once, where it first appears
+                rows.setdefault(row["menu_key"], row)
+
+        # the restaurant row has to exist before the dishes referencing it
+        db.session.flush()
+        if rows:
+            db.session.execute(_upsert_statement(keep_position=merge), list(rows.values()))
+
+        restaurant.menu_version = version
+        # the digest is that of the menu restaurant_menu serves: after a merge
+        # it is more than this scan, and duplicate or unnamed items are not stored
+        restaurant.menu_digest = menu_digest(_stored_menu(restaurant_id, version))
+        restaurant.menu_updated_at = now
+        db.session.commit()
+
+    return version
+
+
+# {category: [items]} of one menu version, in menu order
+def _stored_menu(restaurant_id, version):
+    rows = (
+        db.session.query(DishItem.menu_category, DishItem.menu_item)
+        .filter(DishItem.restaurant_id == restaurant_id, DishItem.menu_version == version)
+        .order_by(DishItem.menu_position)
+        .all()
+    )
+    menu = {}
+    for row in rows:
+        menu.setdefault(row.menu_category, []).append(row.menu_item)
+    return menu
+
+
+# normalized names of the dishes on the restaurant's current menu, empty when
+# it was never scanned
+def menu_keys(restaurant_id):
+    with span("restaurant_menu.keys"):
+        rows = (
+            db.session.query(DishItem.menu_key)
+            .join(Restaurant, and_(
+                Restaurant.restaurant_id == DishItem.restaurant_id,
+                Restaurant.menu_version == DishItem.menu_version,
+            ))
+            .filter(DishItem.restaurant_id == restaurant_id, DishItem.menu_key.isnot(None))
+            .all()
+        )
+    return frozenset(row.menu_key for row in rows)
+
+
+def is_fresh(updated_at):
+    return updated_at is not None and datetime.utcnow() - updated_at <= timedelta(seconds=Config.RESTAURANT_MENU_MAX_AGE)
+
+
+# The restaurant's current menu rebuilt from its dish_items in one query, or
+# None when the restaurant is unknown or has never been scanned.
+def restaurant_menu(restaurant_id):
+    with span("restaurant_menu.load"):
+        rows = (
+            db.session.query(
+                Restaurant.name,
+                Restaurant.menu_version,
+                Restaurant.menu_digest,
+                Restaurant.menu_updated_at,
+                DishItem.menu_category,
+                DishItem.menu_item,
+            )
+            .outerjoin(DishItem, and_(
+                DishItem.restaurant_id == Restaurant.restaurant_id,
+                DishItem.menu_version == Restaurant.menu_version,
+            ))
+            .filter(Restaurant.restaurant_id == restaurant_id)
+            .order_by(DishItem.menu_position)
+            .all()
+        )
+    if not rows or not rows[0].menu_version:
+        return None
+
+    menu = {}
+    for row in rows:
+        if row.menu_item is not None:
+            menu.setdefault(row.menu_category, []).append(row.menu_item)
+
+    first = rows[0]
+    return {
+        "restaurant_id": restaurant_id,
+        "name": first.name,
+        "menu": menu,
+        "menu_digest": first.menu_digest,
+        "menu_version": first.menu_version,
+        "updated_at": first.menu_updated_at.isoformat() if first.menu_updated_at else None,
+        "fresh": is_fresh(first.menu_updated_at),
+    }
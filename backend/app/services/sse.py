@@ -0,0 +1,13 @@
+import json
+
+
+# format one Server-Sent Events frame with a JSON payload
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # stop nginx/heroku style proxies from buffering the stream
+    "X-Accel-Buffering": "no",
+}
@@ -0,0 +1,197 @@
+import atexit
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import text
+from app.database import db
+from app.services.ranking import VOTE_POINTS
+from config.config import Config
+
+# Apply a whole batch of (model_id, user_id, review, voted_at) votes in one
+# statement: rows for unknown models/users are dropped, each rating is
+# upserted (only when the review changes and the stored rating is older than
+# the vote), and the per-model counter deltas are summed and applied relative
+# to the current counters. The rated_at guard makes the last vote win even
+# when another gunicorn worker flushes an older one after it.
+FLUSH_SQL = text("""
+    WITH incoming AS (
+        SELECT t.model_id, t.user_id, t.review, t.voted_at
+        FROM unnest(
+                 CAST(:model_ids AS varchar[]),
+                 CAST(:user_ids AS integer[]),
+                 CAST(:reviews AS varchar[]),
+                 CAST(:voted_at AS timestamp[])
+             ) AS t(model_id, user_id, review, voted_at)
+        JOIN ar_models ON ar_models.model_id = t.model_id
+        JOIN users ON users.user_id = t.user_id
+    ),
+    vote AS (
+        INSERT INTO model_ratings (model_id, user_id, review, rated_at)
+        SELECT model_id, user_id, review, voted_at FROM incoming
+        ON CONFLICT (model_id, user_id) DO UPDATE
+            SET review = EXCLUDED.review, rated_at = EXCLUDED.rated_at
+            WHERE model_ratings.review IS DISTINCT FROM EXCLUDED.review
+              AND (model_ratings.rated_at IS NULL OR model_ratings.rated_at < EXCLUDED.rated_at)
+        RETURNING model_id, review, (xmax = 0) AS inserted
+    ),
+    delta AS (
+        SELECT model_id,
+               SUM(CASE WHEN review = 'up' THEN 1 WHEN inserted THEN 0 ELSE -1 END) AS up,
+               SUM(CASE WHEN review = 'down' THEN 1 WHEN inserted THEN 0 ELSE -1 END) AS down
+        FROM vote
+        GROUP BY model_id
+    )
+    UPDATE ar_models AS m
+    SET up_votes = COALESCE(m.up_votes, 0) + delta.up,
+        down_votes = COALESCE(m.down_votes, 0) + delta.down,
+        model_rating = COALESCE(m.model_rating, 0) + ROUND((delta.up - delta.down) * :vote_points)
+    FROM delta
+    WHERE m.model_id = delta.model_id
+""")
+
+
+# Write-behind buffer for votes. Votes are collapsed per (model_id, user_id)
+# so only the last one is written, and a background thread flushes them every
+# flush_interval_ms or as soon as max_entries are waiting. Votes stay visible
+# through pending_vote() until their flush has committed.
+#
+# The buffer is per process. Each vote keeps the wall-clock time it was cast
+# and the flush only overwrites older ratings, so with several gunicorn
+# workers the stored vote is still the user's latest one. What another worker
+# reads (check-vote, vote states) can lag behind by up to one flush interval.
+class VoteBuffer:
+    def __init__(self, flush_interval_ms=250, max_entries=500):
+        self.flush_interval_ms = flush_interval_ms
+        self.max_entries = max_entries
+        self._pending = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.metrics = {
+            "flushes": 0,
+            "votes_flushed": 0,
+            "last_batch_size": 0,
+            "max_batch_size": 0,
+            "last_flush_ms": None,
+            "last_flush_lag_ms": None,
+            "max_flush_lag_ms": 0,
+            "errors": 0,
+            "last_error": None,
+        }
+
+    def add(self, model_id, user_id, review):
+        with self._lock:
+            previous = self._pending.get((model_id, user_id))
+            # keep the time of the first unflushed vote so lag is measured from it
+            enqueued_at = previous[1] if previous else time.monotonic()
+            self._pending[(model_id, user_id)] = (review, enqueued_at, datetime.utcnow())
+            if len(self._pending) >= self.max_entries:
+                self._wakeup.set()
+
+    # the user's latest vote that may not be in the database yet
+    def pending_vote(self, model_id, user_id):
+        with self._lock:
+            entry = self._pending.get((model_id, user_id)) or self._inflight.get((model_id, user_id))
+        return entry[0] if entry else None
+
+    # {model_id: review} of the user's not-yet-written votes
+    def pending_votes_for_user(self, user_id):
+        with self._lock:
+            votes = {key[0]: entry[0] for key, entry in self._inflight.items() if key[1] == user_id}
+            votes.update({key[0]: entry[0] for key, entry in self._pending.items() if key[1] == user_id})
+        return votes
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._inflight, self._pending = self._pending, {}
+                batch = self._inflight
+
+            started = time.monotonic()
+            oldest = min(entry[1] for entry in batch.values())
+            try:
+                self._write(batch)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Vote flush failed, retrying with the next batch: {e}")
+                self.metrics["errors"] += 1
+                self.metrics["last_error"] = str(e)
+                with self._lock:
+                    # newer votes that arrived during the failed flush win
+                    for key, entry in batch.items():
+                        self._pending.setdefault(key, entry)
+                    self._inflight = {}
+                return 0
+
+            finished = time.monotonic()
+            with self._lock:
+                self._inflight = {}
+
+            lag_ms = round((finished - oldest) * 1000, 2)
+            self.metrics["flushes"] += 1
+            self.metrics["votes_flushed"] += len(batch)
+            self.metrics["last_batch_size"] = len(batch)
+            self.metrics["max_batch_size"] = max(self.metrics["max_batch_size"], len(batch))
+            self.metrics["last_flush_ms"] = round((finished - started) * 1000, 2)
+            self.metrics["last_flush_lag_ms"] = lag_ms
+            self.metrics["max_flush_lag_ms"] = max(self.metrics["max_flush_lag_ms"], lag_ms)
+            return len(batch)
+
+    def _write(self, batch):
+        if db.engine.dialect.name != "postgresql":
+            from app.services.votes import VoteTargetNotFound, apply_vote
+            for (model_id, user_id), (review, _, voted_at) in batch.items():
+                try:
+                    apply_vote(model_id, user_id, review, rated_at=voted_at)
+                except VoteTargetNotFound:
+                    pass
+            return
+
+        keys = list(batch)
+        db.session.execute(FLUSH_SQL, {
+            "model_ids": [key[0] for key in keys],
+            "user_ids": [key[1] for key in keys],
+            "reviews": [batch[key][0] for key in keys],
+            "voted_at": [batch[key][2] for key in keys],
+            "vote_points": VOTE_POINTS,
+        })
+        db.session.commit()
+
+    def start(self, app):
+        if self._thread is not None:
+            return self._thread
+
+        def loop():
+            while True:
+                self._wakeup.wait(self.flush_interval_ms / 1000)
+                self._wakeup.clear()
+                try:
+                    with app.app_context():
+                        self.flush()
+                except Exception as e:
+                    print(f"Vote flush loop error: {e}")
+
+        def flush_on_exit():
+            with app.app_context():
+                self.flush()
+
+        self._thread = threading.Thread(target=loop, name="vote-flush", daemon=True)
+        self._thread.start()
+        atexit.register(flush_on_exit)
+        return self._thread
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+            inflight = len(self._inflight)
+        return dict(self.metrics, pending=pending, inflight=inflight, enabled=Config.VOTE_WRITE_BEHIND)
+
+
+vote_buffer = VoteBuffer(
+    flush_interval_ms=Config.VOTE_FLUSH_INTERVAL_MS,
+    max_entries=Config.VOTE_FLUSH_MAX_ENTRIES,
+)
@@ -0,0 +1,187 @@
+from datetime import datetime
+from sqlalchemy import and_, text
+from sqlalchemy.exc import IntegrityError
+from app.database import db
+from app.models import ARModel, DishItem, ModelRating, User
+from app.services.ranking import VOTE_POINTS, vote_rating_delta
+from app.services.vote_buffer import vote_buffer
+
+VOTE_MESSAGES = {
+    "up": {
+        "new": "Model upvoted successfully",
+        "changed": "Vote changed to upvote successfully",
+        "unchanged": "You have already upvoted this model",
+    },
+    "down": {
+        "new": "Model downvoted successfully",
+        "changed": "Vote changed to downvote successfully",
+        "unchanged": "You have already downvoted this model",
+    },
+}
+
+
+# raised when the model or the user being voted for does not exist
+class VoteTargetNotFound(Exception):
+    pass
+
+
+# One statement per vote: upsert the user's rating (only touching the row when
+# the review actually changes and the stored rating is older), then apply the
+# resulting counter deltas relative to the current row. xmax = 0 tells a
+# fresh insert from an update.
+# When the user repeats their vote the upsert returns nothing, no counter is
+# touched and no row comes back.
+VOTE_SQL = text("""
+    WITH vote AS (
+        INSERT INTO model_ratings (model_id, user_id, review, rated_at)
+        VALUES (:model_id, :user_id, :review, :rated_at)
+        ON CONFLICT (model_id, user_id) DO UPDATE
+            SET review = EXCLUDED.review, rated_at = EXCLUDED.rated_at
+            WHERE model_ratings.review IS DISTINCT FROM EXCLUDED.review
+              AND (model_ratings.rated_at IS NULL OR model_ratings.rated_at < EXCLUDED.rated_at)
+        RETURNING (xmax = 0) AS inserted
+    ),
+    delta AS (
+        SELECT inserted,
+               CASE WHEN :review = 'up' THEN 1 WHEN inserted THEN 0 ELSE -1 END AS up,
+               CASE WHEN :review = 'down' THEN 1 WHEN inserted THEN 0 ELSE -1 END AS down
+        FROM vote
+    )
+    UPDATE ar_models AS m
+    SET up_votes = COALESCE(m.up_votes, 0) + delta.up,
+        down_votes = COALESCE(m.down_votes, 0) + delta.down,
+        model_rating = COALESCE(m.model_rating, 0) + ROUND((delta.up - delta.down) * :vote_points)
+    FROM delta
+    WHERE m.model_id = :model_id
+    RETURNING m.model_id, m.model_rating, m.up_votes, m.down_votes, delta.inserted
+""")
+
+
+def _vote_result(outcome, model_id, model_rating=None, up_votes=None, down_votes=None):
+    return {
+        "outcome": outcome,
+        "model_id": model_id,
+        "model_rating": model_rating,
+        "up_votes": up_votes,
+        "down_votes": down_votes,
+    }
+
+
+def _missing_target(model_id):
+    if db.session.get(ARModel, model_id) is None:
+        return VoteTargetNotFound("Model not found")
+    return VoteTargetNotFound("User not found")
+
+
+def _apply_vote_upsert(model_id, user_id, review, rated_at=None):
+    try:
+        row = db.session.execute(VOTE_SQL, {
+            "model_id": model_id,
+            "user_id": user_id,
+            "review": review,
+            "rated_at": rated_at or datetime.utcnow(),
+            "vote_points": VOTE_POINTS,
+        }).first()
+        db.session.commit()
+    except IntegrityError:
+        # a foreign key failed: unknown model or unknown user
+        db.session.rollback()
+        raise _missing_target(model_id)
+
+    if row is None:
+        return _vote_result("unchanged", model_id)
+
+    return _vote_result(
+        "new" if row.inserted else "changed",
+        row.model_id,
+        row.model_rating,
+        row.up_votes,
+        row.down_votes,
+    )
+
+
+# read-modify-write path through the ORM, used on databases without
+# INSERT ... ON CONFLICT ... RETURNING xmax (e.g. SQLite in development);
+# a vote cast before the stored rating (a late write-behind flush) is ignored
+def _apply_vote_orm(model_id, user_id, review, rated_at=None):
+    model = ARModel.query.get(model_id)
+    if not model:
+        raise VoteTargetNotFound("Model not found")
+
+    existing_rating = ModelRating.query.filter_by(model_id=model_id, user_id=user_id).first()
+
+    up_delta = 1 if review == "up" else 0
+    down_delta = 1 if review == "down" else 0
+    if existing_rating:
+        if existing_rating.review == review:
+            return _vote_result("unchanged", model_id)
+        if rated_at and existing_rating.rated_at and existing_rating.rated_at >= rated_at:
+            return _vote_result("unchanged", model_id)
+        existing_rating.review = review
+        existing_rating.rated_at = rated_at or datetime.utcnow()
+        up_delta, down_delta = (1, -1) if review == "up" else (-1, 1)
+        outcome = "changed"
+    else:
+        if db.session.get(User, user_id) is None:
+            raise VoteTargetNotFound("User not found")
+        db.session.add(ModelRating(model_id=model_id, user_id=user_id, review=review, rated_at=rated_at or datetime.utcnow()))
+        outcome = "new"
+
+    model.up_votes = (model.up_votes or 0) + up_delta
+    model.down_votes = (model.down_votes or 0) + down_delta
+    model.model_rating = (model.model_rating or 0) + vote_rating_delta(up_delta, down_delta)
+    db.session.commit()
+
+    return _vote_result(outcome, model.model_id, model.model_rating, model.up_votes, model.down_votes)
+
+
+# record `review` ("up" or "down") from user_id on model_id; rated_at is the
+# time the vote was cast when it is written later by the write-behind buffer
+def apply_vote(model_id, user_id, review, rated_at=None):
+    if db.engine.dialect.name == "postgresql":
+        return _apply_vote_upsert(model_id, user_id, review, rated_at)
+    return _apply_vote_orm(model_id, user_id, review, rated_at)
+
+
+# the user's current vote on a model, including votes still in the write-behind buffer
+def current_vote(model_id, user_id):
+    review = vote_buffer.pending_vote(model_id, user_id)
+    if review is not None:
+        return review
+
+    rating = ModelRating.query.filter_by(model_id=model_id, user_id=user_id).first()
+    return rating.review if rating else None
+
+
+# write-behind variant of apply_vote: the vote is queued and written in the
+# next batched flush, so the counters are not known yet
+def buffer_vote(model_id, user_id, review):
+    if db.session.get(ARModel, model_id) is None:
+        raise VoteTargetNotFound("Model not found")
+
+    previous = current_vote(model_id, user_id)
+    if previous == review:
+        return _vote_result("unchanged", model_id)
+
+    vote_buffer.add(model_id, user_id, review)
+    return _vote_result("new" if previous is None else "changed", model_id)
+
+
+# {model_id: "up" | "down" | None} for every requested model that exists, read
+# with one outer join on model_ratings (served by uq_model_user_rating) and
+# overlaid with the user's votes still waiting in the write-behind buffer
+def vote_states(user_id, model_ids=None, restaurant_id=None):
+    query = (
+        db.session.query(ARModel.model_id, ModelRating.review)
+        .outerjoin(ModelRating, and_(ModelRating.model_id == ARModel.model_id, ModelRating.user_id == user_id))
+    )
+    if restaurant_id is not None:
+        query = query.join(DishItem, DishItem.dish_id == ARModel.dish_id).filter(DishItem.restaurant_id == restaurant_id)
+    if model_ids is not None:
+        query = query.filter(ARModel.model_id.in_(model_ids))
+
+    states = {row.model_id: row.review for row in query.all()}
+    for model_id, review in vote_buffer.pending_votes_for_user(user_id).items():
+        if model_id in states:
+            states[model_id] = review
+    return states
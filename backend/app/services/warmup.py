@@ -0,0 +1,44 @@
+import threading
+import time
+from config.config import Config
+
+
+# Loads the SDKs that the services import on first use, so the first menu
+# scan or image lookup does not pay for them. Returns how long each took (ms);
+# anything already loaded comes back as ~0.
+def warm_up():
+    timings = {}
+
+    def timed(name, load):
+        started = time.perf_counter()
+        try:
+            load()
+        except Exception as e:
+            print(f"Warm-up error ({name}): {e}")
+        timings[name] = round((time.perf_counter() - started) * 1000, 2)
+
+    def load_gemini():
+        from app.services.llm import load_genai
+        load_genai()
+
+    def load_pillow():
+        from PIL import Image, ImageOps  # noqa: F401
+
+    def load_image_search():
+        from duckduckgo_search import DDGS  # noqa: F401
+
+    timed("pillow", load_pillow)
+    timed("image_search", load_image_search)
+    timed("gemini", load_gemini)
+    return timings
+
+
+# WARM_UP=eager loads everything before the app starts serving, =background
+# loads it on a daemon thread once the app is up, =off leaves it to the first
+# request that needs each SDK
+def start_warm_up(mode=None):
+    mode = mode or Config.WARM_UP
+    if mode == "eager":
+        print(f"Warm-up: {warm_up()}")
+    elif mode == "background":
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
@@ -0,0 +1,134 @@
+# Matching an extracted menu against a restaurant's dishes with AR models
+# (app/services/dish_index.py), in process and without a database:
+#
+#   python benchmarks/dish_match_benchmark.py --dishes 300 --items 200
+#
+# Menu items are dish names with OCR-style damage (dropped vowels, swapped
+# letters, abbreviations) plus dishes the restaurant has no model for.
+# Reports index build time, lookup time per menu (cold, and repeated: the
+# same menu scanned again) and how many items were linked to the dish they
+# came from.
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+sys.path.insert(0, BENCHMARKS)
+
+# dish names are 2-4 of these, so many share a word or two (like "Chicken
+# Curry" and "Chicken Fried Rice" on a real menu)
+WORDS = (
+    "chicken", "beef", "pork", "shrimp", "tofu", "lamb", "salmon", "veggie", "spicy", "crispy", "grilled",
+    "fried", "garlic", "basil", "curry", "noodle", "rice", "soup", "salad", "roll", "tikka", "masala",
+    "teriyaki", "kung", "pao", "pad", "thai", "green", "red", "yellow", "sweet", "sour", "bbq", "smoked",
+    "lemon", "honey", "pepper", "mushroom", "spinach", "paneer", "ramen", "pho", "taco", "burrito", "wrap",
+    "tom", "yum", "massaman", "panang", "larb", "satay", "bulgogi", "bibimbap", "japchae", "kimchi", "gyoza",
+    "udon", "soba", "katsu", "tempura", "unagi", "sashimi", "nigiri", "carbonara", "bolognese", "lasagna",
+    "risotto", "gnocchi", "margherita", "calzone", "bruschetta", "caprese", "tiramisu", "gelato", "falafel",
+    "shawarma", "hummus", "gyro", "souvlaki", "moussaka", "biryani", "korma", "vindaloo", "saag", "naan",
+    "samosa", "pakora", "dal", "quesadilla", "enchilada", "tamale", "carnitas", "pozole", "elote", "churro",
+    "brisket", "ribs", "wings", "burger", "fries", "poutine", "chowder", "bisque", "gumbo", "jambalaya",
+    "banh", "mi", "bun", "lo", "mein", "chow", "mapo", "char", "siu", "bao", "wonton", "dumpling", "congee",
+    "omelette", "pancake", "waffle", "crepe", "benedict", "hash", "scramble", "smoothie", "latte", "chai",
+)
+ABBREVIATIONS = {"chicken": "chkn", "with": "w/", "vegetable": "veg", "special": "spcl", "sandwich": "sndwch"}
+
+
+def damage(name, rng):
+    words = name.split()
+    choice = rng.random()
+    if choice < 0.3:
+        words = [ABBREVIATIONS.get(word, word) for word in words]
+        word = rng.randrange(len(words))
+        words[word] = words[word][0] + "".join(c for c in words[word][1:] if c not in "aeiou")
+    elif choice < 0.6:
+        word = rng.randrange(len(words))
+        letters = list(words[word])
+        if len(letters) > 3:
+            i = rng.randrange(1, len(letters) - 2)
+            letters[i], letters[i + 1] = letters[i + 1], letters[i]
+        words[word] = "".join(letters)
+    elif choice < 0.8:
+        words = [word.upper() for word in words]
+    return " ".join(words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark menu to AR dish matching")
+    parser.add_argument("--dishes", type=int, default=300, help="dishes with AR models at the restaurant")
+    parser.add_argument("--items", type=int, default=200, help="items on the scanned menu")
+    parser.add_argument("--unknown", type=float, default=0.3, help="share of menu items with no model")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    from app.services.dish_index import RestaurantDishIndex
+    from config.config import Config
+
+    rng = random.Random(args.seed)
+    names = set()
+    while len(names) < args.dishes * 2:
+        names.add(" ".join(rng.sample(WORDS, rng.randint(2, 4))).title())
+    names = sorted(names)
+    rng.shuffle(names)
+    dishes = list(enumerate(names[:args.dishes], start=1))
+    unknown = names[args.dishes:]
+
+    started = time.perf_counter()
+    index = RestaurantDishIndex(dishes)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    menu = []
+    for _ in range(args.items):
+        if rng.random() < args.unknown:
+            menu.append((None, damage(rng.choice(unknown), rng)))
+        else:
+            dish_id, name = rng.choice(dishes)
+            menu.append((dish_id, damage(name, rng)))
+
+    def lookup(index):
+        started = time.perf_counter()
+        results = [index.candidates(name, Config.DISH_MATCH_MIN_SIMILARITY) for _, name in menu]
+        return (time.perf_counter() - started) * 1000, results
+
+    cold = []
+    repeated = []
+    for _ in range(args.rounds):
+        index = RestaurantDishIndex(dishes)
+        elapsed, results = lookup(index)
+        cold.append(elapsed)
+        repeated.append(lookup(index)[0])
+
+    correct = wrong = missed = false_links = 0
+    for (expected, _), candidates in zip(menu, results):
+        found = candidates[0][1] if candidates else None
+        if expected is None:
+            false_links += found is not None
+        elif found == expected:
+            correct += 1
+        elif found is None:
+            missed += 1
+        else:
+            wrong += 1
+
+    known = sum(1 for expected, _ in menu if expected is not None)
+    print(f"index of {args.dishes} dishes built in {build_ms:.1f} ms")
+    for label, timings in (("cold", cold), ("repeated", repeated)):
+        print(
+            f"{args.items}-item menu, {label}: p50 {statistics.median(timings):.2f} ms, "
+            f"max {max(timings):.2f} ms over {args.rounds} rounds"
+        )
+    print(
+        f"items with a model: {correct}/{known} linked correctly, {wrong} to another dish, {missed} missed; "
+        f"items without one: {false_links}/{args.items - known} linked anyway "
+        f"(min similarity {Config.DISH_MATCH_MIN_SIMILARITY:g})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# Local stand-ins for the external services, used by route_benchmark.py:
+#
+#   Latency.parse("800:0.5")  lognormal latency, median 800 ms, sigma 0.5
+#   FakeGemini                LLM provider (see app/services/llm.py) answering
+#                             with synthetic menus and recommendations
+#   FakeImageSearch           replacement for the DuckDuckGo image search
+#
+# Places and the crypto API are real HTTP servers (places_stub.start_stub and
+# login_benchmark.start_hash_stub) so their connection pooling is exercised too.
+import io
+import json
+import math
+import random
+import threading
+import time
+
+DISHES = (
+    "Pad Thai", "Green Curry", "Tom Yum Soup", "Margherita Pizza", "Caesar Salad", "Beef Pho",
+    "Chicken Tikka Masala", "Falafel Wrap", "Pork Ramen", "Fish Tacos", "Bibimbap", "Pasta Carbonara",
+    "Mushroom Risotto", "Spring Rolls", "Lamb Gyro", "Shrimp Fried Rice", "Veggie Burger", "Club Sandwich",
+    "Miso Soup", "Chicken Wings", "Beef Brisket", "Tuna Poke Bowl", "Paneer Butter Masala", "Gelato",
+)
+CATEGORIES = ("STARTERS", "SOUPS", "MAINS", "SIDES", "DESSERTS", "DRINKS")
+ALLERGENS = ("dairy", "gluten", "peanuts", "shellfish", "soy", "egg")
+TAGS = ("Vegan", "Vegetarian", "Gluten-Free", "Dairy-Free")
+
+
+# latency in ms drawn from a lognormal distribution (long right tail, like
+# real API calls); sigma 0 is a fixed delay
+class Latency:
+    def __init__(self, median_ms, sigma=0.3):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self._random = random.Random()
+        self._lock = threading.Lock()
+
+    # "120" or "120:0.5" (median ms, sigma)
+    @classmethod
+    def parse(cls, spec):
+        median, _, sigma = str(spec).partition(":")
+        return cls(float(median), float(sigma) if sigma else 0.3)
+
+    def __call__(self):
+        if self.median_ms <= 0:
+            return 0.0
+        with self._lock:
+            return self._random.lognormvariate(math.log(self.median_ms), self.sigma)
+
+    def sleep(self):
+        time.sleep(self() / 1000)
+
+    def __repr__(self):
+        return f"{self.median_ms:g}ms:{self.sigma:g}"
+
+
+def fake_menu(rng, dishes=24):
+    menu = {}
+    for i in range(dishes):
+        category = CATEGORIES[i % len(CATEGORIES)]
+        menu.setdefault(category, []).append({
+            "name": f"{rng.choice(DISHES)} {i}",
+            "sizes": [{"size": "Regular", "price": round(rng.uniform(4, 30), 2)}],
+            "description": "House special with seasonal vegetables and a secret sauce",
+            "spiciness": rng.choice((None, "Mild", "Spicy")),
+            "allergens": rng.sample(ALLERGENS, rng.randint(0, 2)),
+            "dietary_info": rng.sample(TAGS, rng.randint(0, 1)),
+            "calories": str(rng.randint(200, 1200)),
+            "popularity": None,
+            "availability": None,
+            "addons": [],
+        })
+    return {"menu": menu}
+
+
+class _Response:
+    prompt_feedback = None
+
+    def __init__(self, text):
+        self.text = text
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class _StreamedResponse:
+    prompt_feedback = None
+
+    def __init__(self, chunks, delay):
+        self._chunks = chunks
+        self._delay = delay
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            time.sleep(self._delay)
+            yield _Chunk(chunk)
+
+
+# raised by the fake for a share of calls, like a 503 from the real API
+class FakeUnavailable(Exception):
+    code = 503
+
+
+# LLM provider standing in for Gemini: menu extraction prompts (prompt plus
+# image) get a synthetic menu, anything else a recommendation list. Latency
+# is drawn per call; failure_rate of the calls fail with a transient error.
+# Install with llm.register_provider("gemini", FakeGemini(...)).
+class FakeGemini:
+    def __init__(self, latency, dishes=24, seed=1, failure_rate=0.0):
+        self.latency = latency
+        self.dishes = dishes
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    # (delay in seconds, error to raise after it or None), honouring timeout
+    def _outcome(self, timeout):
+        delay = self.latency() / 1000
+        with self._lock:
+            failed = self._random.random() < self.failure_rate
+        if delay > timeout:
+            return timeout, TimeoutError(f"fake model timed out after {timeout:.1f}s")
+        if failed:
+            return delay / 4, FakeUnavailable("fake model is overloaded")
+        return delay, None
+
+    def _answer(self, contents):
+        with self._lock:
+            self.calls += 1
+            if len(contents) > 1:
+                return json.dumps(fake_menu(self._random, self.dishes))
+            names = [name for name in DISHES if name in contents[0]][:2] or list(DISHES[:2])
+        return json.dumps({
+            "recommendations": [
+                {"name": name, "match_score": str(90 - 10 * i), "reason": "Matches the profile"}
+                for i, name in enumerate(names)
+            ]
+        })
+
+    def generate(self, model, contents, timeout):
+        delay, error = self._outcome(timeout)
+        time.sleep(delay)
+        if error:
+            raise error
+        return _Response(self._answer(contents))
+
+    # the model's latency spread over ~20 chunks, the first after a quarter
+    def stream(self, model, contents, timeout):
+        text = self._answer(contents)
+        delay = min(self.latency() / 1000, timeout)
+        size = max(1, len(text) // 20)
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        time.sleep(delay / 4)
+        return _StreamedResponse(chunks, delay * 0.75 / len(chunks))
+
+
+# Stands in for ddg_image_search: most dishes have an image, a few do not.
+# Install with dish_image_cache.search = FakeImageSearch(latency).
+class FakeImageSearch:
+    def __init__(self, latency, miss_ratio=0.1):
+        self.latency = latency
+        self.miss_ratio = miss_ratio
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, query):
+        with self._lock:
+            self.calls += 1
+        self.latency.sleep()
+        if random.random() < self.miss_ratio:
+            return None
+        return f"https://images.example.com/{query.replace(' ', '-')}.jpg"
+
+
+# distinct synthetic menu photos (different perceptual hashes), as JPEG bytes
+def menu_photos(count, size=(1600, 1200), seed=1):
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    photos = []
+    for _ in range(count):
+        image = Image.new("RGB", size, "white")
+        draw = ImageDraw.Draw(image)
+        for _ in range(40):
+            x, y = rng.randrange(size[0]), rng.randrange(size[1])
+            shade = rng.randrange(256)
+            draw.rectangle((x, y, x + rng.randrange(50, 400), y + rng.randrange(20, 200)), fill=(shade, shade, shade))
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=85)
+        photos.append(buffer.getvalue())
+    return photos
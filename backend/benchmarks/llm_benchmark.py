@@ -0,0 +1,107 @@
+# Tail latency of the menu extraction call under the LLM policies in
+# app/services/llm.py, against a fake model with a long-tailed latency:
+#
+#   python benchmarks/llm_benchmark.py --calls 400 --threads 16
+#   python benchmarks/llm_benchmark.py --latency 900:0.8 --failure-rate 0.03 --fallback-latency 300:0.3
+#
+# Policies compared: a single attempt (the previous behaviour), retries only,
+# retries plus hedging after the p90, and all of that plus a faster fallback
+# model once 60% of the deadline has passed. "attempts/call" is the extra
+# load each policy puts on the provider.
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+sys.path.insert(0, BENCHMARKS)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare LLM call policies on a long-tailed fake model")
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--latency", default="900:0.8", help="primary model latency, median_ms:sigma")
+    parser.add_argument("--fallback-latency", default="300:0.3")
+    parser.add_argument("--failure-rate", type=float, default=0.03)
+    parser.add_argument("--deadline", type=float, default=8)
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    from fakes import FakeGemini, Latency
+    from app.services import llm
+    from app.services.metrics import llm_events
+    from config.config import Config
+
+    primary = FakeGemini(Latency.parse(args.latency), failure_rate=args.failure_rate, seed=1)
+    fallback = FakeGemini(Latency.parse(args.fallback_latency), failure_rate=args.failure_rate, seed=2)
+    llm.register_provider("fake", primary)
+    llm.register_provider("fake-fast", fallback)
+
+    Config.LLM_EXTRACT_MODEL = "fake:primary"
+    Config.LLM_EXTRACT_DEADLINE = args.deadline
+    Config.LLM_HEDGE_MIN_SAMPLES = 20
+
+    policies = (
+        ("single attempt (previous)", dict(RETRIES=0, HEDGE=False, FALLBACK="")),
+        ("retries", dict(RETRIES=2, HEDGE=False, FALLBACK="")),
+        ("retries + hedge at p90", dict(RETRIES=2, HEDGE=True, FALLBACK="")),
+        ("retries + hedge + fallback", dict(RETRIES=2, HEDGE=True, FALLBACK="fake-fast:fallback")),
+    )
+    contents = ["extract the menu", {"mime_type": "image/jpeg", "data": b""}]
+
+    for name, settings in policies:
+        for key, value in settings.items():
+            setattr(Config, f"LLM_EXTRACT_{key}", value)
+        llm.latencies = llm.LatencyTracker()
+        events_before = llm_events.totals()
+
+        latencies = []
+        errors = []
+        remaining = iter(range(args.calls))
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        return
+                started = time.perf_counter()
+                try:
+                    llm.generate("extract", contents)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                except Exception as e:
+                    errors.append(type(e).__name__)
+
+        threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        events = {
+            event: count - events_before.get(("extract", event), 0)
+            for (stage, event), count in llm_events.totals().items()
+            if stage == "extract"
+        }
+        won = ", ".join(
+            f"{event[4:]} {count}" for event, count in sorted(events.items()) if event.startswith("won_") and count
+        )
+        print(
+            f"{name:>28}: p50 {statistics.median(latencies):.0f} ms, p95 {percentile(latencies, 0.95):.0f} ms, "
+            f"p99 {percentile(latencies, 0.99):.0f} ms, failed {len(errors)}/{args.calls}, "
+            f"attempts/call {sum(c for e, c in events.items() if e.startswith('attempt_')) / args.calls:.2f} "
+            f"(won: {won})"
+        )
+
+
+if __name__ == "__main__":
+    main()
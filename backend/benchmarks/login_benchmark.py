@@ -0,0 +1,158 @@
+# Logins per second through /user/login with the remote crypto API validator
+# and with the in-process bcrypt verifier.
+#
+#   python benchmarks/login_benchmark.py --logins 400 --threads 8
+#
+# The remote mode talks to a local stand-in for the crypto API's validate
+# endpoint. The real API hashes on its own hardware, so the stand-in only
+# spends --latency-ms (network plus remote hashing) per call and remembers
+# the bcrypt answers instead of competing with the local verifier for CPU.
+# Users live in a throwaway SQLite database.
+import argparse
+import json
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+# latency_ms is a number or a callable that draws one per request
+def start_hash_stub(latency_ms):
+    import bcrypt
+
+    answers = {}
+
+    class ValidateHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            time.sleep((latency_ms() if callable(latency_ms) else latency_ms) / 1000)
+            key = (query["plain"][0], query["hashed"][0])
+            if key not in answers:
+                answers[key] = bcrypt.checkpw(key[0].encode("utf-8"), key[1].encode("utf-8"))
+            valid = answers[key]
+
+            body = json.dumps({"valid": valid}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ValidateHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/crypto/"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark password verification on /user/login")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--logins", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=10, help="bcrypt cost factor of the seeded hashes")
+    parser.add_argument("--latency-ms", type=int, default=150, help="round trip plus hashing time of the remote API")
+    args = parser.parse_args()
+
+    server, url = start_hash_stub(args.latency_ms)
+    database = tempfile.NamedTemporaryFile(suffix=".sqlite3", delete=False)
+    os.environ["HASH_API_KEY"] = url
+    os.environ["DATABASE_URL"] = f"sqlite:///{database.name}"
+    os.environ["RESCORE_INTERVAL_SECONDS"] = "0"
+
+    import bcrypt
+    from app import create_app
+    from app.database import db
+    from app.models import User
+    from config.config import Config
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        salt = bcrypt.gensalt(args.rounds)
+        db.session.add_all(
+            User(
+                user_id=i,
+                first_name="U",
+                last_name=str(i),
+                email=f"u{i}@example.com",
+                hashed_password=bcrypt.hashpw(f"password-{i}".encode("utf-8"), salt).decode("utf-8"),
+            )
+            for i in range(1, args.users + 1)
+        )
+        db.session.commit()
+
+    try:
+        # fill the stand-in's answers so the remote run only measures latency
+        with app.app_context():
+            from app.services.passwords import verify_remote
+            for user_id in range(1, args.users + 1):
+                user = db.session.get(User, user_id)
+                verify_remote(f"password-{user_id}", user.hashed_password)
+                verify_remote("wrong", user.hashed_password)
+
+        for mode in ("remote", "local"):
+            Config.PASSWORD_VERIFIER = mode
+            # every tenth attempt uses a wrong password
+            attempts = [
+                (user_id, f"password-{user_id}" if n % 10 else "wrong")
+                for n, user_id in enumerate(random.choices(range(1, args.users + 1), k=args.logins))
+            ]
+            lock = threading.Lock()
+            latencies = []
+            outcomes = []
+
+            def worker():
+                client = app.test_client()
+                while True:
+                    with lock:
+                        if not attempts:
+                            return
+                        user_id, password = attempts.pop()
+                    started = time.perf_counter()
+                    response = client.post("/user/login", json={"email": f"u{user_id}@example.com", "password": password})
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    outcomes.append((password != "wrong", response.status_code))
+
+            threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+            wrong = sum((status == 200) != correct for correct, status in outcomes)
+            print(
+                f"{mode:>6}: {len(latencies)} logins in {elapsed:.2f}s ({len(latencies) / elapsed:.0f}/s), "
+                f"p50 {statistics.median(latencies):.1f} ms, p99 {percentile(latencies, 0.99):.1f} ms, "
+                f"wrong outcomes {wrong}"
+            )
+    finally:
+        server.shutdown()
+        os.unlink(database.name)
+
+
+if __name__ == "__main__":
+    main()
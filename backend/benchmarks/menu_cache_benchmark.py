@@ -0,0 +1,184 @@
+# Near-duplicate matching in the menu extraction cache
+# (app/services/menu_cache.py), in process and without a model:
+#
+#   python benchmarks/menu_cache_benchmark.py --restaurants 20 --pages 3 --diners 15
+#
+# Every restaurant has a few text pages sharing one layout. Diners photograph
+# a random page "on their own phone": a small rotation and crop, different
+# exposure, blur, resolution and JPEG quality. The benchmark reports
+#   - the dhash distance between two photos of the same page and between
+#     pages of the same restaurant, and
+#   - for each max_distance, the model calls, exact and near hits and the
+#     wrong menus served when the diners go through cached_extract_menu_data
+#     with their restaurant_id. Photos are spread over --workers worker
+#     caches, and every served menu is merged into the restaurant's stored
+#     dishes, as /ocr/extract-menu does.
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+sys.path.insert(0, BENCHMARKS)
+
+from fakes import CATEGORIES, DISHES  # noqa: E402
+
+
+def font(size):
+    from PIL import ImageFont
+
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+# one page: a title, then categories of "dish ... price" lines; returns the
+# image and the menu a perfect extraction would give
+def menu_page(rng, title, size=(900, 1200)):
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", size, (250, 248, 240))
+    draw = ImageDraw.Draw(image)
+    heading, line = font(40), font(22)
+    draw.text((size[0] // 3, 40), title, fill=(20, 20, 20), font=heading)
+
+    menu = {}
+    y = 130
+    for category in rng.sample(CATEGORIES, 4):
+        draw.text((70, y), category, fill=(120, 20, 20), font=heading)
+        y += 55
+        items = menu.setdefault(category, [])
+        for _ in range(rng.randrange(4, 7)):
+            name = f"{rng.choice(DISHES)} {rng.randrange(1, 100)}"
+            price = f"{rng.randrange(5, 40)}.{rng.choice(('00', '50', '95'))}"
+            draw.text((90, y), name, fill=(30, 30, 30), font=line)
+            draw.text((size[0] - 160, y), price, fill=(30, 30, 30), font=line)
+            items.append({"name": name, "sizes": [{"size": "Regular", "price": float(price)}]})
+            y += 34
+        y += 20
+    return image, {"menu": menu}
+
+
+# the same page photographed again on another phone
+def reshoot(image, rng):
+    from PIL import Image, ImageEnhance, ImageFilter
+
+    width, height = image.size
+    image = image.rotate(rng.uniform(-3, 3), resample=Image.Resampling.BICUBIC, fillcolor=(90, 80, 70))
+    image = image.crop((
+        width * rng.uniform(0, 0.05),
+        height * rng.uniform(0, 0.05),
+        width * (1 - rng.uniform(0, 0.05)),
+        height * (1 - rng.uniform(0, 0.05)),
+    ))
+    image = ImageEnhance.Brightness(image).enhance(rng.uniform(0.8, 1.2))
+    image = ImageEnhance.Contrast(image).enhance(rng.uniform(0.85, 1.15))
+    image = image.filter(ImageFilter.GaussianBlur(rng.uniform(0, 1.5)))
+    scale = rng.uniform(0.5, 1.0)
+    image = image.resize((int(image.width * scale), int(image.height * scale)))
+
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=rng.randrange(60, 95))
+    buffer.seek(0)
+    return Image.open(buffer).convert("RGB")
+
+
+class Photo:
+    def __init__(self, image, structured_data):
+        self.image = image
+        self.structured_data = structured_data
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--restaurants", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=3, help="pages per restaurant")
+    parser.add_argument("--diners", type=int, default=15, help="photos per restaurant")
+    parser.add_argument("--distances", default="0,32,40,48,56", help="max_distance values to simulate")
+    parser.add_argument("--workers", type=int, default=4, help="worker processes, each with its own cache")
+    parser.add_argument("--min-photos", type=int, default=None, help="default: MENU_CACHE_MIN_PHOTOS")
+    parser.add_argument("--near-per-check", type=int, default=None, help="default: MENU_CACHE_NEAR_PER_CHECK")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ.setdefault("START_BACKGROUND_THREADS", "0")
+    from app.services import menu_pipeline
+    from app.services.menu_cache import PerceptualMenuCache, dhash, hamming_distance
+    from config.config import Config
+
+    min_photos = Config.MENU_CACHE_MIN_PHOTOS if args.min_photos is None else args.min_photos
+    near_per_check = Config.MENU_CACHE_NEAR_PER_CHECK if args.near_per_check is None else args.near_per_check
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    restaurants = []
+    for number in range(args.restaurants):
+        title = f"RESTAURANT {number}"
+        restaurants.append([menu_page(rng, title) for _ in range(args.pages)])
+
+    # diners[i] = (restaurant_id, page, photo, worker)
+    diners = []
+    for number, pages in enumerate(restaurants):
+        for _ in range(args.diners):
+            page = rng.randrange(len(pages))
+            image, structured_data = pages[page]
+            diners.append((f"r{number}", page, Photo(reshoot(image, rng), structured_data), rng.randrange(args.workers)))
+    rng.shuffle(diners)
+    hashes = [dhash(photo.image) for _, _, photo, _ in diners]
+    print(f"{len(diners)} photos of {args.restaurants * args.pages} pages generated in {time.perf_counter() - started:.1f}s")
+
+    same_page, other_page = [], []
+    for i in range(len(diners)):
+        for j in range(i + 1, len(diners)):
+            if diners[i][0] != diners[j][0]:
+                continue
+            target = same_page if diners[i][1] == diners[j][1] else other_page
+            target.append(hamming_distance(hashes[i], hashes[j]))
+
+    print("\ndhash distance (of 256 bits)     min   p5  p50  p95  max")
+    for label, values in (("same page, another photo", same_page), ("another page, same layout", other_page)):
+        if values:
+            print(f"{label:<32}{min(values):>4}{percentile(values, 0.05):>5}{percentile(values, 0.5):>5}"
+                  f"{percentile(values, 0.95):>5}{max(values):>5}")
+
+    def extract(photo):
+        return photo.structured_data
+
+    menu_pipeline.extract_menu_data = extract
+    print(f"\nworkers={args.workers} min_photos={min_photos} near_per_check={near_per_check}")
+    print("max_distance  model calls  exact hits  near hits  wrong menus")
+    for max_distance in (int(value) for value in args.distances.split(",")):
+        caches = [
+            PerceptualMenuCache(
+                maxsize=4096, ttl=3600, max_distance=max_distance, min_photos=min_photos, near_per_check=near_per_check
+            )
+            for _ in range(args.workers)
+        ]
+        # restaurant_id -> dish keys stored so far (restaurant_menus.menu_keys)
+        stored = {}
+        calls = wrong = 0
+        for restaurant_id, _, photo, worker in diners:
+            cache = menu_pipeline.menu_cache = caches[worker]
+            misses = cache.misses
+            served = menu_pipeline.cached_extract_menu_data(
+                photo, restaurant_id, stored_dishes=lambda: stored.get(restaurant_id, frozenset())
+            )
+            calls += cache.misses > misses
+            wrong += served is not photo.structured_data and served != photo.structured_data
+            stored[restaurant_id] = stored.get(restaurant_id, frozenset()) | menu_pipeline._dish_names(served["menu"])
+        hits = sum(cache.hits for cache in caches)
+        near_hits = sum(cache.near_hits for cache in caches)
+        print(f"{max_distance:>12}{calls:>13}{hits - near_hits:>12}{near_hits:>11}{wrong:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# Latency of /general/nearby-restaurants against the local Places stub,
+# comparing the previous code path (a fresh requests.post per call), the pooled
+# session without cache, and the pooled session with the tile cache.
+#
+#   python benchmarks/places_benchmark.py --requests 2000 --hotspots 25
+#
+# Requests come from users scattered within --spread-m metres of a few
+# hotspots (campus buildings, a food court...), which is where the tile cache
+# pays off.
+import argparse
+import math
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def jitter(latitude, longitude, spread_m):
+    distance = random.uniform(0, spread_m)
+    bearing = random.uniform(0, 2 * math.pi)
+    dlat = distance * math.cos(bearing) / 111_320
+    dlon = distance * math.sin(bearing) / (111_320 * math.cos(math.radians(latitude)))
+    return latitude + dlat, longitude + dlon
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the nearby-restaurants cache")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--hotspots", type=int, default=25)
+    parser.add_argument("--spread-m", type=float, default=60)
+    parser.add_argument("--latency-ms", type=int, default=120)
+    args = parser.parse_args()
+
+    from places_stub import start_stub
+
+    server, url = start_stub(latency_ms=args.latency_ms)
+    os.environ["PLACES_API_URL"] = url
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    os.environ["RESCORE_INTERVAL_SECONDS"] = "0"
+
+    import requests
+    from app import create_app
+    from app.services import places
+    from config.config import Config
+
+    Config.PLACES_API_URL = url
+    app = create_app()
+
+    random.seed(7)
+    center = (30.6187, -96.3365)
+    hotspots = [jitter(*center, 3000) for _ in range(args.hotspots)]
+    points = [jitter(*random.choice(hotspots), args.spread_m) for _ in range(args.requests)]
+
+    def previous_post(*a, **kw):
+        kw.pop("timeout", None)
+        return requests.post(*a, **kw)
+
+    pooled_post = places.places_session.post
+    modes = (
+        ("requests.post (previous)", previous_post, 0),
+        ("pooled session", pooled_post, 0),
+        ("pooled + tile cache", pooled_post, Config.PLACES_CACHE_TTL),
+    )
+
+    for mode, post, ttl in modes:
+        places.places_session.post = post
+        places.places_cache.ttl = ttl
+        places.places_cache.clear()
+        places.places_cache.hits = places.places_cache.misses = places.places_cache.neighbour_hits = 0
+        served_before = server.RequestHandlerClass.requests_served
+
+        queue = list(points)
+        lock = threading.Lock()
+        latencies = []
+
+        def worker():
+            client = app.test_client()
+            while True:
+                with lock:
+                    if not queue:
+                        return
+                    latitude, longitude = queue.pop()
+                started = time.perf_counter()
+                response = client.post(f"/general/nearby-restaurants/{longitude}/{latitude}")
+                latencies.append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200, response.get_data(as_text=True)
+
+        threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        upstream = server.RequestHandlerClass.requests_served - served_before
+        print(
+            f"{mode:>25}: {len(latencies)} requests in {elapsed:.2f}s, "
+            f"p50 {statistics.median(latencies):.1f} ms, p99 {percentile(latencies, 0.99):.1f} ms, "
+            f"upstream calls {upstream}, cache {places.places_cache.stats()['hit_ratio']:.2%} hits "
+            f"({places.places_cache.neighbour_hits} from neighbouring tiles)"
+        )
+
+    places.places_session.post = pooled_post
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
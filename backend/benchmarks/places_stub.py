@@ -0,0 +1,100 @@
+# Local stand-in for the Google Places searchNearby endpoint, for trying the
+# nearby-restaurants route without an API key:
+#
+#   python benchmarks/places_stub.py --port 8099 --latency-ms 120
+#   PLACES_API_URL=http://127.0.0.1:8099/v1/places:searchNearby python run.py
+#
+# Every search returns 20 made-up restaurants around the requested point,
+# after an artificial delay standing in for the real API's latency.
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_places(latitude, longitude, count=20):
+    now = datetime.now(timezone.utc)
+    places = []
+    for i in range(count):
+        opens = now + timedelta(hours=random.randint(10, 20))
+        closes = now + timedelta(hours=random.randint(2, 9))
+        places.append({
+            "id": f"stub-{latitude:.4f}-{longitude:.4f}-{i}",
+            "displayName": {"text": f"Stub Restaurant {i}", "languageCode": "en"},
+            "formattedAddress": f"{i} Stub St",
+            "priceLevel": "PRICE_LEVEL_MODERATE",
+            "rating": round(random.uniform(3, 5), 1),
+            "currentOpeningHours": {
+                "openNow": True,
+                "nextOpenTime": opens.isoformat().replace("+00:00", "Z"),
+                "nextCloseTime": closes.isoformat().replace("+00:00", "Z"),
+            },
+        })
+    return {"places": places}
+
+
+def make_handler(latency_ms):
+    class PlacesHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        requests_served = 0
+        lock = threading.Lock()
+
+        def setup(self):
+            super().setup()
+            # headers and body go out in separate writes; without this Nagle's
+            # algorithm stalls every keep-alive response by a delayed ACK
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            center = request["locationRestriction"]["circle"]["center"]
+            time.sleep((latency_ms() if callable(latency_ms) else latency_ms) / 1000)
+
+            body = json.dumps(fake_places(center["latitude"], center["longitude"])).encode("utf-8")
+            with PlacesHandler.lock:
+                PlacesHandler.requests_served += 1
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return PlacesHandler
+
+
+# start the stub on a background thread; returns (server, url). latency_ms is
+# a number or a callable that draws one per request
+def start_stub(port=0, latency_ms=120):
+    # a deep accept backlog so bursts of new connections are not refused
+    ThreadingHTTPServer.request_queue_size = 256
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(latency_ms))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="places-stub", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/places:searchNearby"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in Google Places searchNearby server")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=int, default=120)
+    args = parser.parse_args()
+
+    server, url = start_stub(args.port, args.latency_ms)
+    print(f"Places stub listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# Cold-start cost of the backend: an import-time breakdown of create_app()
+# (python -X importtime) and the time from launching the server until the
+# first /user/login answers.
+#
+#   python benchmarks/startup_benchmark.py --runs 5
+#   python benchmarks/startup_benchmark.py --server gunicorn --warm-up eager
+#   python benchmarks/startup_benchmark.py --max-first-response-ms 2500  # CI guard
+#
+# Exits non-zero when a lazily imported SDK (Gemini, duckduckgo_search,
+# Pillow) is loaded by create_app() again, or when the median time to first
+# response exceeds --max-first-response-ms.
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+# imported on first use (or by WARM_UP), never by create_app() itself
+LAZY_MODULES = ("google.generativeai", "duckduckgo_search", "PIL")
+
+EMAIL = "startup@example.com"
+PASSWORD = "startup-benchmark"
+
+CREATE_APP = f"""
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+create_app()
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def seed(rounds):
+    import bcrypt
+    from app import create_app
+    from app.database import db
+    from app.models import User
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        hashed = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+        db.session.add(User(first_name="Startup", last_name="Bench", email=EMAIL, hashed_password=hashed))
+        db.session.commit()
+        db.session.remove()
+        db.engine.dispose()
+
+
+# import time (ms) spent in each top-level package during create_app(), summing
+# the self time of all its modules wherever in the import tree they were loaded
+def import_breakdown(env):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CREATE_APP],
+        cwd=BACKEND,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    totals = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        if not own.strip().isdigit():
+            continue
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + int(own) / 1000
+    return json.loads(result.stdout.strip().splitlines()[-1]), totals
+
+
+def first_response(command, env):
+    port = free_port()
+    body = json.dumps({"email": EMAIL, "password": PASSWORD}).encode("utf-8")
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        command,
+        cwd=BACKEND,
+        env=dict(env, PORT=str(port)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = started + 60
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"server exited with code {process.returncode}")
+            request = urllib.request.Request(
+                f"http://127.0.0.1:{port}/user/login",
+                data=body,
+                headers={"Content-Type": "application/json"},
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=10) as response:
+                    if response.status != 200:
+                        raise RuntimeError(f"login answered {response.status}")
+                    return (time.perf_counter() - started) * 1000
+            except (ConnectionError, urllib.error.URLError):
+                time.sleep(0.01)
+        raise RuntimeError("server did not answer")
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure backend cold-start time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--server", choices=("dev", "gunicorn"), default="dev")
+    parser.add_argument("--warm-up", choices=("off", "background", "eager"), default="off")
+    parser.add_argument("--top", type=int, default=12, help="packages to list in the import breakdown")
+    parser.add_argument("--bcrypt-rounds", type=int, default=10)
+    parser.add_argument("--max-first-response-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    scratch = tempfile.NamedTemporaryFile(suffix=".sqlite3", delete=False)
+    database_url = f"sqlite:///{scratch.name}"
+    env = dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        RESCORE_INTERVAL_SECONDS="0",
+        PASSWORD_VERIFIER="local",
+        WARM_UP=args.warm_up,
+        PYTHONPATH=BACKEND,
+    )
+    os.environ.update(DATABASE_URL=database_url, RESCORE_INTERVAL_SECONDS="0")
+
+    if args.server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--workers", "1", "run:app"]
+    else:
+        command = [sys.executable, "run.py"]
+
+    failed = False
+    try:
+        seed(args.bcrypt_rounds)
+
+        create_app_seconds = []
+        for _ in range(args.runs):
+            measured, totals = import_breakdown(env)
+            create_app_seconds.append(measured["seconds"])
+        print(f"create_app(): median {statistics.median(create_app_seconds) * 1000:.0f} ms over {args.runs} runs")
+        print(f"import breakdown of the last run (ms, top {args.top} packages):")
+        for package, ms in sorted(totals.items(), key=lambda item: -item[1])[: args.top]:
+            print(f"  {package:<28} {ms:8.1f}")
+        if measured["loaded"] and args.warm_up == "off":
+            print(f"REGRESSION: create_app() imports {', '.join(measured['loaded'])}")
+            failed = True
+
+        timings = [first_response(command, env) for _ in range(args.runs)]
+        median = statistics.median(timings)
+        print(
+            f"first /user/login response ({args.server}, WARM_UP={args.warm_up}): "
+            f"median {median:.0f} ms, min {min(timings):.0f} ms, max {max(timings):.0f} ms"
+        )
+        if args.max_first_response_ms is not None and median > args.max_first_response_ms:
+            print(f"REGRESSION: above the {args.max_first_response_ms:.0f} ms budget")
+            failed = True
+    finally:
+        os.unlink(scratch.name)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,4 +5,133 @@ load_dotenv()
 
 class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL")
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # menu extraction cache (keyed on a perceptual hash of the photo). A photo
+    # sent with a restaurant_id can reuse the extraction of another photo of
+    # that restaurant within MENU_CACHE_MAX_DISTANCE of 256 bits once
+    # MENU_CACHE_MIN_PHOTOS extractions agree with each other and with the
+    # stored menu; after MENU_CACHE_NEAR_PER_CHECK such hits the next photo is
+    # extracted again (see menu_cache.py)
+    MENU_CACHE_SIZE = int(os.getenv("MENU_CACHE_SIZE", 256))
+    MENU_CACHE_TTL = int(os.getenv("MENU_CACHE_TTL", 6 * 60 * 60))
+    MENU_CACHE_MAX_DISTANCE = int(os.getenv("MENU_CACHE_MAX_DISTANCE", 48))
+    MENU_CACHE_MIN_PHOTOS = int(os.getenv("MENU_CACHE_MIN_PHOTOS", 4))
+    MENU_CACHE_NEAR_PER_CHECK = int(os.getenv("MENU_CACHE_NEAR_PER_CHECK", 1))
+
+    # background menu extraction jobs
+    MENU_JOB_WORKERS = int(os.getenv("MENU_JOB_WORKERS", 4))
+    MENU_JOB_QUEUE_DEPTH = int(os.getenv("MENU_JOB_QUEUE_DEPTH", 16))
+    MENU_JOB_RESULT_TTL = int(os.getenv("MENU_JOB_RESULT_TTL", 15 * 60))
+    # a queued/running job whose heartbeat is 3 intervals old is reported lost
+    MENU_JOB_HEARTBEAT_INTERVAL = int(os.getenv("MENU_JOB_HEARTBEAT_INTERVAL", 10))
+
+    # recommendations cached per (menu digest, profile fingerprint)
+    MENU_STORE_SIZE = int(os.getenv("MENU_STORE_SIZE", 512))
+    RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", 2048))
+    RECOMMENDATION_CACHE_TTL = int(os.getenv("RECOMMENDATION_CACHE_TTL", 6 * 60 * 60))
+    RECOMMENDATION_AGE_BUCKET = int(os.getenv("RECOMMENDATION_AGE_BUCKET", 10))
+
+    # scanned menus persisted per restaurant; a stored menu updated less than
+    # RESTAURANT_MENU_MAX_AGE seconds ago is reported as fresh
+    RESTAURANT_MENU_MAX_AGE = int(os.getenv("RESTAURANT_MENU_MAX_AGE", 7 * 24 * 3600))
+
+    # upload limits and image preprocessing before the model call
+    MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", 64 * 1024 * 1024))
+    UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 20 * 1024 * 1024))
+    IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", 1600))
+    IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", 400 * 1024))
+    IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", 85))
+    IMAGE_GRAYSCALE = os.getenv("IMAGE_GRAYSCALE", "0") == "1"
+
+    # multi-page menu extraction
+    MENU_BATCH_WORKERS = int(os.getenv("MENU_BATCH_WORKERS", 4))
+    MENU_BATCH_MAX_PAGES = int(os.getenv("MENU_BATCH_MAX_PAGES", 10))
+
+    # bulk model rescoring (time decay of model_rating); 0 disables the scheduler
+    RESCORE_INTERVAL_SECONDS = int(os.getenv("RESCORE_INTERVAL_SECONDS", 60 * 60))
+    RESCORE_CHUNK_SIZE = int(os.getenv("RESCORE_CHUNK_SIZE", 5000))
+
+    # write-behind vote buffering (off by default)
+    VOTE_WRITE_BEHIND = os.getenv("VOTE_WRITE_BEHIND", "0") == "1"
+    VOTE_FLUSH_INTERVAL_MS = int(os.getenv("VOTE_FLUSH_INTERVAL_MS", 250))
+    VOTE_FLUSH_MAX_ENTRIES = int(os.getenv("VOTE_FLUSH_MAX_ENTRIES", 500))
+
+    # most model ids accepted by one bulk vote-state lookup
+    VOTE_STATE_MAX_IDS = int(os.getenv("VOTE_STATE_MAX_IDS", 500))
+
+    # dish image lookups (persistent cache in a local SQLite file)
+    DISH_IMAGE_CACHE_PATH = os.getenv("DISH_IMAGE_CACHE_PATH", "instance/dish_images.sqlite3")
+    DISH_IMAGE_CACHE_TTL = int(os.getenv("DISH_IMAGE_CACHE_TTL", 30 * 24 * 3600))
+    DISH_IMAGE_NEGATIVE_TTL = int(os.getenv("DISH_IMAGE_NEGATIVE_TTL", 24 * 3600))
+    DISH_IMAGE_SEARCH_TIMEOUT = int(os.getenv("DISH_IMAGE_SEARCH_TIMEOUT", 10))
+    DISH_IMAGE_WORKERS = int(os.getenv("DISH_IMAGE_WORKERS", 8))
+    # searches one request may have running on the shared pool at a time
+    DISH_IMAGE_REQUEST_WORKERS = int(os.getenv("DISH_IMAGE_REQUEST_WORKERS", 3))
+    DISH_IMAGE_LOOKUP_TIMEOUT = float(os.getenv("DISH_IMAGE_LOOKUP_TIMEOUT", 5))
+    DISH_IMAGE_BATCH_MAX = int(os.getenv("DISH_IMAGE_BATCH_MAX", 200))
+
+    # matching extracted dish names to dishes with AR models: per-restaurant
+    # trigram indexes are rebuilt after DISH_INDEX_TTL seconds and at most
+    # DISH_INDEX_SIZE restaurants are kept, candidates below
+    # DISH_MATCH_MIN_SIMILARITY (shared / all trigrams) are ignored
+    DISH_INDEX_TTL = int(os.getenv("DISH_INDEX_TTL", 300))
+    DISH_INDEX_SIZE = int(os.getenv("DISH_INDEX_SIZE", 512))
+    DISH_MATCH_MIN_SIMILARITY = float(os.getenv("DISH_MATCH_MIN_SIMILARITY", 0.4))
+    DISH_MATCH_MAX_ITEMS = int(os.getenv("DISH_MATCH_MAX_ITEMS", 500))
+
+    # nearby restaurants (Google Places) and its tile cache
+    PLACES_API_URL = os.getenv("PLACES_API_URL", "https://places.googleapis.com/v1/places:searchNearby")
+    PLACES_POOL_SIZE = int(os.getenv("PLACES_POOL_SIZE", 10))
+    PLACES_CONNECT_TIMEOUT = float(os.getenv("PLACES_CONNECT_TIMEOUT", 3.05))
+    PLACES_READ_TIMEOUT = float(os.getenv("PLACES_READ_TIMEOUT", 10))
+    PLACES_CACHE_SIZE = int(os.getenv("PLACES_CACHE_SIZE", 4096))
+    PLACES_CACHE_TTL = int(os.getenv("PLACES_CACHE_TTL", 900))
+    PLACES_CACHE_PRECISION = int(os.getenv("PLACES_CACHE_PRECISION", 7))
+    PLACES_CACHE_MAX_DISTANCE_M = int(os.getenv("PLACES_CACHE_MAX_DISTANCE_M", 75))
+
+    # login password checks: "local" verifies bcrypt hashes in-process,
+    # "remote" always calls the crypto API at HASH_API_KEY
+    PASSWORD_VERIFIER = os.getenv("PASSWORD_VERIFIER", "local")
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 2))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", 10))
+    HASH_API_POOL_SIZE = int(os.getenv("HASH_API_POOL_SIZE", 10))
+    HASH_API_CONNECT_TIMEOUT = float(os.getenv("HASH_API_CONNECT_TIMEOUT", 3.05))
+    HASH_API_READ_TIMEOUT = float(os.getenv("HASH_API_READ_TIMEOUT", 10))
+
+    # LLM calls per stage (extract, recommend): model and optional fallback
+    # as "provider:model", overall deadline in seconds, retries on transient
+    # errors, and hedging (a second attempt once a call outlives the model's
+    # recent p90 latency, or HEDGE_DELAY until enough calls have been seen)
+    LLM_EXTRACT_MODEL = os.getenv("LLM_EXTRACT_MODEL", "gemini:gemini-1.5-flash-8b")
+    LLM_EXTRACT_FALLBACK = os.getenv("LLM_EXTRACT_FALLBACK", "")
+    LLM_EXTRACT_DEADLINE = float(os.getenv("LLM_EXTRACT_DEADLINE", 45))
+    LLM_EXTRACT_RETRIES = int(os.getenv("LLM_EXTRACT_RETRIES", 2))
+    LLM_EXTRACT_HEDGE = os.getenv("LLM_EXTRACT_HEDGE", "1") == "1"
+    LLM_EXTRACT_HEDGE_DELAY = float(os.getenv("LLM_EXTRACT_HEDGE_DELAY", 10))
+    LLM_RECOMMEND_MODEL = os.getenv("LLM_RECOMMEND_MODEL", "gemini:gemini-1.5-flash-8b")
+    LLM_RECOMMEND_FALLBACK = os.getenv("LLM_RECOMMEND_FALLBACK", "")
+    LLM_RECOMMEND_DEADLINE = float(os.getenv("LLM_RECOMMEND_DEADLINE", 20))
+    LLM_RECOMMEND_RETRIES = int(os.getenv("LLM_RECOMMEND_RETRIES", 2))
+    LLM_RECOMMEND_HEDGE = os.getenv("LLM_RECOMMEND_HEDGE", "1") == "1"
+    LLM_RECOMMEND_HEDGE_DELAY = float(os.getenv("LLM_RECOMMEND_HEDGE_DELAY", 5))
+    LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", 0.9))
+    LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))
+    # the fallback model starts once this fraction of the deadline has passed
+    LLM_FALLBACK_AT = float(os.getenv("LLM_FALLBACK_AT", 0.6))
+    LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", 0.5))
+    LLM_WORKERS = int(os.getenv("LLM_WORKERS", 32))
+
+    # heavy SDKs (Gemini, Pillow, duckduckgo_search) are imported on
+    # first use; "eager" or "background" loads them at startup instead
+    WARM_UP = os.getenv("WARM_UP", "off")
+
+    # request/stage/SQL histograms; requests slower than SLOW_REQUEST_MS are
+    # logged with their stage breakdown (0 disables). /metrics is only served
+    # when METRICS_TOKEN is set, to scrapers sending it as a bearer token
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+    SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 0))
+
+    # gunicorn.conf.py turns this off and starts the threads in each worker
+    START_BACKGROUND_THREADS = os.getenv("START_BACKGROUND_THREADS", "1") == "1"
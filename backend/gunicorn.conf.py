@@ -0,0 +1,63 @@
+# Production server settings: gunicorn -c gunicorn.conf.py run:app
+import os
+
+# background threads (rescoring, vote flushing) do not survive fork, so the
+# preloaded app in the master must not start them; post_fork does per worker
+os.environ["START_BACKGROUND_THREADS"] = "0"
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+
+# processes x threads; most request time is spent waiting on Gemini, Places
+# and the database, so threads are cheap concurrency within each process.
+# Workers share nothing but the database: menu jobs are kept in menu_jobs,
+# buffered votes are written with a last-vote-wins guard, and rescoring runs
+# under an advisory lock. The in-memory caches (menus by digest, menu
+# extractions, recommendations, dish trigram indexes), metrics and the
+# rescore, vote buffer and job stats endpoints are per worker.
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+
+# import the app (SQLAlchemy, pydantic models) once in the master and share it
+# copy-on-write with the workers; the Gemini SDK and other heavy clients are
+# loaded lazily per worker, or at fork time with WARM_UP=eager/background.
+# With preload a HUP only restarts the workers on the code the master already
+# imported: deploy new code with a full restart, or with a USR2 (start a new
+# master) followed by QUIT to the old one. GUNICORN_PRELOAD=0 makes HUP reload
+# the code at the cost of importing the app in every worker.
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+# menu extraction plus recommendations can take well over the default 30s
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+# let in-flight OCR requests finish on worker restarts/shutdown (kill -HUP / TERM)
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 60))
+# keep client connections open between requests; must stay below the idle
+# timeout of the load balancer in front
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+# recycle workers now and then so slow leaks cannot grow without bound
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 200))
+
+accesslog = "-"
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    from app import start_background_threads
+    from app.database import db
+    from run import app
+
+    with app.app_context():
+        # connections opened by the master must not be shared with the workers
+        db.engine.dispose(close=False)
+    start_background_threads(app)
+
+
+# a worker recycled by max_requests (or stopped by HUP/TERM) finishes its
+# background menu jobs before exiting, within the graceful timeout
+def worker_exit(server, worker):
+    from app.services.jobs import menu_jobs
+
+    if not menu_jobs.drain(graceful_timeout):
+        server.log.warning("worker %s exited with menu jobs still running", worker.pid)
@@ -0,0 +1,63 @@
+"""persist scanned menus
+
+Revision ID: 4c1e7a9d2b63
+Revises: 9212bf77a94d
+Create Date: 2026-10-18 14:02:41.518230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c1e7a9d2b63'
+down_revision = '9212bf77a94d'
+branch_labels = None
+depends_on = None
+
+
+# Menu metadata on restaurants and dish_items (all nullable, so adding them
+# does not rewrite the tables) plus the partial unique index the menu upsert
+# uses as its conflict target, built concurrently like the ranking indexes.
+def upgrade():
+    with op.batch_alter_table("restaurants") as batch_op:
+        batch_op.add_column(sa.Column("menu_version", sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column("menu_digest", sa.String(), nullable=True))
+        batch_op.add_column(sa.Column("menu_updated_at", sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table("dish_items") as batch_op:
+        batch_op.add_column(sa.Column("menu_key", sa.String(), nullable=True))
+        batch_op.add_column(sa.Column("menu_category", sa.String(), nullable=True))
+        batch_op.add_column(sa.Column("menu_position", sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column("menu_version", sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column("menu_item", sa.JSON(), nullable=True))
+
+    concurrently = op.get_bind().dialect.name == "postgresql"
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "uq_dish_items_restaurant_menu_key",
+            "dish_items",
+            ["restaurant_id", "menu_key"],
+            unique=True,
+            if_not_exists=True,
+            postgresql_concurrently=concurrently,
+            postgresql_where=sa.text("menu_key IS NOT NULL"),
+            sqlite_where=sa.text("menu_key IS NOT NULL"),
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index("uq_dish_items_restaurant_menu_key", table_name="dish_items", if_exists=True)
+
+    with op.batch_alter_table("dish_items") as batch_op:
+        batch_op.drop_column("menu_item")
+        batch_op.drop_column("menu_version")
+        batch_op.drop_column("menu_position")
+        batch_op.drop_column("menu_category")
+        batch_op.drop_column("menu_key")
+
+    with op.batch_alter_table("restaurants") as batch_op:
+        batch_op.drop_column("menu_updated_at")
+        batch_op.drop_column("menu_digest")
+        batch_op.drop_column("menu_version")
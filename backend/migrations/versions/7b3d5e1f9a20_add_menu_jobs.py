@@ -0,0 +1,39 @@
+"""add menu jobs
+
+Revision ID: 7b3d5e1f9a20
+Revises: 4c1e7a9d2b63
+Create Date: 2026-10-18 16:21:09.730412
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b3d5e1f9a20'
+down_revision = '4c1e7a9d2b63'
+branch_labels = None
+depends_on = None
+
+
+# Background menu job state, shared by every gunicorn worker.
+def upgrade():
+    op.create_table(
+        "menu_jobs",
+        sa.Column("job_id", sa.String(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("partial", sa.JSON(), nullable=True),
+        sa.Column("result", sa.JSON(), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("status_code", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("heartbeat_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("job_id"),
+    )
+    op.create_index("ix_menu_jobs_heartbeat_at", "menu_jobs", ["heartbeat_at"])
+
+
+def downgrade():
+    op.drop_index("ix_menu_jobs_heartbeat_at", table_name="menu_jobs")
+    op.drop_table("menu_jobs")
@@ -0,0 +1,44 @@
+"""add model ranking indexes
+
+Revision ID: 9212bf77a94d
+Revises: 
+Create Date: 2026-10-18 03:26:17.732016
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9212bf77a94d'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# The tables themselves predate migrations; this first revision only adds the
+# indexes the ranked model listing relies on. Indexes are built concurrently
+# so the upgrade does not lock dish_items/ar_models writes.
+def upgrade():
+    concurrently = op.get_bind().dialect.name == "postgresql"
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_dish_items_restaurant_id_dish_id",
+            "dish_items",
+            ["restaurant_id", "dish_id"],
+            if_not_exists=True,
+            postgresql_concurrently=concurrently,
+        )
+        op.create_index(
+            "ix_ar_models_dish_id_rating",
+            "ar_models",
+            ["dish_id", "model_rating", "model_id"],
+            if_not_exists=True,
+            postgresql_concurrently=concurrently,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_ar_models_dish_id_rating", table_name="ar_models", if_exists=True)
+        op.drop_index("ix_dish_items_restaurant_id_dish_id", table_name="dish_items", if_exists=True)